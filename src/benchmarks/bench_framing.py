@@ -0,0 +1,172 @@
+"""
+Peer messages parsed per second: the previous reader (recv(4) then recv of
+the payload for every message, fresh bytes) against FrameReader (one
+reusable buffer filled with recv_into, frames as memoryviews). Both decode
+with the same if/elif on the message id.
+
+A thread writes a stream of small messages (Have, Request, Cancel, Choke,
+Unchoke, keep-alives, and a BitField now and then) into a local socket
+pair in large chunks, the main thread parses and decodes them. The same
+stream is also parsed from memory, as the seeder does with the bytes it
+already received, to show the decoding cost alone.
+
+Run from src/:
+    python -m benchmarks.bench_framing --messages 500000
+"""
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+from client.messages import BitField, Cancel, Choke, Have, KeepAlive, Request, Unchoke
+from common.framing import HEADER, FrameReader
+
+
+def make_stream(count):
+    bitfield = BitField(bytes(random.getrandbits(8) for _ in range(128))).to_bytes()
+    messages = []
+    for i in range(count):
+        kind = random.random()
+        if kind < 0.4:
+            messages.append(Have(i % 5000).to_bytes())
+        elif kind < 0.75:
+            messages.append(Request(i % 5000, 16384 * (i % 16), 16384).to_bytes())
+        elif kind < 0.85:
+            messages.append(Cancel(i % 5000, 0, 16384).to_bytes())
+        elif kind < 0.9:
+            messages.append(Choke().to_bytes())
+        elif kind < 0.95:
+            messages.append(Unchoke().to_bytes())
+        elif kind < 0.99:
+            messages.append(KeepAlive().to_bytes())
+        else:
+            messages.append(bitfield)
+    return b"".join(messages)
+
+
+def write(sock, stream):
+    view = memoryview(stream)
+    for offset in range(0, len(view), 1 << 20):
+        sock.sendall(view[offset:offset + (1 << 20)])
+    sock.shutdown(socket.SHUT_WR)
+
+
+def handle(counts, message=None):
+    counts[0] += 1
+
+
+def decode(message, counts):
+    message_id = message[4]
+    if message_id == 4:
+        handle(counts, Have.from_bytes(message))
+    elif message_id == 5:
+        handle(counts, BitField.from_bytes(message))
+    elif message_id == 6:
+        handle(counts, Request.from_bytes(message))
+    elif message_id == 8:
+        handle(counts, Cancel.from_bytes(message))
+    else:
+        handle(counts)
+
+
+def legacy(sock, counts):
+    while True:
+        header = sock.recv(4)
+        if not header:
+            return
+        while len(header) < 4:
+            header += sock.recv(4 - len(header))
+        length = struct.unpack(">I", header)[0]
+        if length == 0:
+            handle(counts)
+            continue
+        payload = b""
+        while len(payload) < length:
+            payload += sock.recv(length - len(payload))
+        decode(header + payload, counts)
+
+
+def framed(sock, counts):
+    reader = FrameReader(sock)
+    while True:
+        frame = reader.read_frame()
+        if frame is None:
+            return
+        if len(frame) == HEADER.size:
+            handle(counts)
+        else:
+            decode(frame, counts)
+
+
+def measure_socket(func, stream, count):
+    sender, receiver = socket.socketpair()
+    writer = threading.Thread(target=write, args=(sender, stream))
+    counts = [0]
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    writer.start()
+    func(receiver, counts)
+    cpu = time.thread_time() - cpu_start
+    elapsed = time.perf_counter() - start
+    writer.join()
+    sender.close()
+    receiver.close()
+    assert counts[0] == count, (counts[0], count)
+    return elapsed, cpu
+
+
+def parse_copies(buffer, counts):
+    pos = 0
+    while pos < len(buffer):
+        length = struct.unpack_from(">I", buffer, pos)[0]
+        if length == 0:
+            handle(counts)
+        else:
+            decode(bytes(buffer[pos:pos + 4 + length]), counts)
+        pos += 4 + length
+
+
+def parse_views(buffer, counts):
+    pos = 0
+    with memoryview(buffer) as view:
+        while pos < len(buffer):
+            end = pos + HEADER.size + struct.unpack_from(">I", buffer, pos)[0]
+            if end == pos + HEADER.size:
+                handle(counts)
+            else:
+                decode(view[pos:end], counts)
+            pos = end
+
+
+def measure_memory(func, stream, count):
+    buffer = bytearray(stream)
+    counts = [0]
+    start = time.perf_counter()
+    func(buffer, counts)
+    elapsed = time.perf_counter() - start
+    assert counts[0] == count, (counts[0], count)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500000)
+    args = parser.parse_args()
+
+    stream = make_stream(args.messages)
+    print(f"{args.messages} messages, {len(stream) / 2**20:.1f} MiB")
+
+    print(f"{'socket':>14} {'msgs/s':>11} {'msgs/cpu s':>11}")
+    for name, func in (("recv", legacy), ("FrameReader", framed)):
+        elapsed, cpu = measure_socket(func, stream, args.messages)
+        print(f"{name:>14} {args.messages / elapsed:>11,.0f} {args.messages / cpu:>11,.0f}")
+
+    print(f"{'memory':>14} {'msgs/s':>11}")
+    for name, func in (("bytes copies", parse_copies), ("memoryviews", parse_views)):
+        elapsed = measure_memory(func, stream, args.messages)
+        print(f"{name:>14} {args.messages / elapsed:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
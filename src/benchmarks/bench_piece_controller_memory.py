@@ -0,0 +1,96 @@
+"""
+Memory and build time of the PieceController on a large synthetic torrent,
+against the previous object-per-block representation (one Piece with a list
+of Block objects per piece, hex digests and a list of bools as bitfield).
+
+Run from src/:
+    python -m benchmarks.bench_piece_controller_memory --size-gb 20 --piece-kb 256
+"""
+import argparse
+import enum
+import math
+import os
+import time
+import tracemalloc
+
+from client.peer.block import BLOCK_SIZE
+from client.peer.piecesController import PieceController
+from torrents.torrent_info import TorrentInfo
+
+
+class LegacyState(enum.Enum):
+    EMPTY = 0
+    DOWNLOADING = 1
+    DOWNLOADED = 2
+
+
+class LegacyBlock:
+    def __init__(self, block_size):
+        self.state = LegacyState.EMPTY
+        self.data = None
+        self.block_size = block_size
+        self.requests = {}
+        self.receiver = None
+        self.downloads = 0
+
+
+class LegacyPiece:
+    def __init__(self, piece_index, piece_size, piece_hash):
+        self.piece_index = piece_index
+        self.piece_size = piece_size
+        self.piece_hash = piece_hash
+        self.is_downloaded = False
+        num_blocks = int(math.ceil(piece_size / BLOCK_SIZE))
+        self.blocks = [LegacyBlock(min(BLOCK_SIZE, piece_size - i * BLOCK_SIZE)) for i in range(num_blocks)]
+
+
+def build_legacy(torrent: TorrentInfo):
+    number_of_pieces = int(math.ceil(torrent.length / torrent.piece_length))
+    pieces = []
+    for i in range(number_of_pieces):
+        size = min(torrent.piece_length, torrent.length - i * torrent.piece_length)
+        pieces.append(LegacyPiece(i, size, torrent.pieces[40 * i:40 * (i + 1)]))
+    bitfield = [False] * number_of_pieces
+    availability = [0] * number_of_pieces
+    bucket_pos = {i: i for i in range(number_of_pieces)}
+    return pieces, bitfield, availability, bucket_pos
+
+
+def measure(name, build):
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    del result
+
+    # Measured apart, tracing slows allocations down
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    print(f"{name:<12} {elapsed * 1000:10.1f} ms {current / 2**20:10.1f} MiB {peak / 2**20:10.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=20)
+    parser.add_argument("--piece-kb", type=int, default=256)
+    parser.add_argument("--skip-legacy", action="store_true", help="only measure the current controller")
+    args = parser.parse_args()
+
+    length = int(args.size_gb * 2**30)
+    piece_length = args.piece_kb * 1024
+    number_of_pieces = int(math.ceil(length / piece_length))
+    torrent = TorrentInfo(announce="", info_hash="00" * 20, name="synthetic.bin", piece_length=piece_length,
+                          length=length, pieces=os.urandom(20 * number_of_pieces).hex())
+
+    blocks = number_of_pieces * int(math.ceil(piece_length / BLOCK_SIZE))
+    print(f"{args.size_gb} GiB, {args.piece_kb} KiB pieces: {number_of_pieces} pieces, {blocks} blocks")
+    measure("controller", lambda: PieceController(torrent, "/dev/null"))
+    if not args.skip_legacy:
+        measure("legacy", lambda: build_legacy(torrent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Effect of the automatic piece length of TorrentCreator against the previous
+fixed 256 KiB pieces.
+
+For every file size it reports the number of pieces (how many peers can work
+on distinct pieces at once), the size of the register_torrent message sent
+to the tracker, and the time and memory needed to build the PieceController
+of a download.
+
+Run from src/:
+    python -m benchmarks.bench_piece_length --sizes-mb 1 16 256 4096 20480
+"""
+import argparse
+import json
+import math
+import os
+import time
+import tracemalloc
+
+from client.peer.piecesController import PieceController
+from torrents.torrent_creator import TorrentCreator
+from torrents.torrent_info import TorrentInfo
+
+FIXED_PIECE_LENGTH = 256 * 1024
+
+
+def tracker_payload(size, piece_length) -> int:
+    number_of_pieces = math.ceil(size / piece_length)
+    request = {
+        "type": "register_torrent",
+        "torrent_metadata": {
+            "info_hash": "00" * 20,
+            "name": "file.bin",
+            "size": size,
+            "piece_size": piece_length,
+            "pieces": os.urandom(20 * number_of_pieces).hex(),
+        },
+        "peer_info": {"peer_id": 1, "ip": "10.0.0.1", "port": 6881},
+    }
+    return len(json.dumps(request).encode())
+
+
+def build_controller(size, piece_length):
+    number_of_pieces = math.ceil(size / piece_length)
+    torrent = TorrentInfo(announce="", info_hash="00" * 20, name="file.bin", piece_length=piece_length,
+                          length=size, pieces=os.urandom(20 * number_of_pieces).hex())
+
+    start = time.perf_counter()
+    PieceController(torrent, "/dev/null")
+    elapsed = time.perf_counter() - start
+
+    # Measured apart, tracing slows allocations down
+    tracemalloc.start()
+    PieceController(torrent, "/dev/null")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 16, 256, 4096, 20480])
+    parser.add_argument("--target-pieces", type=int, default=TorrentCreator.TARGET_PIECES)
+    parser.add_argument("--max-controller-mb", type=int, default=8192,
+                        help="skip building controllers for bigger files (memory)")
+    args = parser.parse_args()
+
+    print(f"{'size MiB':>9} {'policy':>8} {'piece KiB':>10} {'pieces':>8} {'tracker KiB':>12} "
+          f"{'build ms':>9} {'ctrl MiB':>9}")
+    for size_mb in args.sizes_mb:
+        size = size_mb * 1024 * 1024
+        policies = [("fixed", FIXED_PIECE_LENGTH),
+                    ("auto", TorrentCreator.choose_piece_length(size, args.target_pieces))]
+        for policy, piece_length in policies:
+            payload = tracker_payload(size, piece_length)
+            if size_mb <= args.max_controller_mb:
+                elapsed, peak = build_controller(size, piece_length)
+                build = f"{elapsed * 1000:9.1f} {peak / 2**20:9.1f}"
+            else:
+                build = f"{'-':>9} {'-':>9}"
+            print(f"{size_mb:>9} {policy:>8} {piece_length // 1024:>10} {math.ceil(size / piece_length):>8} "
+                  f"{payload / 1024:>12.1f} {build}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Bytes uploaded by the origin seeder until the swarm holds the whole file,
+with normal seeding against super-seeding.
+
+A local swarm: one origin PeerServer and `--leechers` downloads that also
+serve their verified pieces, every leecher connected to the origin and to
+the other leechers. The swarm holds the file once the union of the
+leechers' pieces covers it. Reported: MiB the origin uploaded until then
+and in total, as copies of the file, and the wall time of the swarm.
+
+Run from src/:
+    python -m benchmarks.bench_super_seeding --size-mb 32 --piece-kib 64 --leechers 6
+"""
+import argparse
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from client.file_sender import DescriptorCache
+from client.peer.download_engine import DownloadEngine
+from client.peer.peer import Peer
+from client.peer.piecesController import PieceController
+from client.peer_server import PeerServer
+from client.piece_cache import PieceCache
+from client.seeding_catalog import SeededTorrent
+from torrents.torrent_info import TorrentInfo
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_torrent(path, piece_length):
+    digests = []
+    with open(path, "rb") as f:
+        while piece := f.read(piece_length):
+            digests.append(hashlib.sha1(piece).hexdigest())
+    length = os.path.getsize(path)
+    info_hash = hashlib.sha1(f"{path}:{length}:{piece_length}".encode()).hexdigest()
+    return TorrentInfo(announce="", info_hash=info_hash, name="data", piece_length=piece_length,
+                       length=length, pieces="".join(digests))
+
+
+def serve(torrent, path, bitfield=None, **kwargs):
+    seeded = SeededTorrent(name=torrent.name, info_hash=torrent.info_hash, piece_length=torrent.piece_length,
+                           length=torrent.length, torrent_file_path="", torrent_size=0, torrent_mtime_ns=0,
+                           data_file_path=path, bitfield=bitfield)
+    port = free_port()
+    server = PeerServer("127.0.0.1", port, lambda info_hash: seeded if info_hash == seeded.info_hash else None,
+                        DescriptorCache(), PieceCache(16 * 1024 * 1024), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, port
+
+
+def run_swarm(torrent, data_path, tmp, leechers, super_seed):
+    origin, origin_port = serve(torrent, data_path, super_seed=super_seed)
+
+    swarm = []
+    for i in range(leechers):
+        output_path = os.path.join(tmp, f"leecher_{i}.bin")
+        controller = PieceController(torrent, output_path)
+        server, port = serve(torrent, output_path, bitfield=controller.bitfield)
+        engine = DownloadEngine(controller, output_path,
+                                on_piece=lambda piece_index, server=server: server.broadcast_have(torrent.info_hash, piece_index))
+        swarm.append((controller, engine, server, port))
+
+    for i, (controller, engine, _, _) in enumerate(swarm):
+        ports = [origin_port] + [port for j, (_, _, _, port) in enumerate(swarm) if j != i]
+        for port in ports:
+            peer = Peer(port, "127.0.0.1", port)
+            peer.connect()
+            peer.handshake(bytes.fromhex(torrent.info_hash), controller.number_of_pieces)
+            engine.add_peer(peer)
+            peer.start()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=engine.run) for _, engine, _, _ in swarm]
+    for thread in threads:
+        thread.start()
+
+    # Poll until the leechers hold every piece between them
+    number_of_pieces = swarm[0][0].number_of_pieces
+    held_after = None
+    while held_after is None:
+        held = set()
+        for controller, _, _, _ in swarm:
+            held.update(controller.bitfield.ones())
+        if len(held) == number_of_pieces:
+            held_after = origin.uploaded
+        else:
+            time.sleep(0.01)
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    complete = all(controller.is_complete() for controller, _, _, _ in swarm)
+    for _, engine, server, _ in swarm:
+        for peer in engine.peers:
+            peer.close()
+        server.close()
+    origin.close()
+    return held_after, origin.uploaded, elapsed, complete
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--piece-kib", type=int, default=64)
+    parser.add_argument("--leechers", type=int, default=6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, "data.bin")
+        with open(data_path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        torrent = make_torrent(data_path, args.piece_kib * 1024)
+        size_mib = torrent.length / 2**20
+
+        print(f"{'mode':>6} {'until held':>11} {'copies':>7} {'total':>9} {'copies':>7} {'time s':>7} complete")
+        for name, super_seed in (("normal", False), ("super", True)):
+            held_after, uploaded, elapsed, complete = run_swarm(torrent, data_path, tmp, args.leechers, super_seed)
+            print(f"{name:>6} {held_after / 2**20:>7.1f} MiB {held_after / torrent.length:>7.2f} "
+                  f"{uploaded / 2**20:>5.1f} MiB {uploaded / torrent.length:>7.2f} {elapsed:>7.2f} {complete}")
+            for i in range(args.leechers):
+                for suffix in ("", ".resume"):
+                    try:
+                        os.remove(os.path.join(tmp, f"leecher_{i}.bin{suffix}"))
+                    except OSError:
+                        pass
+        print(f"file: {size_mib:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Throughput of TorrentCreator.encode_pieces against the previous
+single-threaded implementation.
+
+Run from src/:
+    python -m benchmarks.bench_torrent_hashing --size-mb 512
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from torrents.torrent_creator import TorrentCreator
+
+
+def encode_pieces_sequential(file_path, piece_length) -> bytes:
+    """
+    Previous implementation: one piece at a time and `bytes` concatenation.
+    """
+    pieces = b''
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(piece_length):
+            pieces += hashlib.sha1(chunk).digest()
+    return pieces
+
+
+def measure(name, size, fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<28} {best:8.3f}s {size / best / 1e6:10.1f} MB/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256, help="size of the hashed file")
+    parser.add_argument("--piece-kb", type=int, default=256, help="piece length")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant, the best one is reported")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    piece_length = args.piece_kb * 1024
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        path = f.name
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(chunk)
+
+    try:
+        print(f"{args.size_mb} MiB, {args.piece_kb} KiB pieces, {os.cpu_count()} cores")
+        creator = TorrentCreator(piece_length=piece_length)
+
+        expected = measure("sequential (previous)", size,
+                           lambda: encode_pieces_sequential(path, piece_length), args.repeat)
+        single = measure("mmap, 1 thread", size,
+                         lambda: creator.encode_pieces(path, workers=1), args.repeat)
+        parallel = measure(f"mmap, {os.cpu_count()} threads", size,
+                           lambda: creator.encode_pieces(path), args.repeat)
+
+        assert single == expected and parallel == expected, "digests differ"
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Cost of reading a torrent file: the full bencode decode of TorrentReader
+against the lazy TorrentFile scan over a memory map.
+
+A synthetic torrent with the given number of pieces (and optionally Merkle
+block hashes) is written to a temporary file, then it reports for every
+reader the time and peak memory to get the scalar fields (what the seeder
+needs), to reach the packed digests, and to build a full TorrentInfo.
+
+Run from src/:
+    python -m benchmarks.bench_torrent_parsing --pieces 80000 --merkle
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+import tracemalloc
+
+import bencodepy
+
+from torrents.merkle import BLOCK_LENGTH, merkle_root
+from torrents.torrent_file import TorrentFile
+from torrents.torrent_reader import TorrentReader
+
+PIECE_LENGTH = 256 * 1024
+
+
+def write_torrent(path, pieces, merkle):
+    info = {
+        "name": "file.bin",
+        "piece length": PIECE_LENGTH,
+        "length": pieces * PIECE_LENGTH,
+        "pieces": os.urandom(20 * pieces),
+    }
+    if merkle:
+        leaves = os.urandom(20 * pieces * (PIECE_LENGTH // BLOCK_LENGTH))
+        info["block length"] = BLOCK_LENGTH
+        info["block hashes"] = leaves
+        info["merkle root"] = merkle_root(leaves)
+    info["info_hash"] = hashlib.sha1(bencodepy.encode(info)).digest()
+    with open(path, "wb") as f:
+        f.write(bencodepy.encode({"announce": "http://127.0.0.1:8080", "info": info}))
+
+
+def decode_scalars(path):
+    info = TorrentReader.extract_info(TorrentReader.read_torrent(path))
+    return info.info_hash, info.length
+
+
+def lazy_scalars(path):
+    torrent = TorrentFile(path)
+    torrent.close()
+    return torrent.info_hash, torrent.length
+
+
+def decode_digests(path):
+    return len(TorrentReader.read_torrent(path)[b"info"][b"pieces"])
+
+
+def lazy_digests(path):
+    with TorrentFile(path) as torrent:
+        return len(torrent.pieces)
+
+
+def decode_info(path):
+    return TorrentReader.extract_info(TorrentReader.read_torrent(path))
+
+
+def lazy_info(path):
+    return TorrentReader.read_info(path)
+
+
+def measure(func, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(path)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    # Measured apart, tracing slows allocations down
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pieces", type=int, default=80000)
+    parser.add_argument("--merkle", action="store_true", help="include the block hashes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "file.torrent")
+        write_torrent(path, args.pieces, args.merkle)
+        print(f"torrent: {os.path.getsize(path) / 2**20:.1f} MiB, {args.pieces} pieces")
+
+        print(f"{'task':>8} {'reader':>8} {'ms':>9} {'peak MiB':>9}")
+        cases = [("scalars", decode_scalars, lazy_scalars),
+                 ("digests", decode_digests, lazy_digests),
+                 ("info", decode_info, lazy_info)]
+        for task, decode, lazy in cases:
+            for reader, func in (("decode", decode), ("lazy", lazy)):
+                elapsed, peak = measure(func, path, args.repeat)
+                print(f"{task:>8} {reader:>8} {elapsed * 1000:9.2f} {peak / 2**20:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
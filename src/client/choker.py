@@ -0,0 +1,75 @@
+import random
+from typing import Callable, Iterable, Optional, Set
+
+
+class Choker:
+    """
+    Upload slot scheduler of the seeder.
+
+    Every `ROTATION_INTERVAL` seconds the interested peers are ranked and
+    the best `slots - 1` get a regular slot. Peers that also upload to us
+    rank first by what they give us (reciprocation), the rest by how fast
+    they take our data. The last slot is the optimistic unchoke: a random
+    choked peer, rotated every `OPTIMISTIC_ROUNDS` rotations, so newcomers
+    and peers with no rate yet get a chance to prove themselves. Peers that
+    connected less than `NEW_PEER_AGE` seconds ago are `NEW_PEER_WEIGHT`
+    times more likely to be picked.
+
+    Peers are anything with `interested`, `upload_rate`, `connected_at` and
+    `addr` attributes (PeerConnection).
+
+    Attributes:
+    - slots: int, peers unchoked at once.
+    - download_rate: Callable[[str], float], bytes/s we download from an IP.
+    """
+
+    ROTATION_INTERVAL = 10.0
+    OPTIMISTIC_ROUNDS = 3
+    NEW_PEER_AGE = 30.0
+    NEW_PEER_WEIGHT = 3
+
+    def __init__(self, slots: int = 4, download_rate: Callable[[str], float] = None):
+        self.slots = max(1, slots)
+        self.download_rate = download_rate or (lambda ip: 0.0)
+        self.optimistic = None
+        self.rounds = 0
+
+    def rank(self, peer):
+        return (self.download_rate(peer.addr[0]), peer.upload_rate)
+
+    def rechoke(self, peers: Iterable, now: float) -> Set:
+        """
+        Peers that get a slot until the next rotation.
+        """
+        interested = [peer for peer in peers if peer.interested]
+        if self.optimistic not in interested or self.rounds % self.OPTIMISTIC_ROUNDS == 0:
+            self.optimistic = None
+        self.rounds += 1
+
+        regular_slots = self.slots - 1 if self.slots > 1 else 1
+        ranked = sorted((peer for peer in interested if peer is not self.optimistic), key=self.rank, reverse=True)
+        unchoked = set(ranked[:regular_slots])
+
+        if self.slots > 1:
+            if self.optimistic is None:
+                self.optimistic = self._pick_optimistic(ranked[regular_slots:], now)
+            if self.optimistic is not None:
+                unchoked.add(self.optimistic)
+        return unchoked
+
+    def best(self, candidates: Iterable):
+        """
+        Peer to give a slot that just freed up, None without candidates.
+        """
+        return max(candidates, key=self.rank, default=None)
+
+    def forget(self, peer):
+        if self.optimistic is peer:
+            self.optimistic = None
+
+    def _pick_optimistic(self, candidates, now: float) -> Optional[object]:
+        if not candidates:
+            return None
+        weights = [self.NEW_PEER_WEIGHT if now - peer.connected_at < self.NEW_PEER_AGE else 1
+                   for peer in candidates]
+        return random.choices(candidates, weights=weights)[0]
@@ -5,28 +5,42 @@ import socket
 import json
 import random
 import hashlib
+import math
 import shutil
 import subprocess
 import readline
 import time
+from functools import partial
 from typing import Dict, List
 
 from client.peer.peer import Peer
 from client.peer.block import BLOCK_SIZE
+from client.peer.bitfield import Bitfield
 from torrents.torrent_creator import TorrentCreator
+from torrents.merkle import MAX_MERKLE_FILE_SIZE
 from torrents.torrent_reader import TorrentReader
 from client.peer.piecesController import PieceController
+from client.peer.download_engine import DownloadEngine
+from client.seeding_catalog import SeedingCatalog, SeededTorrent
+from client.file_sender import DescriptorCache
+from client.peer_server import PeerServer
+from client.piece_cache import PieceCache
 from client.peer.piece import Piece
 from torrents.torrent_info import TorrentInfo
 from common.text_formating import print_formated
 from client.messages import *
+from common.framing import MAX_JSON_FRAME_SIZE, FrameReader
 from common.logs import log_message
 
 class Client:
-    def __init__(self, client_id: int, listen_port = 6881):
+    def __init__(self, client_id: int, listen_port = 6881, piece_cache_mb: int = 64):
         hostname = socket.gethostname()
         self.client_id = client_id
         self.tracker_socket = None
+        self.tracker_reader = None
+        # Downloads announce themselves from their own threads, one request
+        # at a time on the connection so every response reaches its caller
+        self._tracker_lock = threading.Lock()
         self.client_ip = socket.gethostbyname(hostname) 
         self.download_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"downloads/client_{client_id}")
         self.upload_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"uploads/client_{client_id}")
@@ -42,129 +56,126 @@ class Client:
             
         # self.listen_port = listen_port + self.client_id
         self.listen_port = listen_port
-        self.server_socket = None
+        self.peer_server: PeerServer = None
         
-        self.uploaded_files = {}
+        # Seeded torrents by info hash
+        self.catalog = SeedingCatalog(self.torrents_path, self.data_path)
         self.find_uploaded_files()
+        # Open descriptors of the seeded files, shared by every connection
+        self.descriptors = DescriptorCache()
+        # Pieces read for the leechers, 0 MiB sends every block from the file
+        self.piece_cache = PieceCache(piece_cache_mb * 1024 * 1024)
+        
+        # Downloads in progress by info hash
+        self.downloads: Dict[str, DownloadEngine] = {}
+        # Downloads of this run, seeded from the download directory
+        self.download_seeds: Dict[str, SeededTorrent] = {}
+        self._peer_server_lock = threading.Lock()
         
     def find_uploaded_files(self):
         """
-        Find the files that the client has uploaded.
+        Find the files that the client has uploaded. Only the torrents added
+        or modified since the last run are parsed (see SeedingCatalog).
         """
-        
-        for file_name in os.listdir(self.torrents_path):
-            if file_name.endswith(".torrent"):
-                name_file = file_name.split(".")[0]
-                
-                torrent_file_path = os.path.join(self.torrents_path, file_name)
-                torrent_data = TorrentReader.read_torrent(torrent_file_path)
-                torrent_info : TorrentInfo = TorrentReader.extract_info(torrent_data)
-                
-                data = {
-                    "torrent_file_path": torrent_file_path,
-                    "torrent_info": torrent_info
-                }
-                
-                self.uploaded_files[name_file] = data
-        
-        for file_name in os.listdir(self.data_path):
-            name_file = file_name.split(".")[0]
-            print(name_file)
-            if name_file not in self.uploaded_files:
-                pass
-            else:
-                self.uploaded_files[name_file]["data_file_path"] = os.path.join(self.data_path, file_name)
+        self.catalog.load()
                     
         print("The following files have been uploaded:")
-        for file_name in self.uploaded_files:
+        for file_name in self.catalog.names():
             print(file_name, end=" ")
             print()
             
-    def start_peer_mode(self):
+    def start_peer_mode(self, backlog=PeerServer.BACKLOG, max_peers=PeerServer.MAX_PEERS,
+                        max_peers_per_ip=PeerServer.MAX_PEERS_PER_IP, upload_slots=PeerServer.UPLOAD_SLOTS,
+                        super_seed=False):
         """
-        Start the client in peer mode to handle incoming requests.
+        Start the client in peer mode to handle incoming requests. Every
+        leecher is served from this thread (see PeerServer).
+        
+        Args:
+            backlog (int): Connections the system queues while all peer slots are taken.
+            max_peers (int): Leechers served at the same time.
+            max_peers_per_ip (int): Leechers served at the same time from one address.
+            upload_slots (int): Leechers unchoked at the same time.
+            super_seed (bool): Announce the pieces of complete torrents as they spread (see SuperSeeder).
+        Returns:
+            None
         """
-        try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.bind((self.client_ip, self.listen_port))
-            self.server_socket.listen(5)
-            
-            print_formated(f"Client {self.client_id} listening on port {self.listen_port} and IP {self.client_ip}", color='magenta')
-
-            while True:
-                try:
-                    conn, addr = self.server_socket.accept()
-                    print_formated(f"Incoming connection from {addr}", color='magenta')
-                    # Thread para manejar cada conexión
-                    threading.Thread(target=self.handle_connection, args=(conn, addr), daemon=True).start()
-                except Exception as e:
-                    print_formated(f"Error accepting connection: {e}", color='magenta')
-
-        except Exception as e:
-            raise RuntimeError(f"Error starting peer mode: {e}")
+        server, created = self._open_peer_server(backlog=backlog, max_peers=max_peers,
+                                                 max_peers_per_ip=max_peers_per_ip, upload_slots=upload_slots,
+                                                 super_seed=super_seed)
+        if not created:
+            print_formated(f"Client {self.client_id} is already listening on port {self.listen_port}", color='magenta')
+            return
+        
+        print_formated(f"Client {self.client_id} listening on port {self.listen_port} and IP {self.client_ip}", color='magenta')
+        server.serve_forever()
 
-    def handle_connection(self, conn, addr):
-        try:
-            handshake = conn.recv(Handshake.LENGTH)
-            
-            print("LLEGA AQUI")
-            info_hash, peer_id = Handshake.from_bytes(handshake)
-            
-            print(f"Info hash: {info_hash}")
-            
-            
-            info_hash = info_hash.hex()
-            
-            data = self.find_info_hash(info_hash)
-            
-            if not data:
-                print(f"Info hash {info_hash} not found")
-                return
-            
-            while True:
-                message = conn.recv(4)
-                if not message:
-                    break
-                
-                length = struct.unpack("!I", message)[0]
-                message = message + conn.recv(length)
-                
-                piece_index, block_offset, block_length = Request.from_bytes(message)
-                
-                f = open(data["data_file_path"], "rb")
-                
-                f.seek(piece_index * data["torrent_info"].piece_length + block_offset)
-                block = f.read(block_length)
-                f.close()
-                
-                response = Piece(piece_index, block_offset, block).to_bytes()
-                
-                conn.send(response)
-            
-            
-        except Exception as e:
-            print(f"Error handling connection from {addr}: {e}")
+    def _open_peer_server(self, **kwargs):
+        """
+        Create the peer server unless it already exists. Whoever creates it
+        must run its loop.
+        
+        Returns:
+            (PeerServer, bool): The server and whether it was just created.
+        """
+        with self._peer_server_lock:
+            if self.peer_server is not None:
+                return self.peer_server, False
+            try:
+                self.peer_server = PeerServer(self.client_ip, self.listen_port, self.find_info_hash,
+                                              self.descriptors, self.piece_cache,
+                                              download_rate=self.download_rate, **kwargs)
+            except Exception as e:
+                raise RuntimeError(f"Error starting peer mode: {e}")
+            return self.peer_server, True
 
-    def find_info_hash(self, info_hash):
+    def download_rate(self, ip) -> float:
+        """
+        Bytes/s we are downloading from an address over every download, so
+        the seeder can reciprocate.
+        """
+        rate = 0.0
+        for engine in list(self.downloads.values()):
+            for peer in list(engine.peers):
+                if peer.ip == ip and not peer.closed:
+                    rate += peer.stats.throughput or 0.0
+        return rate
+
+    def find_info_hash(self, info_hash) -> SeededTorrent:
         """
         Find the info hash in the uploaded files.
         
-        data = {
-                    "torrent_file_path": torrent_file_path,
-                    "torrent_info": torrent_info,
-                    "data_file_path": data_file_path
-                }
-        
         Args:
             info_hash (str): The info hash to find.
         Returns:
-            data: The data of the file with the info hash.
+            SeededTorrent: The seeded torrent with the info hash, None if there is none.
+        """
+        return self.catalog.get(info_hash) or self.download_seeds.get(info_hash)
+
+    def remove_uploaded_file(self, name):
+        """
+        Stop seeding a file. Its torrent is deleted from the uploads so it
+        isn't seeded again on the next start, the data is kept.
+        
+        Args:
+            name (str): The name of the file (without extension).
+        Returns:
+            None
         """
-        for file_name in self.uploaded_files:
-            if self.uploaded_files[file_name]["torrent_info"].info_hash == info_hash:
-                return self.uploaded_files[file_name]
+        torrent = self.catalog.get_by_name(name)
+        if torrent is None:
+            print(f"{name} is not being seeded")
+            return
         
-        return None
+        self.catalog.remove(torrent.info_hash)
+        if torrent.data_file_path:
+            self.descriptors.invalidate(torrent.data_file_path)
+            self.piece_cache.invalidate(torrent.data_file_path)
+        try:
+            os.remove(torrent.torrent_file_path)
+        except FileNotFoundError:
+            pass
+        print(f"Stopped seeding {name}")
 
     def connect_to_tracker(self, tracker_ip, tracker_port):
         """
@@ -180,6 +191,7 @@ class Client:
             self.tracker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
             self.tracker_socket.connect((tracker_ip, tracker_port))
+            self.tracker_reader = FrameReader(self.tracker_socket, max_frame_size=MAX_JSON_FRAME_SIZE)
 
             print(f"Connected to tracker at {tracker_ip}:{tracker_port}")
             log_message(f"Connected to tracker at {tracker_ip}:{tracker_port}")
@@ -222,13 +234,8 @@ class Client:
             
             message = header + message
 
-            self.tracker_socket.send(message)
-            
-            header = self.tracker_socket.recv(4)
-            data_len = struct.unpack("!I", header)[0]
-            
-            print(f"Data length: {data_len}")
-            response = self.tracker_socket.recv(data_len).decode()
+            response = self._tracker_request(message)
+            print(f"Data length: {len(response)}")
             print(f"Response: {response}")
             
             if "ERROR" in response:
@@ -245,47 +252,18 @@ class Client:
         except Exception as e:
             raise ConnectionError(f"Error requesting torrent data: {e}")
      
-    def get_free_peers(self, peers_connected):
+    def _tracker_request(self, message: bytes) -> str:
         """
-        Get the peers that are not blocked.
-        
-        Args:
-            peers_connected (List[Peer]): The list of peers connected.
-        Returns:
-            free_peers (List[Peer]): The list of free peers.
+        Send a framed request to the tracker and wait for its response,
+        whole even if it arrives in several segments.
         """
-        free_peers = []
-        for peer in peers_connected:
-            if not peer.blocked:
-                free_peers.append(peer)
-                
-        return free_peers   
-
-    def download_piece(self, piece: Piece, peers_connected, pieces_controller: PieceController, output_path):
-        while not piece.is_complete():
-            data = pieces_controller.get_empty_block(piece.piece_index)
-            if not data:
-                continue
-
-            piece_index, block_index, block = data
-            
-            block_offset = block_index * BLOCK_SIZE
-            
-            free_peers: List[Peer] = self.get_free_peers(peers_connected)
-            if not free_peers:
-                continue
-            
-            random_peer: Peer = random.choice(free_peers)
-
-            try:
-                block_data = random_peer.request_piece(piece_index, block_offset, block.block_size)
-                pieces_controller.receive_block(piece_index=piece_index, block_index=block_index, data=block_data)
-            except Exception as e:
-                print(f"Error downloading block: {e}")
-
-        if piece.set_total_data():
-            piece.save_piece(output_path)
-            print(f"Piece {piece.piece_index} downloaded from peer: {random_peer.id}")
+        with self._tracker_lock:
+            self.tracker_socket.sendall(message)
+            response = self.tracker_reader.read_payload()
+            if response is None:
+                raise ConnectionError("The tracker closed the connection")
+            # The payload lives in the reader's buffer, decode it before the next request
+            return str(response, "utf-8")
 
     def start_download(self, torrent_data):
         print("Log: comenzó la descarga")
@@ -296,56 +274,216 @@ class Client:
             name=torrent_data["name"],
             piece_length=torrent_data["piece_size"],
             length=torrent_data["size"],
-            pieces=torrent_data["pieces"]
+            pieces=torrent_data["pieces"],
+            block_hashes=torrent_data.get("block_hashes", ""),
+            merkle_root=torrent_data.get("merkle_root", "")
         )
 
-        peers = torrent_data["peers"]
+        output_path = os.path.join(self.download_path, torrent_data["name"])
+        pieces_controller = PieceController(data, output_path)
+        engine = DownloadEngine(pieces_controller, output_path, on_piece=partial(self._on_piece_downloaded, data.info_hash))
+
+        engine.restore()
+        if pieces_controller.is_complete():
+            print("Log: el archivo ya estaba descargado")
+            log_message(f"Log: {torrent_data['name']} ya estaba descargado")
+            # Nothing to download, but other peers can get the file from us
+            self.start_download_seeding(data, output_path, pieces_controller.bitfield)
+            self._announce(data.info_hash, "completed")
+            return
+
+        # Serve the verified pieces while downloading the rest
+        self.start_download_seeding(data, output_path, pieces_controller.bitfield)
+
+        # The tracker lists us too once we announced ourselves
+        peers = [peer for peer in torrent_data["peers"] if peer["peer_id"] != self.client_id]
         peers_connected = []
         for peer in peers:
             p = Peer(peer["peer_id"], peer["ip"], peer["port"])
             try:
                 p.connect()
                 hash_bytes = bytes.fromhex(torrent_data["info_hash"])
-                p.send_message(Handshake(info_hash=hash_bytes).to_bytes())
+                p.handshake(hash_bytes, pieces_controller.number_of_pieces)
+                engine.add_peer(p)
+                p.start()
                 peers_connected.append(p)
             except Exception as e:
                 print(f"Error connecting to peer {peer['peer_id']}: {e}")
             
         if len(peers_connected) == 0:
             print("No se pudo conectar a ningún peer")
+            self.stop_download_seeding(data.info_hash)
             return
 
-        output_path = os.path.join(self.download_path, torrent_data["name"])
-        pieces_controller = PieceController(data, output_path)
-
         print("Log: comenzó la descarga")
 
-        threads = []
-        for piece in pieces_controller.pieces:
-            if not pieces_controller.bitfield[piece.piece_index]:
-                t = threading.Thread(target=self.download_piece, args=(piece, peers_connected, pieces_controller, output_path))
-                threads.append(t)
-                t.start()
+        self.downloads[data.info_hash] = engine
+        try:
+            completed = engine.run()
+        finally:
+            del self.downloads[data.info_hash]
+        print(f"Download stats: {engine.stats.dict()}")
+
+        for p in peers_connected:
+            p.close()
 
-        for t in threads:
-            t.join()
+        if not completed:
+            print("Log: la descarga no se pudo completar")
+            log_message("Log: la descarga no se pudo completar")
+            return
 
         print("Log: descarga completada")
         log_message("Log: descarga completada")
+        self._announce(data.info_hash, "completed")
+                
+    def start_download_seeding(self, torrent_info: TorrentInfo, output_path, bitfield: Bitfield):
+        """
+        Accept peers for a download in progress and serve the pieces it
+        already has, announcing ourselves to the tracker as a leecher. The
+        file keeps being seeded after the download ends.
+        
+        Args:
+            torrent_info (TorrentInfo): The torrent being downloaded.
+            output_path (str): The file the download is written to.
+            bitfield (Bitfield): Pieces verified and on disk, updated by the download.
+        Returns:
+            None
+        """
+        self.download_seeds[torrent_info.info_hash] = SeededTorrent(
+            name=torrent_info.name,
+            info_hash=torrent_info.info_hash,
+            piece_length=torrent_info.piece_length,
+            length=torrent_info.length,
+            torrent_file_path="",
+            torrent_size=0,
+            torrent_mtime_ns=0,
+            data_file_path=output_path,
+            bitfield=bitfield,
+        )
+        
+        try:
+            server, created = self._open_peer_server()
+            if created:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+        except RuntimeError as e:
+            print(f"Pieces of {torrent_info.name} won't be served: {e}")
+            return
+        
+        self._announce(torrent_info.info_hash, "started")
+
+    def stop_download_seeding(self, info_hash):
+        """
+        Stop serving a download that won't go on: peers downloading it from
+        us are disconnected and the tracker takes us off its peer list.
+        
+        Args:
+            info_hash (str): The info hash of the torrent.
+        Returns:
+            None
+        """
+        if self.download_seeds.pop(info_hash, None) is None:
+            return
+        if self.peer_server:
+            self.peer_server.drop_torrent(info_hash)
+        self._announce(info_hash, "stopped")
+
+    def _on_piece_downloaded(self, info_hash, piece_index):
+        if self.peer_server:
+            self.peer_server.broadcast_have(info_hash, piece_index)
+
+    # Tracker message of each event of a download
+    ANNOUNCE_EVENTS = {
+        "started": "announce_leecher",
+        "completed": "announce_complete",
+        "stopped": "announce_stopped",
+    }
+
+    def announce_leecher(self, info_hash, event="started"):
+        """
+        Tell the tracker about a download: once started the client is listed
+        as a leecher so other downloaders connect to it, once completed it
+        is counted as a seeder and once stopped it is taken off the list.
+        
+        Args:
+            info_hash (str): The info hash of the torrent.
+            event (str): "started", "completed" or "stopped".
+        Returns:
+            None
+        """
+        request = {
+            "type": self.ANNOUNCE_EVENTS[event],
+            "info_hash": info_hash,
+            "peer_info": {
+                "peer_id": self.client_id,
+                "ip": str(self.client_ip),
+                "port": self.listen_port
+            }
+        }
+        
+        try:
+            message = json.dumps(request).encode()
+            response = self._tracker_request(struct.pack('>I', len(message)) + message)
+            print(f"Tracker response: {response}")
+        except Exception as e:
+            raise ConnectionError(f"Error announcing to the tracker: {e}")
+
+    def _announce(self, info_hash, event):
+        """
+        announce_leecher from a download, which goes on if the tracker
+        can't be reached.
+        """
+        if not self.tracker_socket:
+            return
+        try:
+            self.announce_leecher(info_hash, event)
+        except ConnectionError as e:
+            print(e)
+
+    def print_peer_stats(self):
+        """
+        Print the statistics of the peers of every download in progress.
+        """
+        if self.peer_server:
+            print(f"Seeding: {self.peer_server.stats()}")
+            for row in self.peer_server.slots():
+                optimistic = " (optimistic)" if row["optimistic"] else ""
+                print(f"  slot {row['address']:>21} {row['rate_kib_s']:>9} KiB/s {row['uploaded_mib']:>8} MiB{optimistic}")
+            for info_hash, seeder in list(self.peer_server.super_seeders.items()):
+                print(f"Super-seeding {seeder.name}: {seeder.stats()}")
+        print(f"Seeding cache: {self.piece_cache.stats()}")
+        
+        if not self.downloads:
+            print("No downloads in progress")
+            return
+        
+        for info_hash, engine in list(self.downloads.items()):
+            print_formated(f"Download {info_hash}", color='blue')
+            print(f"{'peer':>8} {'address':>21} {'KiB/s':>9} {'rtt ms':>8} {'err':>6} {'seen s':>7} {'score':>9} {'pipe':>5} {'inflight':>8}")
+            for row in engine.peer_table():
+                status = "" if row["connected"] else " (disconnected)"
+                print(f"{row['peer_id']:>8} {row['address']:>21} {row['throughput_kib_s']:>9} {str(row['rtt_ms']):>8} "
+                      f"{row['error_rate']:>6} {row['last_seen_s']:>7} {row['score']:>9} {row['pipeline']:>5} {row['inflight']:>8}{status}")
+            print(f"Stats: {engine.stats.dict()}")
                 
     def close(self):
         """
         Close the connection with the tracker.
         """
         if self.tracker_socket:
+            # Nobody can download the unfinished files from us anymore
+            for info_hash, seed in list(self.download_seeds.items()):
+                if not seed.bitfield.all():
+                    self._announce(info_hash, "stopped")
             self.tracker_socket.close()
             print("Connection closed with tracker")
             
-        if self.server_socket:
-            self.server_socket.close()
+        if self.peer_server:
+            self.peer_server.close()
             print("Server socket closed")
+            self.descriptors.close()
     
-    def create_torrent_file(self, file_path, tracker_ip=None, tracker_port=None, output_path=None):
+    def create_torrent_file(self, file_path, tracker_ip=None, tracker_port=None, output_path=None,
+                            piece_length=None, target_pieces=TorrentCreator.TARGET_PIECES, merkle=False):
         """
         Create a torrent file for a given file.
         
@@ -354,22 +492,40 @@ class Client:
             tracker_ip (str): IP address of the tracker server.
             tracker_port (int): Port number of the tracker server.
             output_path (str): The path to save the torrent file.
+            piece_length (int): Piece length in bytes, automatic if None.
+            target_pieces (int): Number of pieces aimed for by the automatic piece length.
+            merkle (bool): Include per-block hashes so downloads verify every block.
         Returns:
-            None
+            str: The path of the torrent file, None if it wasn't created.
         """
         
+        if merkle and os.path.getsize(file_path) > MAX_MERKLE_FILE_SIZE:
+            print(f"{file_path} is too big for per-block hashes (max {MAX_MERKLE_FILE_SIZE // 1024 ** 3} GiB), create it without --merkle")
+            log_message(f"Refused Merkle torrent for {file_path}: larger than {MAX_MERKLE_FILE_SIZE} bytes")
+            return None
+
         if not tracker_ip or not tracker_port:
             tracker_ip = self.tracker_socket.getsockname()[0]
             tracker_port = self.tracker_socket.getsockname()[1]
             
             
-        torrent_creator = TorrentCreator(tracker_url="www.thepiratebay.org")
+        torrent_creator = TorrentCreator(tracker_url="www.thepiratebay.org", piece_length=piece_length,
+                                         target_pieces=target_pieces, merkle=merkle)
         
         
-        output_path = torrent_creator.create_torrent(file_path=str(file_path))
-        shutil.copy(output_path, self.torrents_path)
-        shutil.copy(file_path, self.data_path)
-        self.find_uploaded_files()
+        last_reported = [0]
+        def report_progress(hashed, total):
+            percent = hashed * 100 // total
+            if percent >= last_reported[0] + 10 or hashed == total:
+                last_reported[0] = percent
+                print(f"Hashing {os.path.basename(str(file_path))}: {percent}%")
+
+        output_path = torrent_creator.create_torrent(file_path=str(file_path), progress=report_progress)
+        torrent_file_path = shutil.copy(output_path, self.torrents_path)
+        data_file_path = shutil.copy(file_path, self.data_path)
+        self.descriptors.invalidate(data_file_path)
+        self.piece_cache.invalidate(data_file_path)
+        self.catalog.add(torrent_file_path, data_file_path)
         
         return output_path
     
@@ -382,8 +538,7 @@ class Client:
         Returns:
             None
         """
-        torrent_data = TorrentReader.read_torrent(torrent_file_path)
-        torrent_info = TorrentReader.extract_info(torrent_data)
+        torrent_info = TorrentReader.read_info(torrent_file_path)
         
 
         request = {
@@ -395,6 +550,8 @@ class Client:
                     "size": torrent_info.length,
                     "piece_size": torrent_info.piece_length,
                     "pieces": torrent_info.pieces,
+                    "block_hashes": torrent_info.block_hashes,
+                    "merkle_root": torrent_info.merkle_root,
                 },
             "peer_info": {
                 "peer_id": self.client_id,
@@ -412,12 +569,8 @@ class Client:
             
             message = header + message
             
-            self.tracker_socket.send(message)
-            header = self.tracker_socket.recv(4)
-            data_len = struct.unpack("!I", header)[0]
-            response = self.tracker_socket.recv(data_len).decode()
+            response = self._tracker_request(message)
             print(f"Tracker response: {response}")
-            self.uploaded_files 
         except Exception as e:
             raise ConnectionError(f"Error uploading torrent file: {e}")
     
@@ -475,8 +628,10 @@ class Client:
             "get_torrent",
             "start_seeding",
             "download",
+            "peers",
             "create_torrent",
             "upload_torrent",
+            "remove_torrent",
             "send_broadcast",
             "listen_broadcast",
             "help",
@@ -499,14 +654,16 @@ class Client:
             print("1. connect_tr")
             print("2. get_torrent <info_hash>")
             print("3. download <info_hash>")
-            print("4. create_torrent <file_path>")
+            print("4. create_torrent <file_path> [piece_length_kib] [--merkle]")
             print("5. upload_torrent <torrent_file_path>")
-            print("6. drop_tracker")
-            print("7. start_seeding")
-            print("8. send_broadcast <message>")
-            print("9. listen_broadcast")
-            print("10. help")
-            print("11. exit")
+            print("6. remove_torrent <file_name>")
+            print("7. drop_tracker")
+            print("8. start_seeding [--super]")
+            print("9. send_broadcast <message>")
+            print("10. listen_broadcast")
+            print("11. peers")
+            print("12. help")
+            print("13. exit")
         
         print_commands()
 
@@ -522,15 +679,24 @@ class Client:
                 elif command[0] == "get_torrent":
                     self.request_torrent_data(command[1])
                 elif command[0] == "start_seeding":
-                    threading.Thread(target=self.start_peer_mode, daemon=True).start()
+                    threading.Thread(target=self.start_peer_mode, kwargs={"super_seed": "--super" in command},
+                                     daemon=True).start()
                 elif command[0] == "download":
                     r = self.request_torrent_data(command[1])
                     if r:
-                        self.start_download(r)
+                        # Download in background so the console stays available (e.g. `peers`)
+                        threading.Thread(target=self.start_download, args=(r,), daemon=True).start()
+                elif command[0] == "peers":
+                    self.print_peer_stats()
                 elif command[0] == "create_torrent":
-                    self.create_torrent_file(file_path=str(command[1]))
+                    merkle = "--merkle" in command
+                    args = [arg for arg in command[1:] if arg != "--merkle"]
+                    piece_length = int(args[1]) * 1024 if len(args) > 1 else None
+                    self.create_torrent_file(file_path=str(args[0]), piece_length=piece_length, merkle=merkle)
                 elif command[0] == "upload_torrent":
                     self.upload_torrent_file(command[1])
+                elif command[0] == "remove_torrent":
+                    self.remove_uploaded_file(command[1])
                 elif command[0] == "send_broadcast":
                     if len(command) < 2:
                         print_formated("Usage: send_broadcast <message>", color='red')
@@ -0,0 +1,151 @@
+import os
+import socket
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+
+# Ask the kernel to hold the header until the block follows (Linux only)
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+
+
+class DescriptorCache:
+    """
+    LRU cache of read-only descriptors of the seeded files, so serving a
+    block doesn't open and close its file.
+
+    Descriptors are shared by every connection: reads go through os.pread /
+    os.sendfile with an explicit offset, so there is no file position to
+    fight over. A descriptor evicted while a connection is still using it
+    is closed once it is released.
+
+    Attributes:
+    - capacity: int, descriptors kept open at most (besides the ones in use).
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        # path -> fd, least recently used first
+        self._open: "OrderedDict[str, int]" = OrderedDict()
+        # fd -> connections using it
+        self._users: Dict[int, int] = {}
+        # Evicted descriptors still in use, closed on release
+        self._evicted = set()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def open(self, path: str):
+        """
+        Descriptor of the file for the duration of the with block.
+        """
+        fd = self.acquire(path)
+        try:
+            yield fd
+        finally:
+            self.release(fd)
+
+    def acquire(self, path: str) -> int:
+        """
+        Descriptor of the file, to be given back with release(). Prefer
+        open() unless the descriptor outlives the caller's frame.
+        """
+        with self._lock:
+            fd = self._open.get(path)
+            if fd is not None:
+                self._open.move_to_end(path)
+                self._users[fd] += 1
+                self.hits += 1
+                return fd
+
+        # Opened outside the lock, it may block on a slow disk
+        fd = os.open(path, os.O_RDONLY)
+        with self._lock:
+            self.misses += 1
+            current = self._open.get(path)
+            if current is not None:
+                # Another connection opened it in the meantime
+                os.close(fd)
+                self._open.move_to_end(path)
+                self._users[current] += 1
+                return current
+
+            self._open[path] = fd
+            self._users[fd] = 1
+            while len(self._open) > self.capacity:
+                _, old_fd = self._open.popitem(last=False)
+                if self._users[old_fd] == 0:
+                    del self._users[old_fd]
+                    os.close(old_fd)
+                else:
+                    self._evicted.add(old_fd)
+            return fd
+
+    def release(self, fd: int):
+        with self._lock:
+            self._users[fd] -= 1
+            if self._users[fd] == 0 and fd in self._evicted:
+                self._evicted.discard(fd)
+                del self._users[fd]
+                os.close(fd)
+
+    def invalidate(self, path: str):
+        """
+        Drop the descriptor of a file that was replaced or removed.
+        """
+        with self._lock:
+            fd = self._open.pop(path, None)
+            if fd is None:
+                return
+            if self._users[fd] == 0:
+                del self._users[fd]
+                os.close(fd)
+            else:
+                self._evicted.add(fd)
+
+    def close(self):
+        with self._lock:
+            for fd in self._open.values():
+                if self._users[fd] == 0:
+                    del self._users[fd]
+                    os.close(fd)
+                else:
+                    self._evicted.add(fd)
+            self._open.clear()
+
+    def stats(self) -> dict:
+        return {"open": len(self._open), "hits": self.hits, "misses": self.misses}
+
+
+def send_block(conn: socket.socket, header: bytes, fd: int, offset: int, length: int):
+    """
+    Send a message header followed by `length` bytes of a file, straight
+    from the page cache with os.sendfile when the platform has it.
+
+    Args:
+        conn (socket.socket): Blocking socket of the peer.
+        header (bytes): Bytes sent before the data (e.g. Piece.header).
+        fd (int): Descriptor of the file.
+        offset (int): Position of the data in the file.
+        length (int): Bytes of the file to send.
+    Raises:
+        EOFError: The file is shorter than offset + length.
+    """
+    if not hasattr(os, "sendfile"):
+        data = os.pread(fd, length, offset)
+        if len(data) != length:
+            raise EOFError(f"Only {len(data)} of {length} bytes at offset {offset}")
+        conn.sendall(header + data)
+        return
+
+    conn.sendall(header, MSG_MORE)
+    out_fd = conn.fileno()
+    while length > 0:
+        # Blocking socket: it may still send less than asked
+        sent = os.sendfile(out_fd, fd, offset, length)
+        if sent == 0:
+            raise EOFError(f"File ended {length} bytes before the end of the block at offset {offset}")
+        offset += sent
+        length -= sent
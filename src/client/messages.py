@@ -1,4 +1,4 @@
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
 
 
 class WrongMessageException(Exception):
@@ -104,26 +104,34 @@ class MessageNoPayload(Message):
 
     @classmethod
     def from_bytes(self, message):
-        payload_len, message_id = unpack(">IB", message[:5])
+        payload_len, message_id = unpack_from(">IB", message)
         
         if payload_len != 1:
             raise WrongMessageException("Invalid MessageNoPayload length")
         
-        return self(message_id)
+        if self is MessageNoPayload:
+            return self(message_id)
+        if message_id != self.message_id:
+            raise WrongMessageException(f"Not a {self.__name__} message")
+        return self()
   
 class Choke(MessageNoPayload):
+    message_id = 0
     def __init__(self):
         super().__init__(0)
     
 class Unchoke(MessageNoPayload):
+    message_id = 1
     def __init__(self):
         super().__init__(1)
         
 class Interested(MessageNoPayload):
+    message_id = 2
     def __init__(self):
         super().__init__(2)
         
 class NotInterested(MessageNoPayload):
+    message_id = 3
     def __init__(self):
         super().__init__(3)
 
@@ -131,6 +139,7 @@ class Have(Message):
     """ HAVE message
     <length=5><message_id=4><piece_index>
     """
+    message_id = 4
 
     def __init__(self, piece_index):
         super().__init__()
@@ -140,8 +149,9 @@ class Have(Message):
     def to_bytes(self):
         return pack(">IBI", 5, 4, self.piece_index)
     
+    @classmethod
     def from_bytes(self,message):
-        length, message_id, piece_index = unpack(">IBI", message[:9])
+        length, message_id, piece_index = unpack_from(">IBI", message)
         
         if length != 5 or message_id != 4:
             raise WrongMessageException("Invalid Have message")
@@ -152,6 +162,7 @@ class BitField(Message):
     """ BitField message
     <length><message_id=5><bitfield>
     """
+    message_id = 5
     
     def __init__(self, bitfield):
         super().__init__()
@@ -164,7 +175,7 @@ class BitField(Message):
     
     @classmethod
     def from_bytes(self, message):
-        length, message_id = unpack(">IB", message[:5])
+        length, message_id = unpack_from(">IB", message)
         if message_id != 5:
             raise WrongMessageException("Invalid BitField message")
         bitfield = message[5:length + 4]
@@ -186,10 +197,10 @@ class Request(Message):
     
     @classmethod
     def from_bytes(self, message):
-        length, message_id, piece_index, block_offset, block_length = unpack(">IBIII", message[:17])
+        length, message_id, piece_index, block_offset, block_length = unpack_from(">IBIII", message)
         if length != 13 or message_id != 6:
             raise WrongMessageException("Invalid Request message")
-        return (piece_index, block_offset, block_length)
+        return self(piece_index, block_offset, block_length)
 
 
 # ---
@@ -202,6 +213,7 @@ class Piece(Message):
         - block_offset = zero-based of the requested block (4 bytes)
         - block = block as a bytestring or bytearray (block_length bytes)
     """
+    message_id = 7
     def __init__(self, piece_index, block_offset, block):
         super().__init__()
         self.piece_index = piece_index
@@ -209,15 +221,22 @@ class Piece(Message):
         self.block = block
         self.block_length = len(block)
 
+    HEADER_LENGTH = 13
+
     def to_bytes(self):
-        payload_len = 9 + self.block_length
-        
-        return pack(f">IBII{self.block_length}s",
-                    payload_len,
+        return self.header(self.piece_index, self.block_offset, self.block_length) + self.block
+
+    @staticmethod
+    def header(piece_index, block_offset, block_length):
+        """
+        The 13 bytes before the block, so the block itself can be sent
+        without building the message (e.g. with os.sendfile)
+        """
+        return pack(">IBII",
+                    9 + block_length,
                     7,  # message_id
-                    self.piece_index,
-                    self.block_offset,
-                    self.block)
+                    piece_index,
+                    block_offset)
 
     @classmethod
     def from_bytes(self, message):
@@ -238,6 +257,7 @@ class Cancel(Message):
         - block_offset = zero-based of the requested block (4 bytes)
         - block_length = length of the requested block (4 bytes)
     """
+    message_id = 8
     def __init__(self, piece_index, block_offset, block_length):
         super().__init__()
         self.piece_index = piece_index
@@ -254,7 +274,7 @@ class Cancel(Message):
 
     @classmethod
     def from_bytes(self, message):
-        payload_len, message_id, piece_index, block_offset, block_length = unpack(">IBIII", message[:17])
+        payload_len, message_id, piece_index, block_offset, block_length = unpack_from(">IBIII", message)
         
         if payload_len != 13 or message_id != 8:
             raise WrongMessageException("Not a Cancel message")
@@ -267,6 +287,7 @@ class Port(Message):
     PORT = <length=5><message_id=9><port_number>
         - port_number = listen_port (4 bytes)
     """
+    message_id = 9
     def __init__(self, listen_port):
         super().__init__()
         self.listen_port = listen_port
@@ -0,0 +1,87 @@
+from typing import Iterator
+
+
+class Bitfield:
+    """
+    Set of pieces packed one bit per piece in the BitField payload format:
+    the high bit of the first byte is piece 0 and spare bits at the end are
+    cleared, so `to_bytes()` can be sent as is.
+    """
+
+    __slots__ = ("length", "_bits", "_count")
+
+    def __init__(self, length: int):
+        self.length = length
+        self._bits = bytearray((length + 7) // 8)
+        self._count = 0
+
+    @classmethod
+    def full(cls, length: int) -> "Bitfield":
+        bitfield = cls(length)
+        for i in range(len(bitfield._bits)):
+            bitfield._bits[i] = 0xFF
+        bitfield._clear_spare_bits()
+        bitfield._count = length
+        return bitfield
+
+    @classmethod
+    def from_bytes(cls, payload: bytes, length: int) -> "Bitfield":
+        """
+        Unpack a BitField payload of a torrent with `length` pieces.
+        """
+        bitfield = cls(length)
+        if len(payload) < len(bitfield._bits):
+            raise ValueError("BitField payload too short")
+        bitfield._bits[:] = payload[:len(bitfield._bits)]
+        bitfield._clear_spare_bits()
+        bitfield._count = int.from_bytes(bitfield._bits, "big").bit_count()
+        return bitfield
+
+    def _clear_spare_bits(self):
+        spare = len(self._bits) * 8 - self.length
+        if spare:
+            self._bits[-1] &= (0xFF << spare) & 0xFF
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> bool:
+        if not 0 <= index < self.length:
+            raise IndexError(f"Piece {index} out of range")
+        return bool(self._bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def __setitem__(self, index: int, value: bool):
+        if not 0 <= index < self.length:
+            raise IndexError(f"Piece {index} out of range")
+        mask = 0x80 >> (index & 7)
+        had = bool(self._bits[index >> 3] & mask)
+        if value and not had:
+            self._bits[index >> 3] |= mask
+            self._count += 1
+        elif not value and had:
+            self._bits[index >> 3] &= ~mask & 0xFF
+            self._count -= 1
+
+    def __iter__(self) -> Iterator[bool]:
+        for i in range(self.length):
+            yield bool(self._bits[i >> 3] & (0x80 >> (i & 7)))
+
+    def ones(self) -> Iterator[int]:
+        """
+        Indexes of the pieces in the set, skipping empty bytes.
+        """
+        for byte_index, byte in enumerate(self._bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (0x80 >> bit):
+                    yield byte_index * 8 + bit
+
+    def count(self) -> int:
+        return self._count
+
+    def all(self) -> bool:
+        return self._count == self.length
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
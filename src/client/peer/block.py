@@ -1,16 +1,21 @@
 import enum
+from typing import Dict, Tuple
 
 BLOCK_SIZE = 2**14
 
-class State(enum.Enum):
-    """State of the block"""
+class State(enum.IntEnum):
+    """State of the block, stored one byte per block by the PieceController"""
     EMPTY = 0
     DOWNLOADING = 1
     DOWNLOADED = 2
-    
-class Block:
-    def __init__(self, state=State.EMPTY, data= None, block_size=BLOCK_SIZE):
-        self.state = state
-        self.data = data
-        self.block_size = block_size
-    
\ No newline at end of file
+
+class BlockRequests:
+    """Outstanding requests of a block being downloaded"""
+
+    __slots__ = ("requests", "receiver")
+
+    def __init__(self):
+        # Peers with an outstanding request for the block: peer -> (requested_at, deadline)
+        self.requests: Dict[object, Tuple[float, float]] = {}
+        # Peer receiving the block straight into the piece buffer right now
+        self.receiver = None
@@ -0,0 +1,46 @@
+import threading
+from typing import List
+
+
+class BufferPool:
+    """
+    Recycles the piece buffers of a download.
+
+    Every piece being downloaded owns one `bytearray` of `buffer_size` bytes
+    that blocks are received into. Once the piece is on disk its buffer goes
+    back to the pool and is reused by the next piece, so a download allocates
+    roughly as many buffers as pieces it has in progress at once instead of
+    one per piece.
+
+    Attributes:
+    - buffer_size: int, size of every buffer (the piece length).
+    - capacity: int, buffers kept for reuse, extra ones are left to the GC.
+    """
+
+    def __init__(self, buffer_size: int, capacity: int = 32):
+        self.buffer_size = buffer_size
+        self.capacity = capacity
+        self._free: List[bytearray] = []
+        self._lock = threading.Lock()
+
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self) -> bytearray:
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.allocated += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray):
+        if len(buffer) != self.buffer_size:
+            return
+        with self._lock:
+            if len(self._free) < self.capacity:
+                self._free.append(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"allocated": self.allocated, "reused": self.reused, "free": len(self._free)}
@@ -0,0 +1,482 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import partial
+from typing import Callable, List, Optional, Set
+
+from client.messages import Have
+from client.peer.block import BLOCK_SIZE
+from client.peer.peer import Peer
+from client.peer.piecesController import CorruptBlockError, PieceController
+from client.peer.resume import FastResume
+from client.peer.storage import DiskWriter
+from common.logs import log_message
+
+
+@dataclass
+class DownloadStats:
+    endgame_threshold: int
+    duplicate_budget: int
+    endgame_entered: bool = False
+    endgame_entered_after: Optional[float] = None  # seconds since the start
+    endgame_blocks_at_entry: int = 0
+    duplicate_requests: int = 0
+    cancels_sent: int = 0
+    # Block lifecycle
+    timeouts: int = 0
+    duplicate_blocks: int = 0
+    duplicate_bytes: int = 0
+    corrupt_blocks: int = 0
+
+    def dict(self):
+        return asdict(self)
+
+
+class DownloadEngine:
+    """
+    Event-driven download of one torrent from a set of connected peers.
+
+    There is no thread per piece. Each peer pulls blocks from the
+    PieceController whenever its request pipeline has a free slot: the first
+    time when its BitField arrives and then from the peer's receiver thread
+    every time a block comes back. Pieces are chosen rarest-first from the
+    availability announced by the peers with BitField and Have. A peer that
+    finds no work is parked and woken up when a block is returned to the pool
+    (failed request or piece that didn't pass validation), and a peer that
+    chokes us gets nothing until it unchokes us again. Hashing and
+    writing completed pieces runs on a small bounded pool so receiver threads
+    keep draining their sockets.
+
+    Endgame: once every remaining block has been requested and no more than
+    `endgame_threshold` blocks are in flight, idle peers also request blocks
+    that are already in flight elsewhere, up to `duplicate_budget` extra
+    requests per block. The first copy to arrive wins and the other holders
+    get a `Cancel`.
+
+    Peer selection: every peer carries PeerStats. Parked peers are woken best
+    score first, peers that error get no requests while in backoff (they
+    are parked and retried by the maintenance thread), and a peer
+    whose score stays under `SLOW_FRACTION` of the best one for `SLOW_GRACE`
+    seconds is disconnected so its blocks go to faster peers.
+
+    Every request has a deadline derived from the peer's RTT and the depth of
+    its pipeline. Requests that miss it are cancelled, count as an error for
+    the peer and their blocks go back to the pool.
+
+    Blocks are received straight into a buffer owned by their piece and
+    hashed as they land. Validated pieces are handed to a DiskWriter that
+    owns the output file; a piece only counts as done once it is on disk,
+    and then its buffer goes back to the pool.
+
+    With Merkle metadata every block is checked as it arrives. A corrupt
+    block only costs its own re-download, the peer that sent it is penalized
+    like a failed request and disconnected after `MAX_CORRUPT_BLOCKS`.
+
+    Pieces already on disk are found with `restore` before peers are
+    connected, and the fast-resume state is saved once the run ends.
+
+    The download fails once every peer is gone, or when some missing piece
+    has had no connected peer announcing it for `SUPPLY_TIMEOUT` seconds
+    without any piece completing meanwhile.
+
+    Every piece on disk is announced with Have to the peers we download
+    from (a super-seeder waits for them to offer new pieces) and
+    `on_piece(piece_index)` is called, so the client can announce it to the
+    peers downloading from us.
+    """
+
+    MAINTENANCE_INTERVAL = 1.0
+    SLOW_FRACTION = 0.1
+    SLOW_GRACE = 30.0
+    SUPPLY_TIMEOUT = 30.0
+    MIN_REQUEST_TIMEOUT = 10.0
+    REQUEST_TIMEOUT_FACTOR = 4.0
+    MAX_CORRUPT_BLOCKS = 3
+
+    def __init__(self, pieces_controller: PieceController, output_path: str, workers: int = None,
+                 endgame_threshold: int = 32, duplicate_budget: int = 2, writer: DiskWriter = None,
+                 on_piece: Callable[[int], None] = None):
+        self.controller = pieces_controller
+        self.peers: List[Peer] = []
+        self.output_path = output_path
+        self.writer = writer or DiskWriter(output_path, pieces_controller.torrent.length)
+        self.resume = FastResume(output_path, pieces_controller.torrent)
+        self.on_piece = on_piece
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="piece-writer")
+
+        self.lock = threading.Lock()
+        self.idle_peers: Set[Peer] = set()
+        self.finished = threading.Event()
+        self.failed = False
+
+        self.last_progress = time.monotonic()
+        self.unsupplied_since = None
+
+        self.endgame = False
+        self.started_at = time.monotonic()
+        self.stats = DownloadStats(endgame_threshold=endgame_threshold, duplicate_budget=duplicate_budget)
+
+    def add_peer(self, peer: Peer):
+        """
+        Register a peer before its receiver thread is started so none of its
+        BitField/Have announcements are missed.
+        """
+        peer.listener = self
+        with self.lock:
+            self.peers.append(peer)
+
+    def on_bitfield(self, peer: Peer):
+        self.controller.add_peer_bitfield(peer.bitfield)
+        self._fill(peer)
+
+    def on_have(self, peer: Peer, piece_index: int):
+        self.controller.add_have(piece_index)
+        self._fill(peer)
+
+    def on_unchoke(self, peer: Peer):
+        self._fill(peer)
+
+    def block_buffer(self, peer: Peer, piece_index: int, block_offset: int, length: int):
+        if block_offset % BLOCK_SIZE or not 0 <= piece_index < self.controller.number_of_pieces:
+            return None
+        return self.controller.block_buffer(piece_index, block_offset // BLOCK_SIZE, peer, length)
+
+    def release_block_buffer(self, peer: Peer, piece_index: int, block_offset: int):
+        self.controller.release_block_buffer(piece_index, block_offset // BLOCK_SIZE, peer)
+
+    def on_peer_closed(self, peer: Peer):
+        self.controller.remove_peer_bitfield(peer.bitfield)
+        with self.lock:
+            self.idle_peers.discard(peer)
+        self._check_peers()
+
+    def restore(self) -> int:
+        """
+        Skip the pieces that are already in the output file: from the
+        fast-resume state if it is still valid, otherwise by rechecking the
+        existing data.
+
+        Returns:
+            int: Number of pieces that don't have to be downloaded.
+        """
+        if not os.path.exists(self.output_path):
+            return 0
+
+        bitfield = self.resume.load(self.controller.number_of_pieces)
+        if bitfield is None:
+            started = time.monotonic()
+            print(f"Rechecking existing data of {self.output_path}")
+            bitfield = self.resume.recheck()
+            log_message(f"Recheck of {self.output_path} took {time.monotonic() - started:.2f}s")
+
+        restored = self.controller.restore(bitfield)
+        print(f"{restored}/{self.controller.number_of_pieces} pieces already downloaded")
+        if self.controller.is_complete():
+            # run() won't touch the file, record the checked state now
+            self._save_resume()
+        return restored
+
+    def run(self) -> bool:
+        """
+        Download every missing piece.
+
+        Returns:
+            bool: True if the download completed.
+        """
+        if self.controller.is_complete():
+            return True
+
+        self.started_at = time.monotonic()
+        self.last_progress = self.started_at
+        self.writer.open()
+        # No peer at all (or none left) would leave nothing to wake us up
+        self._check_peers()
+        for peer in list(self.peers):
+            self._fill(peer)
+
+        threading.Thread(target=self._maintenance, daemon=True).start()
+
+        try:
+            self.finished.wait()
+            self.executor.shutdown(wait=True)
+        finally:
+            self.writer.close()
+            self._save_resume()
+
+        self._sync_stats()
+        return not self.failed and self.controller.is_complete()
+
+    def _fill(self, peer: Peer):
+        """
+        Give the peer blocks until its pipeline is full or no work is left.
+        """
+        while peer.free_slots() > 0:
+            deadline = time.monotonic() + self._request_timeout(peer)
+            work = self.controller.next_block(peer, deadline)
+            if work is None:
+                work = self._endgame_block(peer, deadline)
+            if work is None:
+                with self.lock:
+                    self.idle_peers.add(peer)
+                return
+
+            piece_index, block_index, block_size = work
+            callback = partial(self._on_block, peer, block_index)
+            if not peer.request_block(piece_index, block_index * BLOCK_SIZE, block_size, callback):
+                self.controller.release_block(piece_index, block_index, peer)
+                return
+
+        if not peer.closed and peer.stats.in_backoff(time.monotonic()):
+            # Parked until its backoff ends, maintenance tries it again
+            with self.lock:
+                self.idle_peers.add(peer)
+
+    def _request_timeout(self, peer: Peer) -> float:
+        """
+        Time a request may take: a multiple of what the peer needs to go
+        through its pipeline at the measured rate, never less than the minimum.
+        """
+        stats = peer.stats
+        expected = stats.rtt or 0.0
+        if stats.throughput:
+            expected += len(peer.inflight) * BLOCK_SIZE / stats.throughput
+        return max(self.MIN_REQUEST_TIMEOUT, self.REQUEST_TIMEOUT_FACTOR * expected)
+
+    def _endgame_block(self, peer: Peer, deadline: float):
+        """
+        Pick an in-flight block to request again from an idle peer, if the
+        download is in endgame.
+        """
+        if not 0 < len(self.controller.inflight) <= self.stats.endgame_threshold:
+            return None
+
+        inflight = self.controller.inflight_requests()
+
+        entered_now = False
+        with self.lock:
+            if not self.endgame:
+                if not self.controller.all_requested():
+                    return None
+                self.endgame = True
+                self.stats.endgame_entered = True
+                self.stats.endgame_entered_after = time.monotonic() - self.started_at
+                self.stats.endgame_blocks_at_entry = len(inflight)
+                print(f"Endgame: {len(inflight)} blocks left in flight")
+                entered_now = True
+
+        if entered_now:
+            # Parked peers can now help with the duplicates
+            self._wake_idle_peers()
+
+        # Blocks with the fewest copies in flight first
+        inflight.sort(key=lambda request: request[2])
+        for piece_index, block_index, copies in inflight:
+            if copies > self.stats.duplicate_budget:
+                break
+            if peer.bitfield is not None and not peer.bitfield[piece_index]:
+                continue
+            if self.controller.assign_duplicate(piece_index, block_index, peer, deadline):
+                with self.lock:
+                    self.stats.duplicate_requests += 1
+                return piece_index, block_index, self.controller.block_size(piece_index, block_index)
+
+        return None
+
+    def _wake_idle_peers(self):
+        with self.lock:
+            peers = list(self.idle_peers)
+            self.idle_peers.clear()
+
+        # Fast peers get the first pick of the returned work
+        peers.sort(key=lambda p: p.stats.score(), reverse=True)
+        for peer in peers:
+            self._fill(peer)
+
+    def _maintenance(self):
+        """
+        Periodic work that isn't triggered by any message: close throughput
+        samples of stalled peers, expire late requests, drop peers that stay
+        slow, wake the parked peers (which is what gives a peer whose backoff
+        expired work again) and give up on pieces nobody has.
+        """
+        while not self.finished.wait(self.MAINTENANCE_INTERVAL):
+            now = time.monotonic()
+            with self.lock:
+                peers = [peer for peer in self.peers if not peer.closed]
+
+            for peer in peers:
+                peer.stats.tick(now)
+
+            self._expire_requests(now)
+            self._sync_stats()
+
+            self._drop_slow_peers(peers, now)
+            self._wake_idle_peers()
+            self._check_supply(now)
+
+    def _save_resume(self):
+        try:
+            self.resume.save(self.controller.bitfield)
+        except OSError as e:
+            log_message(f"Error saving fast-resume state of {self.output_path}: {e}")
+
+    def _sync_stats(self):
+        self.stats.timeouts = self.controller.timeouts
+        self.stats.duplicate_blocks = self.controller.duplicate_blocks
+        self.stats.duplicate_bytes = self.controller.duplicate_bytes
+        self.stats.corrupt_blocks = self.controller.corrupt_blocks
+
+    def _drop_slow_peers(self, peers: List[Peer], now: float):
+        if len(peers) < 2:
+            return
+
+        best = max(peer.stats.score() for peer in peers)
+        for peer in peers:
+            stats = peer.stats
+            if not stats.blocks or stats.score() >= self.SLOW_FRACTION * best:
+                stats.slow_since = None
+            elif stats.slow_since is None:
+                stats.slow_since = now
+            elif now - stats.slow_since > self.SLOW_GRACE:
+                log_message(f"Dropping slow peer {peer.id}: {stats.dict()}")
+                print(f"Dropping slow peer {peer.id}")
+                peer.close()
+
+    def peer_table(self) -> List[dict]:
+        """
+        Statistics of every peer of the download, best score first.
+        """
+        with self.lock:
+            peers = list(self.peers)
+        peers.sort(key=lambda p: p.stats.score(), reverse=True)
+
+        return [dict(
+            peer_id=peer.id,
+            address=f"{peer.ip}:{peer.port}",
+            connected=not peer.closed,
+            pipeline=peer.pipeline_depth,
+            inflight=len(peer.inflight),
+            **peer.stats.dict(),
+        ) for peer in peers]
+
+    def _on_block(self, peer: Peer, block_index: int, piece_index: int, block_offset: int, data, error):
+        if error is not None:
+            print(f"Error downloading block {block_index} of piece {piece_index} from peer {peer.id}: {error}")
+            self.controller.release_block(piece_index, block_index, peer)
+            self._wake_idle_peers()
+            return
+
+        try:
+            completed, others = self.controller.receive_block(piece_index, block_index, data, peer)
+        except CorruptBlockError as e:
+            self._on_corrupt_block(peer, e)
+            return
+
+        # Endgame duplicates: the first copy won, the others are cancelled
+        for other in others:
+            if other.cancel(piece_index, block_offset, len(data)):
+                with self.lock:
+                    self.stats.cancels_sent += 1
+            self._fill(other)
+
+        if completed:
+            try:
+                self.executor.submit(self._finish_piece, piece_index, peer)
+            except RuntimeError:
+                # run() already gave up and shut the pool down
+                return
+
+        self._fill(peer)
+
+    def _on_corrupt_block(self, peer: Peer, error: CorruptBlockError):
+        stats = peer.stats
+        stats.on_corrupt_block(time.monotonic())
+        print(f"Corrupt block from peer {peer.id}: {error}")
+        log_message(f"Corrupt block from peer {peer.id} ({stats.corrupt_blocks} so far): {error}")
+
+        if stats.corrupt_blocks >= self.MAX_CORRUPT_BLOCKS:
+            print(f"Dropping peer {peer.id}: too many corrupt blocks")
+            peer.close()
+
+        # The block is back in the pool for the other peers
+        self._wake_idle_peers()
+
+    def _expire_requests(self, now: float):
+        expired = self.controller.expire_requests(now)
+        for piece_index, block_index, peer in expired:
+            print(f"Request for block {block_index} of piece {piece_index} to peer {peer.id} timed out")
+            peer.cancel(piece_index, block_index * BLOCK_SIZE, self.controller.block_size(piece_index, block_index))
+            peer.stats.on_error(now)
+            with self.lock:
+                self.idle_peers.add(peer)
+
+        if expired:
+            self._wake_idle_peers()
+
+    def _finish_piece(self, piece_index: int, peer: Peer):
+        piece = self.controller.active[piece_index]
+
+        if piece.set_total_data():
+            piece.save_piece(self.writer, partial(self._on_piece_written, piece_index, peer))
+        else:
+            log_message(f"Piece {piece_index} failed validation, downloading it again")
+            self.controller.reset_piece(piece_index)
+            self._wake_idle_peers()
+
+    def _on_piece_written(self, piece_index: int, peer: Peer, offset: int, error):
+        if error is not None:
+            print(f"Error saving piece {piece_index}: {error}")
+            self.controller.reset_piece(piece_index)
+            self._wake_idle_peers()
+            return
+
+        self.controller.piece_written(piece_index)
+        print(f"Piece {piece_index} downloaded from peer: {peer.id}")
+        self.last_progress = time.monotonic()
+        self._send_have(piece_index)
+        if self.on_piece:
+            self.on_piece(piece_index)
+
+        if self.controller.is_complete():
+            self.finished.set()
+
+    def _send_have(self, piece_index: int):
+        message = Have(piece_index).to_bytes()
+        with self.lock:
+            peers = [peer for peer in self.peers if not peer.closed]
+        for peer in peers:
+            try:
+                peer.send_message(message)
+            except IOError:
+                # The receiver thread finds out and closes the peer
+                pass
+
+    def _check_peers(self):
+        with self.lock:
+            peers = list(self.peers)
+        if all(peer.closed for peer in peers):
+            print("All peers disconnected, download aborted")
+            self.failed = True
+            self.finished.set()
+
+    def _check_supply(self, now: float):
+        """
+        Give up when some missing piece has nobody to download it from and
+        nothing else completed for `SUPPLY_TIMEOUT` seconds. A peer that gets
+        the piece later would announce it with Have and reset the wait.
+        """
+        missing = self.controller.unavailable_pieces()
+        if not missing:
+            self.unsupplied_since = None
+            return
+
+        if self.unsupplied_since is None:
+            self.unsupplied_since = now
+        elif now - max(self.unsupplied_since, self.last_progress) >= self.SUPPLY_TIMEOUT:
+            print(f"No connected peer has {len(missing)} missing pieces, download aborted")
+            log_message(f"Download aborted, pieces without any peer: {missing[:20]}")
+            self.failed = True
+            self.finished.set()
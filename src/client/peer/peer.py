@@ -1,16 +1,98 @@
+import math
 import socket
 import struct
+import threading
+import time
 from client.messages import Request
-from client.messages import Piece
-from typing import List, Optional
+from client.messages import Handshake, Have, BitField, Cancel, Interested, Choke, Unchoke, Piece
+from client.peer.block import BLOCK_SIZE
+from client.peer.bitfield import Bitfield
+from client.peer.peer_stats import PeerStats
+from common.framing import HEADER, FrameReader
+from typing import Callable, Dict, List, Optional, Tuple
+
+# callback(piece_index, block_offset, block, error)
+BlockCallback = Callable[[int, int, Optional[bytes], Optional[Exception]], None]
+
+
+class PeerChoked(Exception):
+    """The peer choked us, the requests it hadn't answered are discarded"""
+
+
+class PendingRequest:
+    def __init__(self, piece_index: int, block_offset: int, block_length: int, callback: BlockCallback):
+        self.piece_index = piece_index
+        self.block_offset = block_offset
+        self.block_length = block_length
+        self.callback = callback
+        self.sent_at = time.monotonic()
+
 
 class Peer:
-    def __init__(self, peer_id, ip, port):
+    """
+    Connection with a remote peer.
+
+    Block requests are pipelined: up to `pipeline_depth` `Request` messages can
+    be outstanding at once and a receiver thread matches every `Piece` back to
+    its request by (index, offset). The depth follows the bandwidth-delay
+    product measured on the connection, so high-latency links keep enough
+    requests in flight to stay busy.
+
+    Messages are read through a FrameReader. Blocks are read with `recv_into` straight into the
+    buffer of their piece, which the listener hands out with
+    `block_buffer`. Blocks nobody expects (cancelled, endgame duplicates) go
+    to a scratch buffer of the connection.
+
+    Requests are only sent while the peer has us unchoked. `start` declares
+    interest, a `Choke` fails the outstanding requests (the peer drops
+    them) and an `Unchoke` tells the listener the peer takes requests again.
+    """
+
+    # Larger messages (other than Piece) mean a broken or hostile peer
+    MAX_MESSAGE_LENGTH = 1 << 20
+
+    def __init__(self, peer_id, ip, port, min_pipeline=2, max_pipeline=64):
         self.id = peer_id
         self.ip = ip
         self.port = port
         self.socket = None
-        self.blocked = False
+        self.reader: Optional[FrameReader] = None
+
+        self.min_pipeline = min_pipeline
+        self.max_pipeline = max_pipeline
+        self.pipeline_depth = min_pipeline
+        self.inflight: Dict[Tuple[int, int], PendingRequest] = {}
+        self.cond = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.closed = False
+        self._receiver = None
+        self._scratch = bytearray(BLOCK_SIZE)
+
+        # Pieces the peer announced with BitField/Have
+        self.bitfield: Optional[Bitfield] = None
+        # Peers start choking us until they give us an upload slot
+        self.choked = True
+        # Object notified of on_bitfield(peer), on_have(peer, index),
+        # on_unchoke(peer) and on_peer_closed(peer) that also provides
+        # block_buffer(peer, index, begin, length) and
+        # release_block_buffer(peer, index, begin), usually the download engine
+        self.listener = None
+
+        # Measurements used to size the pipeline and rank the peer
+        self.stats = PeerStats()
+
+    @property
+    def blocked(self) -> bool:
+        """
+        True when the pipeline is full and the peer can't take more requests.
+        """
+        return self.closed or self.choked or len(self.inflight) >= self.pipeline_depth
+
+    def free_slots(self) -> int:
+        with self.cond:
+            if self.closed or self.choked or self.stats.in_backoff(time.monotonic()):
+                return 0
+            return max(self.pipeline_depth - len(self.inflight), 0)
 
     def connect(self):
         """
@@ -21,73 +103,299 @@ class Peer:
             self.socket.settimeout(5)
             print(f"log comenzo conexion con peer {self.id}")
             self.socket.connect((self.ip, self.port))
+            self.socket.settimeout(None)
+            # Requests and Have are tiny, don't hold them back waiting for ACKs (Nagle)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.reader = FrameReader(self.socket, max_frame_size=self.MAX_MESSAGE_LENGTH)
             print(f"log Connected to peer {self.id} at {self.ip}:{self.port}")
         except socket.timeout:
             raise TimeoutError(f"Connection to peer {self.id} timed out")
         except Exception as e:
             raise ConnectionError(f"Error connecting to peer {self.id}: {e}")
-        
+
+    def handshake(self, info_hash: bytes, number_of_pieces: int):
+        """
+        Exchange handshakes with the peer. Must be called before `start`.
+
+        Args:
+            info_hash (bytes): 20-byte info hash of the torrent.
+            number_of_pieces (int): Number of pieces of the torrent.
+        """
+        self.send_message(Handshake(info_hash=info_hash).to_bytes())
+
+        try:
+            reply = self.reader.read_exact(Handshake.LENGTH)
+        except ConnectionError:
+            raise ConnectionError(f"Peer {self.id} closed the connection during the handshake")
+
+        remote_info_hash, _ = Handshake.from_bytes(bytes(reply))
+        if remote_info_hash != info_hash:
+            raise ConnectionError(f"Peer {self.id} answered with a different info hash")
+
+        self.bitfield = Bitfield(number_of_pieces)
+
+    def start(self):
+        """
+        Start the thread that receives the responses of the pipelined
+        requests and ask the peer for an upload slot.
+        """
+        self.stats.reset_sample(time.monotonic())
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+        try:
+            self.send_message(Interested().to_bytes())
+        except IOError as e:
+            self._fail(e)
+
     def receive_message(self) -> Optional[bytes]:
         """
         Receive a message from the peer.
         """
         try:
-            header = self.socket.recv(4)
-            if not header:
-                return None
-            
-            payload_len = struct.unpack(">I", header)[0]
-            message = self.socket.recv(payload_len)
-            return header + message
+            message = self.reader.read_frame()
+            return None if message is None else bytes(message)
         except Exception as e:
             raise IOError(f"Error receiving message from peer {self.id}: {e}")
-        
+
     def send_message(self, message):
         """
         Send a message to the peer.
         """
         try:
-            self.socket.send(message)
-            print(f"Message sent to peer {self.id}")
+            with self.send_lock:
+                self.socket.sendall(message)
         except Exception as e:
             raise IOError(f"Error sending message to peer {self.id}: {e}")
 
+    def request_block(self, index: int, begin: int, length: int, callback: BlockCallback) -> bool:
+        """
+        Queue a `Request` for a block without waiting for the answer.
+        `callback` runs on the receiver thread once the block arrives or the
+        connection fails.
+
+        Returns:
+            bool: False if the pipeline is full and nothing was sent.
+        """
+        with self.cond:
+            if self.blocked or (index, begin) in self.inflight:
+                return False
+            self.inflight[(index, begin)] = PendingRequest(index, begin, length, callback)
+
+        try:
+            self.send_message(Request(index, begin, length).to_bytes())
+        except IOError as e:
+            with self.cond:
+                self.inflight.pop((index, begin), None)
+            self._fail(e)
+            return False
+        return True
+
+    def cancel(self, index: int, begin: int, length: int) -> bool:
+        """
+        Withdraw an outstanding request. Its callback won't run and a `Cancel`
+        tells the peer not to send the block if it hasn't yet.
+
+        Returns:
+            bool: True if the request was outstanding and a Cancel was sent.
+        """
+        with self.cond:
+            if self.inflight.pop((index, begin), None) is None:
+                return False
+            self.cond.notify_all()
+
+        try:
+            self.send_message(Cancel(index, begin, length).to_bytes())
+        except IOError as e:
+            self._fail(e)
+            return False
+        return True
+
     def request_piece(self, index: int, begin: int, length: int):
         """
-        Request a piece from the peer.
-        
+        Request a block from the peer and wait for it. Waits for a free slot
+        if the pipeline is full, other requests keep flowing meanwhile.
+
         Response format: <len=0009+X><id=7><index><begin><block>
         """
+        done = threading.Event()
+        result = {}
+
+        def on_block(piece_index, block_offset, block, error):
+            # The block may live in a buffer that is reused after the callback
+            result["block"] = bytes(block) if block is not None else None
+            result["error"] = error
+            done.set()
+
+        while not self.request_block(index, begin, length, on_block):
+            with self.cond:
+                if self.closed:
+                    raise IOError(f"Error requesting piece {index} from peer {self.id}: connection closed")
+                self.cond.wait(1.0)
+
+        done.wait()
+        if result["error"] is not None:
+            raise IOError(f"Error requesting piece {index} from peer {self.id}: {result['error']}")
+        return result["block"]
+
+    def _receive_loop(self):
+        reader = self.reader
         try:
-            # Formato del mensaje request: <len=0013><id=6><index><begin><length>
-            self.blocked = True
-
-            message = Request(index, begin, length).to_bytes()
-            self.socket.send(message)
-            
-            response = self.receive_message()
-            
-            if not response:
-                raise ConnectionError(f"Peer {self.id} closed the connection")
-            
-            piece_index, block_offset, block = Piece.from_bytes(response)
-            
-            if piece_index != index or block_offset != begin:
-                raise IOError(f"Invalid piece received from peer {self.id}")
-            
-            self.blocked = False
-            
-            return block
-            
+            while not self.closed:
+                length = HEADER.unpack(reader.peek(HEADER.size))[0]
+                self.stats.on_message(time.monotonic())
+
+                if length > 0 and reader.peek(HEADER.size + 1)[HEADER.size] == Piece.message_id:
+                    # Blocks don't go through the frame buffer
+                    reader.read_exact(HEADER.size + 1)
+                    self._receive_piece(length - 1)
+                    continue
+
+                frame = reader.read_frame()
+                if length == 0:
+                    continue
+                message_id = frame[HEADER.size]
+                if message_id == Have.message_id:
+                    self._on_have(Have.from_bytes(frame))
+                elif message_id == Choke.message_id:
+                    self._on_choke(Choke.from_bytes(frame))
+                elif message_id == Unchoke.message_id:
+                    self._on_unchoke(Unchoke.from_bytes(frame))
+                elif message_id == BitField.message_id:
+                    self._on_bitfield(BitField.from_bytes(frame))
+                # Keep-alives and unknown messages are dropped
         except Exception as e:
-            raise IOError(f"Error requesting piece {index} from peer {self.id}: {e}")
-    
+            self._fail(e)
+
+    def _receive_piece(self, length: int):
+        """
+        Read the rest of a Piece message (<index><begin><block>), putting the
+        block where the listener wants it.
+        """
+        piece_index, block_offset = struct.unpack(">II", self.reader.read_exact(8))
+        block_length = length - 8
+        if not 0 < block_length <= self.MAX_MESSAGE_LENGTH:
+            raise ValueError(f"Peer {self.id} sent a block of {block_length} bytes")
+
+        with self.cond:
+            expected = (piece_index, block_offset) in self.inflight
+
+        target = None
+        if expected and self.listener:
+            target = self.listener.block_buffer(self, piece_index, block_offset, block_length)
+        in_place = target is not None
+        if not in_place:
+            if len(self._scratch) < block_length:
+                self._scratch = bytearray(block_length)
+            target = memoryview(self._scratch)[:block_length]
+
+        try:
+            self.reader.read_into(target)
+            delivered = self._on_piece(piece_index, block_offset, target)
+        except BaseException:
+            if in_place:
+                self.listener.release_block_buffer(self, piece_index, block_offset)
+            raise
+
+        if in_place and not delivered:
+            self.listener.release_block_buffer(self, piece_index, block_offset)
+
+    def _on_piece(self, piece_index, block_offset, block) -> bool:
+        now = time.monotonic()
+        with self.cond:
+            pending = self.inflight.pop((piece_index, block_offset), None)
+            if pending is None:
+                # Not requested or already given up, nothing waits for it
+                return False
+            self._update_measurements(now - pending.sent_at, len(block), now)
+            self.cond.notify_all()
+
+        pending.callback(piece_index, block_offset, block, None)
+        return True
+
+    def _on_bitfield(self, message: BitField):
+        self.bitfield = Bitfield.from_bytes(message.bitfield, len(self.bitfield))
+        if self.listener:
+            self.listener.on_bitfield(self)
+
+    def _on_have(self, message: Have):
+        piece_index = message.piece_index
+        if piece_index >= len(self.bitfield) or self.bitfield[piece_index]:
+            return
+        self.bitfield[piece_index] = True
+        if self.listener:
+            self.listener.on_have(self, piece_index)
+
+    def _on_choke(self, message: Choke = None):
+        with self.cond:
+            self.choked = True
+            pending: List[PendingRequest] = list(self.inflight.values())
+            self.inflight.clear()
+            self.cond.notify_all()
+
+        error = PeerChoked(f"Peer {self.id} choked us")
+        for p in pending:
+            p.callback(p.piece_index, p.block_offset, None, error)
+
+    def _on_unchoke(self, message: Unchoke = None):
+        with self.cond:
+            self.choked = False
+            self.cond.notify_all()
+        if self.listener:
+            self.listener.on_unchoke(self)
+
+    def _update_measurements(self, rtt, nbytes, now):
+        self.stats.on_block(rtt, nbytes, now)
+        self._adjust_pipeline()
+
+    def _adjust_pipeline(self):
+        """
+        Size the pipeline to the bandwidth-delay product plus some slack.
+        The minimum RTT is used because the smoothed one includes the time
+        requests spend queued behind our own pipeline, and would keep
+        inflating the depth. Until a throughput sample exists the depth grows
+        by one per answer.
+        """
+        if self.stats.throughput and self.stats.min_rtt:
+            depth = int(math.ceil(self.stats.throughput * self.stats.min_rtt / BLOCK_SIZE)) + 2
+        else:
+            depth = self.pipeline_depth + 1
+        self.pipeline_depth = max(self.min_pipeline, min(self.max_pipeline, depth))
+
+    def _fail(self, error: Exception):
+        """
+        Give up every outstanding request, their callbacks get the error.
+        """
+        with self.cond:
+            if self.closed and not self.inflight:
+                return
+            first_failure = not self.closed
+            if first_failure:
+                self.stats.on_error(time.monotonic())
+            self.closed = True
+            pending: List[PendingRequest] = list(self.inflight.values())
+            self.inflight.clear()
+            self.cond.notify_all()
+
+        for p in pending:
+            p.callback(p.piece_index, p.block_offset, None, error)
 
+        if first_failure and self.listener:
+            self.listener.on_peer_closed(self)
 
     def close(self):
         """
         Close the connection with the peer.
         """
         if self.socket:
-            self.socket.close()
+            self._fail(ConnectionError(f"Connection closed with peer {self.id}"))
+            try:
+                # Wakes the receiver thread up, close() alone leaves the
+                # connection open while it is blocked in recv
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self.socket.close()
+            except OSError:
+                pass
             print(f"Connection closed with peer {self.id}")
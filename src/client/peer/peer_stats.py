@@ -0,0 +1,116 @@
+import time
+from typing import Optional
+
+
+class PeerStats:
+    """
+    Running statistics of a peer connection, used to size its request
+    pipeline and to rank it against the other peers of a download.
+
+    - throughput: EWMA of the download rate in bytes/s, sampled every
+      `SAMPLE_INTERVAL` seconds (idle intervals count as 0 B/s).
+    - rtt / min_rtt: EWMA and minimum of the request -> block latency.
+    - error_rate: EWMA of request outcomes, 1 for an error and 0 for a block.
+    - last_seen: monotonic time of the last message received.
+
+    A peer that errors is put in backoff for an exponentially growing time,
+    reset by the next block it delivers. Only request timeouts matter for
+    scheduling: while in backoff `Peer.free_slots` is 0 and the download
+    engine keeps the peer parked. A connection failure is just counted, the
+    peer is closed by then.
+    """
+
+    EWMA_ALPHA = 0.2
+    SAMPLE_INTERVAL = 0.5
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 60.0
+
+    def __init__(self):
+        now = time.monotonic()
+        self.throughput = 0.0
+        self.rtt: Optional[float] = None
+        self.min_rtt: Optional[float] = None
+        self.error_rate = 0.0
+        self.last_seen = now
+
+        self.blocks = 0
+        self.errors = 0
+        # Blocks that didn't match their hash (Merkle metadata)
+        self.corrupt_blocks = 0
+        self.bytes_downloaded = 0
+        self.consecutive_errors = 0
+        self.backoff_until = 0.0
+        # Since when the peer has been considered slow by the scheduler
+        self.slow_since: Optional[float] = None
+
+        self._sample_bytes = 0
+        self._sample_start = now
+
+    def _ewma(self, current, sample):
+        return (1 - self.EWMA_ALPHA) * current + self.EWMA_ALPHA * sample
+
+    def reset_sample(self, now: float):
+        self._sample_bytes = 0
+        self._sample_start = now
+
+    def on_message(self, now: float):
+        self.last_seen = now
+
+    def on_block(self, rtt: float, nbytes: int, now: float):
+        self.blocks += 1
+        self.bytes_downloaded += nbytes
+        self.last_seen = now
+        self.consecutive_errors = 0
+        self.backoff_until = 0.0
+        self.error_rate = self._ewma(self.error_rate, 0.0)
+
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        self.rtt = rtt if self.rtt is None else self._ewma(self.rtt, rtt)
+
+        self._sample_bytes += nbytes
+        self.tick(now)
+
+    def on_error(self, now: float):
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.error_rate = self._ewma(self.error_rate, 1.0)
+        backoff = min(self.BACKOFF_BASE * 2 ** (self.consecutive_errors - 1), self.BACKOFF_MAX)
+        self.backoff_until = now + backoff
+
+    def on_corrupt_block(self, now: float):
+        self.corrupt_blocks += 1
+        self.on_error(now)
+
+    def tick(self, now: float):
+        """
+        Close the current throughput sample if it is old enough.
+        """
+        elapsed = now - self._sample_start
+        if elapsed >= self.SAMPLE_INTERVAL:
+            rate = self._sample_bytes / elapsed
+            self.throughput = rate if not self.throughput else self._ewma(self.throughput, rate)
+            self.reset_sample(now)
+
+    def in_backoff(self, now: float) -> bool:
+        return now < self.backoff_until
+
+    def score(self) -> float:
+        """
+        Expected useful bytes/s from the peer.
+        """
+        return self.throughput * (1.0 - self.error_rate)
+
+    def dict(self):
+        now = time.monotonic()
+        return {
+            "throughput_kib_s": round(self.throughput / 1024, 1),
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "last_seen_s": round(now - self.last_seen, 1),
+            "score": round(self.score() / 1024, 1),
+            "blocks": self.blocks,
+            "errors": self.errors,
+            "corrupt": self.corrupt_blocks,
+            "backoff_s": round(max(self.backoff_until - now, 0.0), 1),
+        }
@@ -1,92 +1,134 @@
-from client.peer.block import Block, BLOCK_SIZE, State
+from client.peer.block import BLOCK_SIZE, State
 import math
-from typing import List
+from typing import Optional
 import hashlib
 
 class Piece:
-    def __init__(self, piece_index, piece_size, piece_hash, piece_torrent_size=None):
+    """
+    Piece being downloaded: its buffer and the running hash of its blocks.
+    Only pieces in progress have one, the state of every block of the
+    torrent lives in the PieceController and `states` is this piece's slice
+    of it.
+    """
+
+    __slots__ = ("piece_index", "piece_size", "piece_hash", "piece_torrent_size", "num_blocks",
+                 "states", "is_downloaded", "buffer", "_hasher", "_hashed_blocks", "_downloaded_blocks")
+
+    def __init__(self, piece_index, piece_size, piece_hash: bytes, piece_torrent_size, states: memoryview):
         self.piece_index = piece_index
         self.piece_size = piece_size
+        # 20-byte SHA-1 digest
         self.piece_hash = piece_hash
         self.is_downloaded = False
-        self.raw_data: bytes = b""
-        
+
         # For the last piece
         self.piece_torrent_size = piece_torrent_size
-        
+
         self.num_blocks: int = int(math.ceil(piece_size / BLOCK_SIZE))
-        self.blocks: List[Block] = []
-        
-        self._init_blocks()
-        
-    def _init_blocks(self):
-        for i in range(self.num_blocks):
-            block_size = BLOCK_SIZE
-            if i == self.num_blocks - 1:
-                block_size = self.piece_size % BLOCK_SIZE
-                if block_size == 0:
-                    block_size = BLOCK_SIZE
-                    
-            self.blocks.append(Block(block_size=block_size))
-        
-        if self.num_blocks == 1:
-            self.blocks[0].block_size = self.piece_size
-            
-    def set_block(self, block_index: int, data: bytes):
-        # block_index = offset // BLOCK_SIZE
-        if block_index >= len(self.blocks): 
+        self.states = states
+
+        # Blocks are received straight into this buffer (see attach_buffer)
+        self.buffer: Optional[bytearray] = None
+        # SHA-1 of the contiguous prefix of downloaded blocks
+        self._hasher = hashlib.sha1()
+        self._hashed_blocks = 0
+        self._downloaded_blocks = 0
+
+    def block_size(self, block_index: int) -> int:
+        if block_index == self.num_blocks - 1:
+            return self.piece_size - block_index * BLOCK_SIZE
+        return BLOCK_SIZE
+
+    def attach_buffer(self, buffer: bytearray):
+        """
+        Give the piece the buffer its blocks are assembled in. It may be
+        larger than the piece (last piece, pooled buffers).
+        """
+        self.buffer = buffer
+
+    def detach_buffer(self) -> Optional[bytearray]:
+        """
+        Take the buffer back once the piece is written so it can be reused.
+        """
+        buffer, self.buffer = self.buffer, None
+        return buffer
+
+    def block_view(self, block_index: int) -> memoryview:
+        """
+        Region of the piece buffer where a block goes.
+        """
+        start = block_index * BLOCK_SIZE
+        return memoryview(self.buffer)[start:start + self.block_size(block_index)]
+
+    def set_block(self, block_index: int, data=None):
+        """
+        Mark a block as downloaded. `data` is copied into the piece buffer,
+        pass None if the block was already received in place (block_view).
+        """
+        if block_index >= self.num_blocks:
             raise ValueError(f"Block index {block_index} out of range")
-        # if len(data) > block.block_size:
-        #     data = data[:block.block_size]
-
-        
-        if not self.is_downloaded and not self.blocks[block_index].state == State.DOWNLOADED:
-            print(f"Setting block {block_index} with size {len(data)}, piece {self.piece_index}")
-            self.blocks[block_index].data = data
-            self.blocks[block_index].state = State.DOWNLOADED
-                
+
+        if self.is_downloaded or self.states[block_index] == State.DOWNLOADED:
+            return
+
+        if data is not None:
+            if len(data) != self.block_size(block_index):
+                raise ValueError(f"Block {block_index} of piece {self.piece_index} has {len(data)} bytes, expected {self.block_size(block_index)}")
+            self.block_view(block_index)[:] = data
+        self.states[block_index] = State.DOWNLOADED
+        self._downloaded_blocks += 1
+        self._hash_prefix()
+
+    def _hash_prefix(self):
+        """
+        Feed the hash with every block that extends the contiguous prefix, so
+        by the time the last block lands most of the piece is already hashed.
+        """
+        while self._hashed_blocks < self.num_blocks and self.states[self._hashed_blocks] == State.DOWNLOADED:
+            self._hasher.update(self.block_view(self._hashed_blocks))
+            self._hashed_blocks += 1
+
     def is_complete(self) -> bool:
-        return all([block.state == State.DOWNLOADED for block in self.blocks])
-    
-    def _merge_blocks(self) -> bytes:
-        return b"".join([block.data for block in self.blocks])
-    
-    def _validate_piece(self, data) -> bool:
-        hash_piece = hashlib.sha1(data).digest().hex()
-        
-        if hash_piece == self.piece_hash:
+        return self._downloaded_blocks == self.num_blocks
+
+    def _validate_piece(self) -> bool:
+        self._hash_prefix()
+        hash_piece = self._hasher.digest()
+
+        if self._hashed_blocks == self.num_blocks and hash_piece == self.piece_hash:
             print(f"Integrity check passed for piece {self.piece_index}")
-            return True 
-        
-        print(f"Expected hash: {self.piece_hash}")
-        print(f"Calculated hash: {hash_piece}")
-        
+            return True
+
+        print(f"Expected hash: {self.piece_hash.hex()}")
+        print(f"Calculated hash: {hash_piece.hex()}")
+
         return False
-    
+
     def set_total_data(self):
-        data = self._merge_blocks()
-        
-        if not self._validate_piece(data):
+        if not self._validate_piece():
             return False
-        
+
         self.is_downloaded = True
-        self.raw_data = data
-        
         return True
-        
-    def save_piece(self, path):
-        try:
-            f = open(path, "r+b")
-        except IOError:
-            f = open(path, "wb")
-        except Exception as e:
-            print(f"Error saving piece {self.piece_index}: {e}")
-            return False
-        
-        offset = self.piece_index * self.piece_torrent_size
-        
-        f.seek(offset)
-            
-        f.write(self.raw_data[:self.piece_size])
-        f.close()
 
+    def reset(self):
+        """
+        Forget every block, the buffer is kept to download the piece again.
+        """
+        self.is_downloaded = False
+        self._hasher = hashlib.sha1()
+        self._hashed_blocks = 0
+        self._downloaded_blocks = 0
+        self.states[:] = bytes(self.num_blocks)
+
+    def save_piece(self, writer, callback=None):
+        """
+        Queue the validated piece to be written at its offset in the file.
+        The buffer must not be touched until the callback runs.
+
+        Args:
+            writer (DiskWriter): Output file of the download.
+            callback: Called as callback(offset, error) once the piece is written.
+        """
+        offset = self.piece_index * self.piece_torrent_size
+        writer.write(offset, memoryview(self.buffer)[:self.piece_size], callback)
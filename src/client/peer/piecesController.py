@@ -1,53 +1,468 @@
+import hashlib
 import math
-import os
-from typing import List
+import random
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
 from threading import Lock
 
-from client.peer.block import Block, BLOCK_SIZE, State
+from client.peer.bitfield import Bitfield
+from client.peer.block import BlockRequests, BLOCK_SIZE, State
+from client.peer.buffer_pool import BufferPool
 from client.peer.piece import Piece
+from torrents.merkle import merkle_root
 from torrents.torrent_info import TorrentInfo
+from common.logs import log_message
+
+
+class CorruptBlockError(Exception):
+    """A block didn't match its hash from the Merkle metadata"""
+
 
 class PieceController:
-    def __init__(self, torrent: TorrentInfo, path: str):
+    """
+    Download state of a torrent.
+
+    The state is kept in flat arrays so big torrents don't turn into millions
+    of Python objects: one byte per block (State) in `_states`, the packed
+    20-byte digests of the pieces, a Bitfield of the pieces on disk (sent as
+    is in BitField messages) and `array`s for availability and rarest-first
+    bookkeeping. Per-piece and per-block objects only exist while a piece is
+    being downloaded (`active`) or a block has outstanding requests
+    (`inflight`).
+
+    If the torrent carries per-block hashes (Merkle metadata) every block is
+    verified as it arrives, so corruption is detected before the piece is
+    complete and blamed on the peer that sent the block.
+    """
+
+    def __init__(self, torrent: TorrentInfo, path: str, buffers: int = 32):
         self.torrent = torrent
-        self.pieces: List[Piece] = []
         self.number_of_pieces = int(math.ceil(torrent.length / torrent.piece_length))
-        self.bitfield = [False] * self.number_of_pieces
+        self.bitfield = Bitfield(self.number_of_pieces)
         self.output_path = path
         self.lock = Lock()
-        
-        self._generate_pieces()
-        
-    def _generate_pieces(self):
-        
-        for i in range(self.number_of_pieces):
-            start = i * 40
-            end = start + 40
-            
-            if i == self.number_of_pieces - 1:
-                piece_size = self.torrent.length - (self.torrent.piece_length * i)
-                self.pieces.append(Piece(i, piece_size, self.torrent.pieces[start:], self.torrent.piece_length))
-                
-            else:
-                self.pieces.append(Piece(i, self.torrent.piece_length, self.torrent.pieces[start:end], self.torrent.piece_length))
-                
-        return self.pieces
-    
+
+        self.piece_length = torrent.piece_length
+        self.blocks_per_piece = int(math.ceil(torrent.piece_length / BLOCK_SIZE))
+        self.digests = torrent.piece_digests()
+        if len(self.digests) != 20 * self.number_of_pieces:
+            raise ValueError(f"Expected {self.number_of_pieces} piece hashes, got {len(self.digests) / 20}")
+
+        self.block_digests = torrent.block_digests()
+        if self.block_digests is not None and len(self.block_digests) != 20 * self._total_blocks():
+            log_message(f"Ignoring block hashes of {torrent.name}: expected {self._total_blocks()}, got {len(self.block_digests) // 20}")
+            self.block_digests = None
+        elif self.block_digests is not None and merkle_root(self.block_digests).hex() != torrent.merkle_root:
+            log_message(f"Ignoring block hashes of {torrent.name}: they don't match the Merkle root")
+            self.block_digests = None
+
+        # State of every block, piece i owns [i * blocks_per_piece, i * blocks_per_piece + num_blocks(i))
+        self._states = bytearray(self.number_of_pieces * self.blocks_per_piece)
+        self._states_view = memoryview(self._states)
+
+        # Pieces in progress, with their buffer and running hash
+        self.active: Dict[int, Piece] = {}
+
+        # Piece buffers, recycled once a piece is written
+        self.buffers = BufferPool(torrent.piece_length, capacity=buffers)
+
+        # Number of connected peers that have each piece (from BitField/Have)
+        self.availability = array("i", bytes(4 * self.number_of_pieces))
+
+        # Pieces not started yet, bucketed by availability for rarest-first.
+        # _bucket_pos keeps the position of a piece inside its bucket (-1 once
+        # started) so it can be moved between buckets in O(1).
+        self._buckets: Dict[int, List[int]] = {0: list(range(self.number_of_pieces))}
+        self._bucket_pos = array("i", range(self.number_of_pieces))
+        self._unstarted = self.number_of_pieces
+
+        # Pieces started with blocks that haven't been handed out yet
+        self._partial: List[int] = []
+
+        # Blocks with at least one outstanding request, by (piece_index, block_index)
+        self.inflight: Dict[Tuple[int, int], BlockRequests] = {}
+        self.duplicate_blocks = 0
+        self.duplicate_bytes = 0
+        self.timeouts = 0
+        self.corrupt_blocks = 0
+
+    # =============================
+    # Geometry
+    # =============================
+
+    def piece_size(self, piece_index: int) -> int:
+        if piece_index == self.number_of_pieces - 1:
+            return self.torrent.length - self.piece_length * piece_index
+        return self.piece_length
+
+    def num_blocks(self, piece_index: int) -> int:
+        return int(math.ceil(self.piece_size(piece_index) / BLOCK_SIZE))
+
+    def block_size(self, piece_index: int, block_index: int) -> int:
+        if block_index == self.num_blocks(piece_index) - 1:
+            return self.piece_size(piece_index) - block_index * BLOCK_SIZE
+        return BLOCK_SIZE
+
+    def _total_blocks(self) -> int:
+        return (self.number_of_pieces - 1) * self.blocks_per_piece + self.num_blocks(self.number_of_pieces - 1)
+
+    def block_matches(self, piece_index: int, block_index: int, data) -> bool:
+        """
+        Check a block against its leaf hash, True if there are none.
+        """
+        if self.block_digests is None:
+            return True
+        start = 20 * (piece_index * self.blocks_per_piece + block_index)
+        return hashlib.sha1(data).digest() == self.block_digests[start:start + 20]
+
+    def piece_digest(self, piece_index: int) -> bytes:
+        return self.digests[20 * piece_index:20 * (piece_index + 1)]
+
+    def _block_range(self, piece_index: int) -> Tuple[int, int]:
+        start = piece_index * self.blocks_per_piece
+        return start, start + self.num_blocks(piece_index)
+
+    def block_state(self, piece_index: int, block_index: int) -> State:
+        return State(self._states[piece_index * self.blocks_per_piece + block_index])
+
+    def _set_state(self, piece_index: int, block_index: int, state: State):
+        self._states[piece_index * self.blocks_per_piece + block_index] = state
+
+    def _active_piece(self, piece_index: int) -> Piece:
+        piece = self.active.get(piece_index)
+        if piece is None:
+            start, end = self._block_range(piece_index)
+            piece = Piece(piece_index, self.piece_size(piece_index), self.piece_digest(piece_index),
+                          self.piece_length, self._states_view[start:end])
+            self.active[piece_index] = piece
+        return piece
+
     def is_complete(self) -> bool:
-        return all([piece.is_downloaded for piece in self.pieces])
-    
-    def receive_block(self, piece_index: int, block_index: int, data: bytes):
+        return self.bitfield.all()
+
+    def receive_block(self, piece_index: int, block_index: int, data, peer=None):
+        """
+        Store a block received from a peer and close every request for it.
+        If the peer received it in place (block_buffer) nothing is copied.
+
+        Returns:
+            (completed, others): `completed` is True if the block completed its
+            piece, which is then ready to be validated and saved. `others` are
+            the peers that still had a request for the block (endgame
+            duplicates) and should get a Cancel.
+        Raises:
+            CorruptBlockError: The block doesn't match its hash. Only the
+            request of this peer is dropped, other copies keep coming.
+        """
+        # Hashing outside the lock, the data can't change: it is either in
+        # the scratch buffer of the peer's receiver thread or in a region of
+        # the piece buffer reserved for it
+        if not self.block_matches(piece_index, block_index, data):
+            with self.lock:
+                self.corrupt_blocks += 1
+                entry = self.inflight.get((piece_index, block_index))
+                if entry is not None and entry.receiver is peer:
+                    entry.receiver = None
+                self._release(piece_index, block_index, peer)
+            raise CorruptBlockError(f"Block {block_index} of piece {piece_index} doesn't match its hash")
+
+        with self.lock:
+            entry = self.inflight.pop((piece_index, block_index), None)
+            in_place = False
+            others = []
+            if entry is not None:
+                in_place = peer is not None and entry.receiver is peer
+                others = [p for p in entry.requests if p is not peer]
+
+            piece = self.active.get(piece_index)
+            if piece is None or self.block_state(piece_index, block_index) == State.DOWNLOADED:
+                self.duplicate_blocks += 1
+                self.duplicate_bytes += len(data)
+                return False, others
+
+            if piece.buffer is None:
+                piece.attach_buffer(self.buffers.acquire())
+            piece.set_block(block_index, None if in_place else data)
+            return piece.is_complete(), others
+
+    def block_buffer(self, piece_index: int, block_index: int, peer, length: int) -> Optional[memoryview]:
+        """
+        Region of the piece buffer a peer can receive a block into directly.
+        Only the single peer downloading a block gets it; endgame duplicates,
+        blocks we don't expect and blocks already downloaded return None and
+        are received into the peer's scratch buffer instead. The region is
+        reserved for the peer until receive_block or release_block_buffer.
+        """
+        with self.lock:
+            entry = self.inflight.get((piece_index, block_index))
+            if (entry is None or entry.receiver is not None or len(entry.requests) != 1
+                    or peer not in entry.requests or self.block_size(piece_index, block_index) != length):
+                return None
+
+            piece = self.active[piece_index]
+            if piece.buffer is None:
+                piece.attach_buffer(self.buffers.acquire())
+            entry.receiver = peer
+            return piece.block_view(block_index)
+
+    def release_block_buffer(self, piece_index: int, block_index: int, peer):
+        """
+        The peer won't deliver the block it was receiving in place (cancelled
+        or connection lost), the region can be written by others again.
+        """
+        with self.lock:
+            entry = self.inflight.get((piece_index, block_index))
+            if entry is not None and entry.receiver is peer:
+                entry.receiver = None
+
+    def piece_written(self, piece_index: int):
+        """
+        The piece is on disk: record it in the bitfield, drop its state and
+        give its buffer back to the pool.
+        """
+        with self.lock:
+            self.bitfield[piece_index] = True
+            piece = self.active.pop(piece_index, None)
+        if piece is not None:
+            buffer = piece.detach_buffer()
+            if buffer is not None:
+                self.buffers.release(buffer)
+
+    # =============================
+    # Availability
+    # =============================
+
+    def add_peer_bitfield(self, peer_bitfield: Bitfield):
+        with self.lock:
+            for i in peer_bitfield.ones():
+                self._change_availability(i, 1)
+
+    def remove_peer_bitfield(self, peer_bitfield: Bitfield):
+        with self.lock:
+            for i in peer_bitfield.ones():
+                self._change_availability(i, -1)
+
+    def add_have(self, piece_index: int):
+        with self.lock:
+            self._change_availability(piece_index, 1)
+
+    def unavailable_pieces(self) -> List[int]:
+        """
+        Missing pieces that no connected peer has announced.
+        """
+        with self.lock:
+            return [i for i in range(self.number_of_pieces)
+                    if not self.bitfield[i] and self.availability[i] <= 0]
+
+    def _change_availability(self, piece_index: int, delta: int):
+        old = self.availability[piece_index]
+        self.availability[piece_index] = old + delta
+
+        if self._bucket_pos[piece_index] >= 0:
+            self._bucket_remove(piece_index, old)
+            self._bucket_add(piece_index, old + delta)
+
+    def _bucket_add(self, piece_index: int, availability: int):
+        bucket = self._buckets.setdefault(availability, [])
+        self._bucket_pos[piece_index] = len(bucket)
+        bucket.append(piece_index)
+
+    def _bucket_remove(self, piece_index: int, availability: int):
+        bucket = self._buckets[availability]
+        pos = self._bucket_pos[piece_index]
+        self._bucket_pos[piece_index] = -1
+        last = bucket.pop()
+        if last != piece_index:
+            bucket[pos] = last
+            self._bucket_pos[last] = pos
+        if not bucket:
+            del self._buckets[availability]
+
+    def _start_piece(self, piece_index: int):
+        """
+        Take a piece out of the rarest-first buckets.
+        """
+        self._bucket_remove(piece_index, self.availability[piece_index])
+        self._unstarted -= 1
+
+    # =============================
+    # Scheduling
+    # =============================
+
+    def next_block(self, peer=None, deadline: float = math.inf):
+        """
+        Hand out the next block to download from a peer, mark it as
+        DOWNLOADING and assign it to the peer until `deadline`. Blocks of
+        pieces already started are served first so pieces complete (and can
+        be validated and written) as soon as possible. Otherwise a new piece
+        is started, choosing the rarest piece the peer has with random
+        tie-breaking.
+
+        Args:
+            peer: The peer that will download the block. Its `bitfield`
+                (Bitfield) tells the pieces it has, all if None.
+            deadline (float): Monotonic time after which the request expires.
+        Returns:
+            (piece_index, block_index, block_size) or None if the peer has
+            nothing left that we need.
+        """
+        peer_bitfield = getattr(peer, "bitfield", None)
+        with self.lock:
+            i = 0
+            while i < len(self._partial):
+                piece_index = self._partial[i]
+                if peer_bitfield is not None and not peer_bitfield[piece_index]:
+                    i += 1
+                    continue
+                start, end = self._block_range(piece_index)
+                position = self._states.find(State.EMPTY, start, end)
+                if position >= 0:
+                    block_index = position - start
+                    self._assign(piece_index, block_index, peer, deadline)
+                    return piece_index, block_index, self.block_size(piece_index, block_index)
+                # Every block of the piece has been handed out
+                self._partial.pop(i)
+
+            piece_index = self._rarest_piece(peer_bitfield)
+            if piece_index is None:
+                return None
+
+            self._start_piece(piece_index)
+            self._partial.append(piece_index)
+            self._assign(piece_index, 0, peer, deadline)
+            return piece_index, 0, self.block_size(piece_index, 0)
+
+    def _assign(self, piece_index: int, block_index: int, peer, deadline: float):
+        self._active_piece(piece_index)
+        self._set_state(piece_index, block_index, State.DOWNLOADING)
+        entry = self.inflight.setdefault((piece_index, block_index), BlockRequests())
+        entry.requests[peer] = (time.monotonic(), deadline)
+
+    def assign_duplicate(self, piece_index: int, block_index: int, peer, deadline: float = math.inf) -> bool:
+        """
+        Assign a block that is already being downloaded to one more peer
+        (endgame).
+        """
+        with self.lock:
+            entry = self.inflight.get((piece_index, block_index))
+            if entry is None or peer in entry.requests or entry.receiver is not None:
+                # Blocks being received right now are about to complete
+                return False
+            entry.requests[peer] = (time.monotonic(), deadline)
+            return True
+
+    def inflight_requests(self) -> List[Tuple[int, int, int]]:
+        """
+        Blocks being downloaded as (piece_index, block_index, number of peers).
+        """
+        with self.lock:
+            return [(piece_index, block_index, len(entry.requests))
+                    for (piece_index, block_index), entry in self.inflight.items()]
+
+    def release_block(self, piece_index: int, block_index: int, peer=None) -> bool:
+        """
+        Drop the request of a peer for a block (failed or cancelled). The
+        block goes back to the pool when no other peer is downloading it.
+
+        Returns:
+            bool: True if the block went back to the pool.
+        """
         with self.lock:
-            self.pieces[piece_index].set_block(block_index, data)
+            return self._release(piece_index, block_index, peer)
+
+    def _release(self, piece_index: int, block_index: int, peer) -> bool:
+        entry = self.inflight.get((piece_index, block_index))
+        if entry is None:
+            return False
+        entry.requests.pop(peer, None)
+        if entry.requests:
+            return False
+
+        del self.inflight[(piece_index, block_index)]
+        self._set_state(piece_index, block_index, State.EMPTY)
+        self._requeue(piece_index)
+        return True
+
+    def expire_requests(self, now: float) -> List[Tuple[int, int, object]]:
+        """
+        Drop every request whose deadline has passed and give its block back
+        to the pool if nobody else is downloading it.
 
-            if self.pieces[piece_index].is_complete():
-                self.pieces[piece_index].is_downloaded = True
-            
-    def get_empty_block(self, piece_index):
+        Returns:
+            The expired requests as (piece_index, block_index, peer).
+        """
+        expired = []
         with self.lock:
-            for i, block in enumerate(self.pieces[piece_index].blocks):
-                if block.state == State.EMPTY:
-                    # block.state = State.DOWNLOADING
-                    return piece_index, i, block
+            for (piece_index, block_index), entry in list(self.inflight.items()):
+                for peer, (_, deadline) in list(entry.requests.items()):
+                    # A block already arriving isn't late, and its region of
+                    # the buffer can't be handed to anyone else meanwhile
+                    if deadline <= now and peer is not entry.receiver:
+                        expired.append((piece_index, block_index, peer))
+                        self._release(piece_index, block_index, peer)
+            self.timeouts += len(expired)
+        return expired
+
+    def _rarest_piece(self, peer_bitfield: Optional[Bitfield]) -> Optional[int]:
+        for availability in sorted(self._buckets):
+            if availability <= 0 and peer_bitfield is not None:
+                # Nobody announced these pieces
+                continue
+
+            bucket = self._buckets[availability]
+            start = random.randrange(len(bucket))
+            for k in range(len(bucket)):
+                piece_index = bucket[(start + k) % len(bucket)]
+                if peer_bitfield is None or peer_bitfield[piece_index]:
+                    return piece_index
         return None
-    
\ No newline at end of file
+
+    def all_requested(self) -> bool:
+        """
+        True when every block still missing is already being downloaded.
+        """
+        with self.lock:
+            if self._unstarted:
+                return False
+            for piece_index in self._partial:
+                start, end = self._block_range(piece_index)
+                if self._states.find(State.EMPTY, start, end) >= 0:
+                    return False
+            return True
+
+    def restore(self, bitfield: Iterable[bool]) -> int:
+        """
+        Take the pieces already on disk (fast-resume or recheck) as
+        downloaded so they aren't requested again.
+
+        Returns:
+            int: Number of pieces restored.
+        """
+        restored = 0
+        with self.lock:
+            for piece_index, has in enumerate(bitfield):
+                if not has or self.bitfield[piece_index]:
+                    continue
+                start, end = self._block_range(piece_index)
+                self._states[start:end] = bytes([State.DOWNLOADED]) * (end - start)
+                if self._bucket_pos[piece_index] >= 0:
+                    self._start_piece(piece_index)
+                self.bitfield[piece_index] = True
+                restored += 1
+        return restored
+
+    def reset_piece(self, piece_index: int):
+        """
+        Discard every block of a piece that failed validation.
+        """
+        with self.lock:
+            piece = self.active[piece_index]
+            piece.reset()
+            for block_index in range(piece.num_blocks):
+                self.inflight.pop((piece_index, block_index), None)
+            self._requeue(piece_index)
+
+    def _requeue(self, piece_index: int):
+        if piece_index not in self._partial:
+            self._partial.insert(0, piece_index)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from client.peer.bitfield import Bitfield
+from common.logs import log_message
+from torrents.torrent_info import TorrentInfo
+
+
+class FastResume:
+    """
+    Fast-resume state of a download, kept in `<output file>.resume`.
+
+    The file records the pieces already on disk together with the size and
+    mtime of the output file when it was saved. If the output file still has
+    them when the download restarts, the bitfield is trusted as is. If the
+    resume file is missing or stale (the client died mid-download, the file
+    was touched) the existing data is rechecked against the piece hashes
+    instead, in parallel since hashlib releases the GIL while hashing.
+
+    Attributes:
+    - output_path: str, path of the downloaded file.
+    - torrent: TorrentInfo, torrent being downloaded.
+    """
+
+    VERSION = 1
+
+    def __init__(self, output_path: str, torrent: TorrentInfo):
+        self.output_path = output_path
+        self.path = output_path + ".resume"
+        self.torrent = torrent
+
+    def load(self, number_of_pieces: int) -> Optional[Bitfield]:
+        """
+        Bitfield saved for the output file, None if there is no usable state.
+        """
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            stat = os.stat(self.output_path)
+        except (OSError, ValueError):
+            return None
+
+        if (state.get("version") != self.VERSION
+                or state.get("info_hash") != self.torrent.info_hash
+                or state.get("size") != stat.st_size
+                or state.get("mtime_ns") != stat.st_mtime_ns):
+            log_message(f"Fast-resume state of {self.output_path} is stale")
+            return None
+
+        try:
+            return Bitfield.from_bytes(bytes.fromhex(state["bitfield"]), number_of_pieces)
+        except (KeyError, ValueError):
+            return None
+
+    def save(self, bitfield: Bitfield):
+        """
+        Save the bitfield along with the current size and mtime of the output
+        file. Must be called once nothing else writes to the file.
+        """
+        try:
+            stat = os.stat(self.output_path)
+        except OSError:
+            return
+
+        state = {
+            "version": self.VERSION,
+            "info_hash": self.torrent.info_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "bitfield": bitfield.to_bytes().hex(),
+        }
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def recheck(self, workers: int = None, progress: Callable[[int, int], None] = None) -> Bitfield:
+        """
+        Hash the data already in the output file and tell which pieces are
+        valid.
+
+        Args:
+            workers (int): Hashing threads, one per core by default.
+            progress: Called as progress(checked, total) after every piece.
+        Returns:
+            Bitfield: The pieces whose data matches their hash.
+        """
+        piece_length = self.torrent.piece_length
+        digests = self.torrent.piece_digests()
+        number_of_pieces = self.torrent.number_of_pieces()
+        valid = Bitfield(number_of_pieces)
+        try:
+            fd = os.open(self.output_path, os.O_RDONLY)
+        except OSError:
+            return valid
+
+        try:
+            size = os.fstat(fd).st_size
+
+            def check(piece_index: int) -> bool:
+                offset = piece_index * piece_length
+                piece_size = min(piece_length, self.torrent.length - offset)
+                if offset + piece_size > size:
+                    return False
+                data = os.pread(fd, piece_size, offset)
+                return hashlib.sha1(data).digest() == digests[20 * piece_index:20 * (piece_index + 1)]
+
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                    thread_name_prefix="recheck") as executor:
+                for piece_index, ok in enumerate(executor.map(check, range(number_of_pieces))):
+                    valid[piece_index] = ok
+                    if progress:
+                        progress(piece_index + 1, number_of_pieces)
+        finally:
+            os.close(fd)
+
+        return valid
@@ -0,0 +1,188 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from common.logs import log_message
+
+# callback(offset, error)
+WriteCallback = Callable[[int, Optional[Exception]], None]
+
+
+class DiskWriter:
+    """
+    Output file of a download.
+
+    The file is preallocated to the size of the torrent once and kept open
+    on a single descriptor. Verified pieces are queued and written with
+    positional writes (`os.pwrite`) by a dedicated writer thread, so pieces
+    finishing at the same time never race on a file position and the
+    threads that validate pieces don't wait on the disk. The queue is
+    bounded: when the disk falls behind, `write` blocks and slows the
+    download down instead of piling pieces up in memory.
+
+    fsync policies:
+    - "none": never sync, leave it to the OS.
+    - "pieces": sync after every `fsync_every` pieces written.
+    - "interval": sync at most every `fsync_interval` seconds while writing.
+    - "close": sync once when the file is closed.
+    The file is always synced on close unless the policy is "none".
+
+    Attributes:
+    - path: str, path of the output file.
+    - length: int, size of the file in bytes.
+    - queue_size: int, pieces waiting to be written before `write` blocks.
+    - sparse: bool, only set the size instead of reserving the blocks.
+    """
+
+    FSYNC_POLICIES = ("none", "pieces", "interval", "close")
+
+    def __init__(self, path: str, length: int, queue_size: int = 64, fsync_policy: str = "close",
+                 fsync_every: int = 16, fsync_interval: float = 5.0, sparse: bool = False):
+        if fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy}, expected one of {self.FSYNC_POLICIES}")
+
+        self.path = path
+        self.length = length
+        self.sparse = sparse
+        self.fsync_policy = fsync_policy
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self.fd: Optional[int] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        self.bytes_written = 0
+        self.writes = 0
+        self.fsyncs = 0
+        self.error: Optional[Exception] = None
+
+    def open(self):
+        """
+        Open and preallocate the output file and start the writer thread.
+        Data already in the file is kept.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._preallocate()
+
+        self._thread = threading.Thread(target=self._run, name="disk-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _preallocate(self):
+        size = os.fstat(self.fd).st_size
+        if size > self.length:
+            os.ftruncate(self.fd, self.length)
+            return
+        if size == self.length:
+            return
+
+        if not self.sparse and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, self.length)
+                return
+            except OSError as e:
+                # Filesystems without fallocate support (tmpfs on some kernels, NFS...)
+                log_message(f"fallocate not available for {self.path}, using a sparse file: {e}")
+        os.ftruncate(self.fd, self.length)
+
+    def write(self, offset: int, data, callback: WriteCallback = None):
+        """
+        Queue `data` to be written at `offset`. Blocks while the queue is full.
+        `callback` runs on the writer thread once the data is in the file (or
+        the write failed).
+        """
+        if self._closed:
+            raise IOError(f"Writer for {self.path} is closed")
+        self._queue.put((offset, data, callback))
+
+    def flush(self):
+        """
+        Wait until every queued write is done.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write what is left in the queue, sync according to the policy and
+        close the descriptor.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+
+        if self.fd is not None:
+            try:
+                if self.fsync_policy != "none" and self._unsynced:
+                    self._fsync()
+            finally:
+                os.close(self.fd)
+                self.fd = None
+
+    def stats(self) -> dict:
+        return {
+            "bytes_written": self.bytes_written,
+            "writes": self.writes,
+            "fsyncs": self.fsyncs,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                offset, data, callback = item
+                error = None
+                try:
+                    self._pwrite(offset, data)
+                    self._after_write()
+                except OSError as e:
+                    error = e
+                    self.error = e
+                    log_message(f"Error writing {len(data)} bytes at {offset} to {self.path}: {e}")
+
+                if callback:
+                    try:
+                        callback(offset, error)
+                    except Exception as e:
+                        log_message(f"Error in write callback for offset {offset}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _pwrite(self, offset: int, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+        self.bytes_written += len(data)
+        self.writes += 1
+
+    def _after_write(self):
+        self._unsynced += 1
+        if self.fsync_policy == "pieces" and self._unsynced >= self.fsync_every:
+            self._fsync()
+        elif self.fsync_policy == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self):
+        os.fsync(self.fd)
+        self.fsyncs += 1
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
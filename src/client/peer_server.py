@@ -0,0 +1,714 @@
+import os
+import selectors
+import socket
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack_from
+from typing import Callable, Deque, Dict, List, Optional
+
+from client.choker import Choker
+from client.file_sender import MSG_MORE, DescriptorCache
+from client.messages import (BitField, Cancel, Choke, Handshake, Have, Interested, NotInterested, Piece, Request,
+                             Unchoke)
+from client.peer.bitfield import Bitfield
+from client.piece_cache import PieceCache
+from client.seeding_catalog import SeededTorrent
+from client.super_seeder import SuperSeeder
+from common.framing import HEADER
+from common.logs import log_message
+
+# Largest block a peer may request, as in other clients
+MAX_REQUEST_LENGTH = 128 * 1024
+# Larger messages from a leecher mean a broken or hostile peer
+MAX_MESSAGE_LENGTH = 1 << 20
+
+
+class _Outgoing:
+    """
+    A message in the send buffer of a connection: `header` followed by
+    `length` bytes, taken from `data` if it is set or sent from the file
+    with os.sendfile otherwise.
+    """
+
+    __slots__ = ("header", "data", "fd", "offset", "length", "key", "sent")
+
+    def __init__(self, header: bytes, data: memoryview = None, fd: int = None, offset: int = 0,
+                 length: int = 0, key=None):
+        self.header = header
+        self.data = data
+        self.fd = fd
+        self.offset = offset
+        self.length = length
+        # (piece_index, block_offset, block_length) of a block, for Cancel
+        self.key = key
+        self.sent = 0
+
+    def size(self) -> int:
+        return len(self.header) + self.length
+
+
+class PeerConnection:
+    """
+    A leecher connected to the seeder: the bytes received and not parsed
+    yet, and the messages waiting to be sent.
+    """
+
+    __slots__ = ("sock", "addr", "torrent", "inbuf", "outq", "queued", "events", "connected_at", "uploaded",
+                 "choked", "interested", "upload_rate", "rate_uploaded", "super_seeder")
+
+    def __init__(self, sock: socket.socket, addr):
+        self.sock = sock
+        self.addr = addr
+        # Set once the handshake names a seeded torrent
+        self.torrent: Optional[SeededTorrent] = None
+        self.inbuf = bytearray()
+        self.outq: Deque[_Outgoing] = deque()
+        # Bytes of the messages in outq
+        self.queued = 0
+        self.events = selectors.EVENT_READ
+        self.connected_at = time.monotonic()
+        self.uploaded = 0
+
+        # Choked until the Choker gives the peer an upload slot
+        self.choked = True
+        self.interested = False
+        # Smoothed bytes/s sent to the peer, and `uploaded` when last sampled
+        self.upload_rate = 0.0
+        self.rate_uploaded = 0
+        # Set while the torrent is super-seeded
+        self.super_seeder: Optional[SuperSeeder] = None
+
+
+class PeerServer:
+    """
+    Seeder side of the peer protocol, every leecher served from one
+    selector loop.
+
+    Each connection has a send buffer: answers to Requests are queued and
+    flushed when the socket is writable, blocks from cached pieces as
+    memoryviews and the rest with os.sendfile. Once a connection has
+    `send_buffer_size` bytes queued the server stops reading its requests
+    until the peer drains them, so a slow leecher can't make the seeder
+    buffer without bound. Missed pieces are read into the PieceCache by
+    a couple of worker threads, the loop itself never reads the disk.
+
+    Accepting is fair to the peers already connected: at most
+    `max_peers_per_ip` connections per address, and once `max_peers` are
+    connected new ones wait in the listen backlog until a slot frees.
+
+    Torrents still being downloaded are served too: only the pieces in
+    their bitfield are announced and served, and `broadcast_have` tells the
+    connected peers about every piece that completes.
+
+    Only `upload_slots` interested peers are unchoked at once (see Choker),
+    requests from choked peers are ignored. A slot that frees up between
+    rotations goes to the best waiting peer right away.
+
+    With `super_seed` complete torrents are announced piece by piece as
+    they spread through the swarm (see SuperSeeder), until the swarm holds
+    every piece.
+
+    Attributes:
+    - lookup: Callable[[str], SeededTorrent], torrent of an info hash (hex).
+    - descriptors: DescriptorCache, descriptors of the seeded files.
+    - piece_cache: PieceCache, pieces read for the leechers.
+    """
+
+    BACKLOG = 128
+    MAX_PEERS = 200
+    MAX_PEERS_PER_IP = 8
+    SEND_BUFFER_SIZE = 1024 * 1024
+    HANDSHAKE_TIMEOUT = 10.0
+    # Connections accepted per loop iteration, so bursts don't starve transfers
+    ACCEPT_BATCH = 16
+    READ_AHEAD_WORKERS = 2
+    UPLOAD_SLOTS = 4
+    # Seconds over which the upload rate of a peer is smoothed
+    RATE_WINDOW = 10.0
+
+    def __init__(self, ip: str, port: int, lookup: Callable[[str], Optional[SeededTorrent]],
+                 descriptors: DescriptorCache, piece_cache: PieceCache, backlog: int = BACKLOG,
+                 max_peers: int = MAX_PEERS, max_peers_per_ip: int = MAX_PEERS_PER_IP,
+                 send_buffer_size: int = SEND_BUFFER_SIZE, upload_slots: int = UPLOAD_SLOTS,
+                 download_rate: Callable[[str], float] = None, super_seed: bool = False):
+        self.lookup = lookup
+        self.descriptors = descriptors
+        self.piece_cache = piece_cache
+        self.max_peers = max_peers
+        self.max_peers_per_ip = max_peers_per_ip
+        self.send_buffer_size = send_buffer_size
+        self.choker = Choker(upload_slots, download_rate)
+        self.super_seed = super_seed
+        # Super-seeding state by info hash
+        self.super_seeders: Dict[str, SuperSeeder] = {}
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((ip, port))
+        self.listener.listen(backlog)
+        self.listener.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        self._accepting = True
+        # Wakes the loop up from close()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._wakeup_r)
+        # Work handed to the loop by other threads
+        self._calls: Deque[Callable[[], None]] = deque()
+
+        self.connections: Dict[socket.socket, PeerConnection] = {}
+        self._per_ip: Dict[str, int] = defaultdict(int)
+        self._read_ahead = ThreadPoolExecutor(max_workers=self.READ_AHEAD_WORKERS, thread_name_prefix="read-ahead")
+        self._running = False
+
+        self.accepted = 0
+        self.rejected = 0
+        self.uploaded = 0
+
+    # =============================
+    # Loop
+    # =============================
+
+    def serve_forever(self):
+        self._running = True
+        last_sweep = last_rechoke = time.monotonic()
+        try:
+            while self._running:
+                for key, mask in self.selector.select(timeout=1.0):
+                    if key.data is None:
+                        self._accept()
+                    elif key.data is self._wakeup_r:
+                        self._wakeup_r.recv(64)
+                    else:
+                        self._on_event(key.data, mask)
+                self._run_calls()
+
+                now = time.monotonic()
+                if now - last_sweep >= 1.0:
+                    self._sweep(now, now - last_sweep)
+                    last_sweep = now
+                if now - last_rechoke >= self.choker.ROTATION_INTERVAL:
+                    last_rechoke = now
+                    self._rechoke(now)
+        finally:
+            self._shutdown()
+
+    def close(self):
+        """
+        Stop the server, from any thread.
+        """
+        self._running = False
+        self._wake_up()
+
+    def call_soon(self, fn: Callable, *args):
+        """
+        Run fn(*args) on the loop thread, from any thread.
+        """
+        self._calls.append(lambda: fn(*args))
+        self._wake_up()
+
+    def _wake_up(self):
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _run_calls(self):
+        while self._calls:
+            call = self._calls.popleft()
+            try:
+                call()
+            except Exception as e:
+                log_message(f"Error in peer server call: {e}")
+
+    def _shutdown(self):
+        for conn in list(self.connections.values()):
+            self._close_connection(conn)
+        self._read_ahead.shutdown(wait=False)
+        self.selector.close()
+        self.listener.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def _on_event(self, conn: PeerConnection, mask: int):
+        try:
+            if mask & selectors.EVENT_WRITE:
+                self._flush(conn)
+            if mask & selectors.EVENT_READ:
+                self._read(conn)
+            # Requests left unparsed by the backpressure are handled as the
+            # send buffer drains
+            self._process(conn)
+            while self._flush(conn) and self._process(conn):
+                pass
+            self._update_events(conn)
+        except Exception as e:
+            # Whatever the peer sent, it only costs its own connection
+            log_message(f"Closing peer {conn.addr}: {e}")
+            self._close_connection(conn)
+
+    def _sweep(self, now: float, elapsed: float):
+        """
+        Update the upload rates and drop the connections that never
+        completed the handshake, they hold slots other peers could use.
+        """
+        weight = min(1.0, elapsed / self.RATE_WINDOW)
+        for conn in list(self.connections.values()):
+            sample = (conn.uploaded - conn.rate_uploaded) / elapsed
+            conn.rate_uploaded = conn.uploaded
+            conn.upload_rate += (sample - conn.upload_rate) * weight
+
+            if conn.torrent is None and now - conn.connected_at > self.HANDSHAKE_TIMEOUT:
+                log_message(f"Peer {conn.addr} didn't send a handshake in time")
+                self._close_connection(conn)
+
+        for seeder in list(self.super_seeders.values()):
+            if not seeder.complete:
+                self._announce(seeder.expire(now))
+
+    # =============================
+    # Connections
+    # =============================
+
+    def _accept(self):
+        for _ in range(self.ACCEPT_BATCH):
+            if len(self.connections) >= self.max_peers:
+                # The next peers wait in the backlog until a slot frees
+                self.selector.unregister(self.listener)
+                self._accepting = False
+                return
+
+            try:
+                sock, addr = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # Out of descriptors and the like, the peer stays in the backlog
+                log_message(f"Error accepting connection: {e}")
+                return
+
+            ip = addr[0]
+            if self._per_ip[ip] >= self.max_peers_per_ip:
+                self.rejected += 1
+                sock.close()
+                continue
+
+            sock.setblocking(False)
+            conn = PeerConnection(sock, addr)
+            self.connections[sock] = conn
+            self._per_ip[ip] += 1
+            self.accepted += 1
+            self.selector.register(sock, conn.events, conn)
+
+    def _close_connection(self, conn: PeerConnection):
+        if self.connections.pop(conn.sock, None) is None:
+            return
+        self.choker.forget(conn)
+        if conn.super_seeder is not None:
+            self._announce(conn.super_seeder.remove_peer(conn, time.monotonic()))
+
+        ip = conn.addr[0]
+        self._per_ip[ip] -= 1
+        if self._per_ip[ip] == 0:
+            del self._per_ip[ip]
+
+        for item in conn.outq:
+            self._release(item)
+        conn.outq.clear()
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+        if not self._accepting and self._running and len(self.connections) < self.max_peers:
+            self.selector.register(self.listener, selectors.EVENT_READ, None)
+            self._accepting = True
+
+        if not conn.choked and self._running:
+            self._fill_slots()
+
+    def _update_events(self, conn: PeerConnection):
+        if conn.sock not in self.connections:
+            return
+        events = 0
+        if conn.queued < self.send_buffer_size:
+            events |= selectors.EVENT_READ
+        if conn.outq:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events, conn)
+
+    # =============================
+    # Receiving
+    # =============================
+
+    def _read(self, conn: PeerConnection):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not data:
+            raise EOFError("connection closed by the peer")
+        conn.inbuf += data
+
+    def _process(self, conn: PeerConnection) -> bool:
+        """
+        Handle the complete messages in the receive buffer, as long as the
+        send buffer has room for the answers. Tells whether any was handled.
+        """
+        if conn.torrent is None:
+            if len(conn.inbuf) < Handshake.LENGTH:
+                return False
+            self._on_handshake(conn, bytes(conn.inbuf[:Handshake.LENGTH]))
+            del conn.inbuf[:Handshake.LENGTH]
+
+        pos = 0
+        inbuf = conn.inbuf
+        # Messages are decoded from views of the buffer, released before it shrinks
+        with memoryview(inbuf) as view:
+            while conn.queued < self.send_buffer_size and len(inbuf) - pos >= HEADER.size:
+                length = unpack_from(">I", inbuf, pos)[0]
+                if length > MAX_MESSAGE_LENGTH:
+                    raise ValueError(f"message of {length} bytes")
+                end = pos + HEADER.size + length
+                if len(inbuf) < end:
+                    break
+                if length > 0:
+                    with view[pos:end] as frame:
+                        message_id = frame[HEADER.size]
+                        if message_id == Request.message_id:
+                            self._on_request(conn, Request.from_bytes(frame))
+                        elif message_id == Cancel.message_id:
+                            self._on_cancel(conn, Cancel.from_bytes(frame))
+                        elif message_id == Have.message_id:
+                            self._on_have(conn, Have.from_bytes(frame))
+                        elif message_id == Interested.message_id:
+                            self._on_interested(conn, Interested.from_bytes(frame))
+                        elif message_id == NotInterested.message_id:
+                            self._on_not_interested(conn, NotInterested.from_bytes(frame))
+                        elif message_id == BitField.message_id:
+                            self._on_bitfield(conn, BitField.from_bytes(frame))
+                # KeepAlive and the rest, nothing to answer
+                pos = end
+        del inbuf[:pos]
+        return pos > 0
+
+    def _on_handshake(self, conn: PeerConnection, message: bytes):
+        info_hash, _ = Handshake.from_bytes(message)
+        torrent = self.lookup(info_hash.hex())
+        if not torrent or not torrent.data_file_path:
+            raise ValueError(f"info hash {info_hash.hex()} not found")
+
+        conn.torrent = torrent
+        self._queue(conn, _Outgoing(Handshake(info_hash=info_hash).to_bytes()))
+
+        seeder = self._super_seeder(torrent)
+        if seeder is not None:
+            # Nothing but the pieces offered to this peer once it is unchoked
+            conn.super_seeder = seeder
+            seeder.add_peer(conn)
+            self._queue(conn, _Outgoing(BitField(Bitfield(torrent.number_of_pieces()).to_bytes()).to_bytes()))
+            return
+
+        # Announce the pieces we have
+        bitfield = torrent.bitfield if torrent.bitfield is not None else Bitfield.full(torrent.number_of_pieces())
+        self._queue(conn, _Outgoing(BitField(bitfield.to_bytes()).to_bytes()))
+
+    def _on_interested(self, conn: PeerConnection, message: Interested):
+        conn.interested = True
+        self._fill_slots()
+
+    def _on_not_interested(self, conn: PeerConnection, message: NotInterested):
+        conn.interested = False
+        if not conn.choked:
+            self._choke(conn)
+            self._fill_slots()
+
+    def _on_request(self, conn: PeerConnection, request: Request):
+        if conn.choked:
+            # Requests that crossed a Choke are dropped, the peer knows
+            return
+
+        piece_index, block_offset, block_length = request.piece_index, request.block_offset, request.block_length
+        torrent = conn.torrent
+        piece_offset = piece_index * torrent.piece_length
+        piece_size = min(torrent.piece_length, torrent.length - piece_offset)
+        offset = piece_offset + block_offset
+        if (piece_index >= torrent.number_of_pieces() or block_length == 0
+                or block_length > MAX_REQUEST_LENGTH or block_offset + block_length > piece_size):
+            log_message(f"Ignoring request out of range from {conn.addr}: piece {piece_index}, "
+                        f"offset {block_offset}, length {block_length}")
+            return
+        if not torrent.has_piece(piece_index):
+            log_message(f"Ignoring request from {conn.addr} for piece {piece_index}, we don't have it yet")
+            return
+        if conn.super_seeder is not None and not conn.super_seeder.allowed(conn, piece_index):
+            log_message(f"Ignoring request from {conn.addr} for piece {piece_index}, it wasn't offered")
+            return
+
+        path = torrent.data_file_path
+        key = (piece_index, block_offset, block_length)
+        header = Piece.header(piece_index, block_offset, block_length)
+        block = self.piece_cache.lookup(path, piece_index, block_offset, block_length)
+        if block is not None:
+            self._queue(conn, _Outgoing(header, data=block, length=block_length, key=key))
+            return
+
+        fd = self.descriptors.acquire(path)
+        if hasattr(os, "sendfile"):
+            item = _Outgoing(header, fd=fd, offset=offset, length=block_length, key=key)
+        else:
+            data = os.pread(fd, block_length, offset)
+            self.descriptors.release(fd)
+            if len(data) != block_length:
+                raise EOFError(f"{path} is shorter than the torrent")
+            item = _Outgoing(header, data=memoryview(data), length=block_length, key=key)
+        self._queue(conn, item)
+
+        # The next blocks of the piece will likely be asked for next
+        if block_offset + block_length < piece_size and not self.piece_cache.is_loading(path, piece_index):
+            self._read_ahead.submit(self._read_piece, path, piece_index, piece_offset, piece_size)
+
+    def _read_piece(self, path: str, piece_index: int, piece_offset: int, piece_size: int):
+        try:
+            with self.descriptors.open(path) as fd:
+                self.piece_cache.read_ahead(fd, path, piece_index, piece_offset, piece_size)
+        except (OSError, EOFError) as e:
+            log_message(f"Read-ahead of piece {piece_index} of {path} failed: {e}")
+
+    def _on_cancel(self, conn: PeerConnection, cancel: Cancel):
+        """
+        Drop the block from the send buffer if it hasn't started going out.
+        """
+        key = (cancel.piece_index, cancel.block_offset, cancel.block_length)
+        for item in conn.outq:
+            if item.key == key and item.sent == 0:
+                conn.outq.remove(item)
+                conn.queued -= item.size()
+                self._release(item)
+                return
+
+    def broadcast_have(self, info_hash: str, piece_index: int):
+        """
+        Tell the peers of a torrent that a piece can be requested, from any
+        thread.
+        """
+        self.call_soon(self._broadcast_have, info_hash, piece_index)
+
+    def _broadcast_have(self, info_hash: str, piece_index: int):
+        message = Have(piece_index).to_bytes()
+        for conn in list(self.connections.values()):
+            if conn.torrent is not None and conn.torrent.info_hash == info_hash:
+                self._queue(conn, _Outgoing(message))
+                self._kick(conn)
+
+    def drop_torrent(self, info_hash: str):
+        """
+        Close the connections of a torrent that is no longer served, from
+        any thread.
+        """
+        self.call_soon(self._drop_torrent, info_hash)
+
+    def _drop_torrent(self, info_hash: str):
+        for conn in list(self.connections.values()):
+            if conn.torrent is not None and conn.torrent.info_hash == info_hash:
+                self._close_connection(conn)
+
+    # =============================
+    # Super-seeding
+    # =============================
+
+    def _super_seeder(self, torrent: SeededTorrent) -> Optional[SuperSeeder]:
+        """
+        Super-seeding state of a complete torrent, None once the swarm holds
+        every piece or if the mode is off.
+        """
+        if not self.super_seed or torrent.bitfield is not None:
+            return None
+        seeder = self.super_seeders.get(torrent.info_hash)
+        if seeder is None:
+            seeder = SuperSeeder(torrent.name, torrent.number_of_pieces(), torrent.length)
+            self.super_seeders[torrent.info_hash] = seeder
+        return None if seeder.complete else seeder
+
+    def _on_have(self, conn: PeerConnection, have: Have):
+        # Only the super-seeder follows what the leechers have
+        seeder = conn.super_seeder
+        if seeder is None:
+            return
+        self._announce(seeder.on_have(conn, have.piece_index, time.monotonic()))
+        if seeder.complete:
+            self._end_super_seeding(seeder)
+
+    def _on_bitfield(self, conn: PeerConnection, message: BitField):
+        seeder = conn.super_seeder
+        if seeder is None:
+            return
+        now = time.monotonic()
+        bitfield = Bitfield.from_bytes(message.bitfield, seeder.number_of_pieces)
+        for piece_index in bitfield.ones():
+            self._announce(seeder.on_have(conn, piece_index, now))
+        if seeder.complete:
+            self._end_super_seeding(seeder)
+
+    def _announce(self, offers):
+        for conn, piece_index in offers:
+            self._queue(conn, _Outgoing(Have(piece_index).to_bytes()))
+            self._kick(conn)
+
+    def _end_super_seeding(self, seeder: SuperSeeder):
+        """
+        The swarm holds every piece: announce the rest of them and seed as
+        usual from now on.
+        """
+        log_message(f"Super-seeding of {seeder.name} done: the swarm holds every piece after "
+                    f"{seeder.uploaded_at_complete / 2**20:.1f} MiB uploaded "
+                    f"({seeder.uploaded_at_complete / seeder.length:.2f} copies)")
+
+        for conn in list(self.connections.values()):
+            if conn.super_seeder is seeder:
+                self._queue(conn, _Outgoing(b"".join(Have(piece_index).to_bytes()
+                                                     for piece_index in seeder.missing(conn))))
+                conn.super_seeder = None
+                self._kick(conn)
+
+    # =============================
+    # Upload slots
+    # =============================
+
+    def _rechoke(self, now: float):
+        peers = [conn for conn in self.connections.values() if conn.torrent is not None]
+        unchoked = self.choker.rechoke(peers, now)
+        for conn in peers:
+            if conn in unchoked and conn.choked:
+                self._unchoke(conn)
+            elif conn not in unchoked and not conn.choked:
+                self._choke(conn)
+
+    def _fill_slots(self):
+        """
+        Unchoke the best waiting peers while there are free slots.
+        """
+        peers = [conn for conn in self.connections.values() if conn.torrent is not None]
+        free = self.choker.slots - sum(1 for conn in peers if not conn.choked)
+        waiting = [conn for conn in peers if conn.choked and conn.interested]
+        while free > 0 and waiting:
+            conn = self.choker.best(waiting)
+            waiting.remove(conn)
+            self._unchoke(conn)
+            free -= 1
+
+    def _choke(self, conn: PeerConnection):
+        """
+        Take the slot away: the blocks that haven't started going out are
+        dropped, as the peer expects after a Choke.
+        """
+        conn.choked = True
+        kept = deque()
+        for item in conn.outq:
+            if item.key is not None and item.sent == 0:
+                conn.queued -= item.size()
+                self._release(item)
+            else:
+                kept.append(item)
+        conn.outq = kept
+        self._queue(conn, _Outgoing(Choke().to_bytes()))
+        self._kick(conn)
+        if conn.super_seeder is not None:
+            self._announce(conn.super_seeder.deactivate(conn, time.monotonic()))
+
+    def _unchoke(self, conn: PeerConnection):
+        conn.choked = False
+        self._queue(conn, _Outgoing(Unchoke().to_bytes()))
+        if conn.super_seeder is not None:
+            self._announce(conn.super_seeder.activate(conn, time.monotonic()))
+        self._kick(conn)
+
+    def _kick(self, conn: PeerConnection):
+        """
+        Send what was queued for a connection outside of its own events.
+        """
+        try:
+            self._flush(conn)
+            self._update_events(conn)
+        except Exception as e:
+            log_message(f"Closing peer {conn.addr}: {e}")
+            self._close_connection(conn)
+
+    def slots(self) -> List[dict]:
+        """
+        Upload rate of every unchoked peer, fastest first.
+        """
+        rows = [dict(
+            address=f"{conn.addr[0]}:{conn.addr[1]}",
+            rate_kib_s=round(conn.upload_rate / 1024, 1),
+            uploaded_mib=round(conn.uploaded / 2**20, 1),
+            optimistic=conn is self.choker.optimistic,
+        ) for conn in list(self.connections.values()) if not conn.choked]
+        rows.sort(key=lambda row: row["rate_kib_s"], reverse=True)
+        return rows
+
+    # =============================
+    # Sending
+    # =============================
+
+    def _queue(self, conn: PeerConnection, item: _Outgoing):
+        conn.outq.append(item)
+        conn.queued += item.size()
+
+    def _flush(self, conn: PeerConnection) -> bool:
+        """
+        Send as much of the send buffer as the socket takes without blocking.
+        Tells whether the buffer was emptied.
+        """
+        while conn.outq:
+            item = conn.outq[0]
+            try:
+                self._send(conn.sock, item)
+            except (BlockingIOError, InterruptedError):
+                return False
+            conn.outq.popleft()
+            conn.queued -= item.size()
+            conn.uploaded += item.length
+            self.uploaded += item.length
+            if conn.super_seeder is not None:
+                conn.super_seeder.uploaded += item.length
+            self._release(item)
+        return True
+
+    def _send(self, sock: socket.socket, item: _Outgoing):
+        header_length = len(item.header)
+        while item.sent < header_length:
+            flags = MSG_MORE if item.length else 0
+            item.sent += sock.send(memoryview(item.header)[item.sent:], flags)
+
+        while item.sent < header_length + item.length:
+            position = item.sent - header_length
+            if item.data is not None:
+                sent = sock.send(item.data[position:])
+            else:
+                sent = os.sendfile(sock.fileno(), item.fd, item.offset + position, item.length - position)
+                if sent == 0:
+                    raise EOFError("the data file is shorter than the torrent")
+            item.sent += sent
+
+    def _release(self, item: _Outgoing):
+        if item.fd is not None:
+            self.descriptors.release(item.fd)
+            item.fd = None
+
+    def stats(self) -> dict:
+        return {
+            "peers": len(self.connections),
+            "unchoked": sum(1 for conn in list(self.connections.values()) if not conn.choked),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "accepting": self._accepting,
+            "uploaded_mib": round(self.uploaded / 2**20, 1),
+            "queued_kib": round(sum(conn.queued for conn in list(self.connections.values())) / 1024, 1),
+        }
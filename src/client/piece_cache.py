@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class PieceCache:
+    """
+    Memory-bounded LRU cache of the pieces the seeder serves, shared by
+    every connection.
+
+    The first request for a block of a piece reads the whole piece, so the
+    next blocks a peer asks for (and the same piece requested by other
+    leechers) are answered from memory. When several connections miss the
+    same piece at once only one of them reads it, the others wait for it.
+
+    get_block reads on the calling thread. A server that must not block
+    uses lookup instead and hands the misses to read_ahead on a worker.
+
+    Attributes:
+    - max_bytes: int, memory the cached pieces may use, 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # (path, piece_index) -> piece data, least recently used first
+        self._pieces: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        # Pieces being read by a connection, the others wait on the event
+        self._loading: Dict[Tuple[str, int], threading.Event] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_block(self, fd: int, path: str, piece_index: int, piece_offset: int, piece_size: int,
+                  block_offset: int, block_length: int) -> Optional[memoryview]:
+        """
+        A block of a piece, reading the piece from the file if it isn't
+        cached.
+
+        Args:
+            fd (int): Descriptor of the file, read with os.pread.
+            path (str): Path of the file, part of the key.
+            piece_index (int): Index of the piece.
+            piece_offset (int): Position of the piece in the file.
+            piece_size (int): Size of the piece (the last one may be shorter).
+            block_offset (int): Position of the block in the piece.
+            block_length (int): Size of the block.
+        Returns:
+            memoryview: The block, None if the piece doesn't fit in the cache.
+        """
+        if piece_size > self.max_bytes:
+            return None
+
+        key = (path, piece_index)
+        while True:
+            with self._lock:
+                piece = self._pieces.get(key)
+                if piece is not None:
+                    self._pieces.move_to_end(key)
+                    self.hits += 1
+                    return memoryview(piece)[block_offset:block_offset + block_length]
+
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another connection is reading the piece
+            loading.wait()
+
+        piece = self._load(key, loading, fd, piece_offset, piece_size)
+        return memoryview(piece)[block_offset:block_offset + block_length]
+
+    def lookup(self, path: str, piece_index: int, block_offset: int, block_length: int) -> Optional[memoryview]:
+        """
+        A block of a cached piece, None if the piece isn't cached. Never
+        touches the disk, see read_ahead.
+        """
+        with self._lock:
+            piece = self._pieces.get((path, piece_index))
+            if piece is None:
+                self.misses += 1
+                return None
+            self._pieces.move_to_end((path, piece_index))
+            self.hits += 1
+        return memoryview(piece)[block_offset:block_offset + block_length]
+
+    def read_ahead(self, fd: int, path: str, piece_index: int, piece_offset: int, piece_size: int):
+        """
+        Read a piece into the cache unless it is already cached or being
+        read. Meant to run off the thread serving the peers.
+        """
+        if piece_size > self.max_bytes:
+            return
+
+        key = (path, piece_index)
+        with self._lock:
+            if key in self._pieces or key in self._loading:
+                return
+            loading = self._loading[key] = threading.Event()
+        self._load(key, loading, fd, piece_offset, piece_size)
+
+    def is_loading(self, path: str, piece_index: int) -> bool:
+        return (path, piece_index) in self._loading
+
+    def _load(self, key, loading: threading.Event, fd: int, piece_offset: int, piece_size: int) -> bytes:
+        try:
+            piece = os.pread(fd, piece_size, piece_offset)
+            if len(piece) != piece_size:
+                raise EOFError(f"Only {len(piece)} of {piece_size} bytes of piece {key[1]} in {key[0]}")
+            self._insert(key, piece)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return piece
+
+    def _insert(self, key, piece: bytes):
+        with self._lock:
+            self._pieces[key] = piece
+            self.size += len(piece)
+            while self.size > self.max_bytes:
+                _, old = self._pieces.popitem(last=False)
+                self.size -= len(old)
+                self.evictions += 1
+
+    def invalidate(self, path: str):
+        """
+        Forget the pieces of a file that was replaced or removed.
+        """
+        with self._lock:
+            for key in [key for key in self._pieces if key[0] == path]:
+                self.size -= len(self._pieces.pop(key))
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "pieces": len(self._pieces),
+            "cached_mib": round(self.size / 2**20, 1),
+            "limit_mib": round(self.max_bytes / 2**20, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "evictions": self.evictions,
+        }
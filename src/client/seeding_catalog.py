@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+
+from client.peer.bitfield import Bitfield
+from common.logs import log_message
+from torrents.torrent_file import TorrentFile
+
+
+@dataclass
+class SeededTorrent:
+    """
+    A torrent the client seeds: what the seeder needs to answer a handshake
+    and serve blocks, without the piece digests. Downloads in progress are
+    seeded too, with the bitfield of the pieces already verified and on disk.
+    """
+    name: str
+    info_hash: str
+    piece_length: int
+    length: int
+    torrent_file_path: str
+    # Size and mtime of the .torrent file when it was parsed
+    torrent_size: int
+    torrent_mtime_ns: int
+    data_file_path: Optional[str] = None
+    # Pieces that can be served, None if the file is complete
+    bitfield: Optional[Bitfield] = None
+
+    def number_of_pieces(self) -> int:
+        return (self.length + self.piece_length - 1) // self.piece_length
+
+    def has_piece(self, piece_index: int) -> bool:
+        return self.bitfield is None or self.bitfield[piece_index]
+
+
+class SeedingCatalog:
+    """
+    Torrents in `uploads/client_<id>`, indexed by info hash.
+
+    The catalog is saved in `catalog.json` next to the torrents. On load,
+    a .torrent whose size and mtime still match its saved entry is taken
+    from the file instead of being parsed again, so starting a client that
+    seeds many torrents only parses the new or modified ones. Afterwards
+    torrents are added and removed one at a time.
+
+    Lookups come from the threads serving peers while the console adds
+    torrents, every change happens under a lock and replaces the entry at
+    once.
+
+    Attributes:
+    - torrents_path: str, directory of the .torrent files.
+    - data_path: str, directory of the seeded files.
+    """
+
+    VERSION = 1
+
+    def __init__(self, torrents_path: str, data_path: str, cache_path: str = None):
+        self.torrents_path = torrents_path
+        self.data_path = data_path
+        self.cache_path = cache_path or os.path.join(os.path.dirname(torrents_path), "catalog.json")
+
+        self._by_hash: Dict[str, SeededTorrent] = {}
+        self._by_name: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def __iter__(self) -> Iterator[SeededTorrent]:
+        return iter(list(self._by_hash.values()))
+
+    def get(self, info_hash: str) -> Optional[SeededTorrent]:
+        """
+        Entry of the torrent with the info hash (hex), None if not seeded.
+        """
+        return self._by_hash.get(info_hash)
+
+    def get_by_name(self, name: str) -> Optional[SeededTorrent]:
+        info_hash = self._by_name.get(name)
+        return self._by_hash.get(info_hash) if info_hash else None
+
+    def names(self) -> List[str]:
+        return sorted(self._by_name)
+
+    # =============================
+    # Loading
+    # =============================
+
+    def load(self):
+        """
+        Build the catalog from the upload directories, reusing the saved
+        entries of the torrents that didn't change.
+        """
+        cached = self._read_cache()
+        data_files = self._list_data_files()
+
+        entries = []
+        parsed = 0
+        for file_name in os.listdir(self.torrents_path):
+            if not file_name.endswith(".torrent"):
+                continue
+
+            torrent_file_path = os.path.join(self.torrents_path, file_name)
+            try:
+                stat = os.stat(torrent_file_path)
+            except OSError:
+                continue
+
+            entry = cached.get(file_name)
+            if entry is None or entry.torrent_size != stat.st_size or entry.torrent_mtime_ns != stat.st_mtime_ns:
+                try:
+                    entry = self._parse(torrent_file_path, stat)
+                except (OSError, ValueError) as e:
+                    log_message(f"Skipping torrent {torrent_file_path}: {e}")
+                    continue
+                parsed += 1
+
+            entry.torrent_file_path = torrent_file_path
+            entry.data_file_path = data_files.get(self._stem(file_name))
+            entries.append(entry)
+
+        with self._lock:
+            self._by_hash = {}
+            self._by_name = {}
+            for entry in entries:
+                self._insert(entry)
+            self._save()
+
+        log_message(f"Seeding catalog: {len(entries)} torrents, {parsed} parsed")
+
+    def _read_cache(self) -> Dict[str, SeededTorrent]:
+        """
+        Saved entries by .torrent file name, empty if the cache is unusable.
+        """
+        try:
+            with open(self.cache_path, "r") as f:
+                state = json.load(f)
+            if state.get("version") != self.VERSION:
+                return {}
+            return {os.path.basename(entry["torrent_file_path"]): SeededTorrent(**entry)
+                    for entry in state["torrents"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _list_data_files(self) -> Dict[str, str]:
+        return {self._stem(file_name): os.path.join(self.data_path, file_name)
+                for file_name in os.listdir(self.data_path)}
+
+    # =============================
+    # Incremental updates
+    # =============================
+
+    def add(self, torrent_file_path: str, data_file_path: str = None) -> SeededTorrent:
+        """
+        Parse one torrent and start seeding it, replacing the entry with the
+        same name or info hash if there was one.
+
+        Args:
+            torrent_file_path (str): The .torrent file, inside torrents_path.
+            data_file_path (str): The seeded file, looked up by name in data_path if None.
+        Returns:
+            SeededTorrent: The new entry.
+        """
+        entry = self._parse(torrent_file_path, os.stat(torrent_file_path))
+        if data_file_path is None:
+            data_file_path = self._list_data_files().get(self._stem(os.path.basename(torrent_file_path)))
+        entry.data_file_path = data_file_path
+
+        with self._lock:
+            self._discard(self._by_name.get(entry.name))
+            self._discard(entry.info_hash)
+            self._insert(entry)
+            self._save()
+        return entry
+
+    def remove(self, info_hash: str) -> Optional[SeededTorrent]:
+        """
+        Stop seeding a torrent. The files are left alone, but the .torrent
+        must be removed too or the next load() finds it again.
+        """
+        with self._lock:
+            entry = self._discard(info_hash)
+            if entry is not None:
+                self._save()
+        return entry
+
+    def _insert(self, entry: SeededTorrent):
+        self._by_hash[entry.info_hash] = entry
+        self._by_name[entry.name] = entry.info_hash
+
+    def _discard(self, info_hash: Optional[str]) -> Optional[SeededTorrent]:
+        entry = self._by_hash.pop(info_hash, None) if info_hash else None
+        if entry is not None and self._by_name.get(entry.name) == info_hash:
+            del self._by_name[entry.name]
+        return entry
+
+    def _save(self):
+        state = {
+            "version": self.VERSION,
+            "torrents": [asdict(entry) for entry in self._by_hash.values()],
+        }
+
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            # Only costs parsing the torrents again on the next start
+            log_message(f"Could not save the seeding catalog: {e}")
+
+    # =============================
+    # Helpers
+    # =============================
+
+    def _parse(self, torrent_file_path: str, stat: os.stat_result) -> SeededTorrent:
+        # Only the scalar fields are needed to seed, the digests are never decoded
+        with TorrentFile(torrent_file_path) as torrent:
+            return SeededTorrent(
+                # Files are matched with their torrent by name
+                name=self._stem(os.path.basename(torrent_file_path)),
+                info_hash=torrent.info_hash,
+                piece_length=torrent.piece_length,
+                length=torrent.length,
+                torrent_file_path=torrent_file_path,
+                torrent_size=stat.st_size,
+                torrent_mtime_ns=stat.st_mtime_ns,
+            )
+
+    @staticmethod
+    def _stem(file_name: str) -> str:
+        return file_name.split(".")[0]
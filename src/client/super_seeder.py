@@ -0,0 +1,237 @@
+import random
+from array import array
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from client.peer.bitfield import Bitfield
+
+
+class SuperSeeder:
+    """
+    Piece announcements of a torrent seeded in super-seeding mode, so the
+    origin uploads each piece about once instead of the same early pieces
+    to every leecher.
+
+    Leechers get an empty BitField. While a leecher has an upload slot it
+    is offered `OFFERS_PER_PEER` pieces at a time with Have, each piece to
+    one peer only, never offered and rarest first. A peer gets a new piece
+    once one of its offered pieces is announced by another peer: the piece
+    spread and the peer is uploading what it got. A peer whose piece didn't
+    spread within `SPREAD_TIMEOUT` seconds (the others can't reach it, or
+    it never downloaded the piece) is given another one anyway. Offers a
+    peer didn't download when it is choked or leaves go to other peers.
+
+    Once the swarm holds every piece the mode has done its job: `complete`
+    is set, `uploaded_at_complete` records what the origin sent until then
+    and the torrent is seeded as usual.
+
+    Peers are anything hashable (PeerConnection).
+
+    Attributes:
+    - name: str, the seeded file.
+    - length: int, bytes of the file.
+    - uploaded: int, bytes of the torrent sent by the origin.
+    """
+
+    OFFERS_PER_PEER = 2
+    SPREAD_TIMEOUT = 30.0
+
+    def __init__(self, name: str, number_of_pieces: int, length: int):
+        self.name = name
+        self.length = length
+        self.number_of_pieces = number_of_pieces
+        # Connected peers known to have each piece
+        self.availability = array("i", bytes(4 * number_of_pieces))
+        self.in_swarm = 0
+
+        # Pieces never offered, in random order so peers don't start alike
+        pieces = list(range(number_of_pieces))
+        random.shuffle(pieces)
+        self._fresh: Deque[int] = deque(pieces)
+
+        # peer -> offered piece -> time offered, until the piece spreads
+        self.offers: Dict[object, Dict[int, float]] = {}
+        # Peers that can download their offers (unchoked)
+        self.active: Set[object] = set()
+        # piece -> peer holding its offer
+        self.offered_to: Dict[int, object] = {}
+        # Pieces announced to each peer, which it may request
+        self.announced: Dict[object, Set[int]] = {}
+        self.holders: Dict[object, Bitfield] = {}
+
+        self.complete = False
+        self.uploaded = 0
+        self.uploaded_at_complete: Optional[int] = None
+
+    def add_peer(self, peer):
+        self.offers[peer] = {}
+        self.announced[peer] = set()
+        self.holders[peer] = Bitfield(self.number_of_pieces)
+
+    def remove_peer(self, peer, now: float) -> List[Tuple[object, int]]:
+        """
+        Forget a peer that disconnected.
+
+        Returns:
+            List[Tuple[peer, int]]: New offers to announce.
+        """
+        self.active.discard(peer)
+        for piece_index in self.offers.pop(peer, {}):
+            self._withdraw(peer, piece_index)
+        self.announced.pop(peer, None)
+        for piece_index in self.holders.pop(peer, Bitfield(0)).ones():
+            self._change_availability(piece_index, -1)
+        return self._refill(now)
+
+    def activate(self, peer, now: float) -> List[Tuple[object, int]]:
+        """
+        The peer got an upload slot.
+
+        Returns:
+            List[Tuple[peer, int]]: New offers to announce.
+        """
+        if peer not in self.offers:
+            return []
+        self.active.add(peer)
+        return [(peer, offer) for offer in self._offer(peer, now)]
+
+    def deactivate(self, peer, now: float) -> List[Tuple[object, int]]:
+        """
+        The peer lost its upload slot: the offers it didn't download go to
+        the peers that can.
+
+        Returns:
+            List[Tuple[peer, int]]: New offers to announce.
+        """
+        self.active.discard(peer)
+        offers = self.offers.get(peer, {})
+        holders = self.holders.get(peer)
+        for piece_index in [i for i in offers if not holders[i]]:
+            del offers[piece_index]
+            self._withdraw(peer, piece_index)
+        return self._refill(now)
+
+    def allowed(self, peer, piece_index: int) -> bool:
+        """
+        Whether the peer may request the piece.
+        """
+        return self.complete or piece_index in self.announced.get(peer, ())
+
+    def on_have(self, peer, piece_index: int, now: float) -> List[Tuple[object, int]]:
+        """
+        Record that a peer has a piece.
+
+        Returns:
+            List[Tuple[peer, int]]: New offers to announce.
+        """
+        holders = self.holders.get(peer)
+        if holders is None or piece_index >= len(holders) or holders[piece_index]:
+            return []
+        holders[piece_index] = True
+        self._change_availability(piece_index, 1)
+
+        owner = self.offered_to.get(piece_index)
+        if owner is None or owner is peer:
+            # Still waiting for the piece to reach someone else
+            return []
+
+        # The piece spread, its first holder gets a new one
+        del self.offered_to[piece_index]
+        self.offers[owner].pop(piece_index, None)
+        return [(owner, offer) for offer in self._offer(owner, now)]
+
+    def expire(self, now: float) -> List[Tuple[object, int]]:
+        """
+        Replace the offers that didn't spread in time.
+
+        Returns:
+            List[Tuple[peer, int]]: New offers to announce.
+        """
+        for peer, offers in self.offers.items():
+            expired = [piece_index for piece_index, offered_at in offers.items()
+                       if now - offered_at > self.SPREAD_TIMEOUT]
+            for piece_index in expired:
+                del offers[piece_index]
+                self._withdraw(peer, piece_index)
+        return self._refill(now)
+
+    def missing(self, peer) -> List[int]:
+        """
+        Pieces never announced to the peer, announced once the mode ends.
+        """
+        announced = self.announced.get(peer, ())
+        return [piece_index for piece_index in range(self.number_of_pieces) if piece_index not in announced]
+
+    def _withdraw(self, peer, piece_index: int):
+        if self.offered_to.get(piece_index) is peer:
+            del self.offered_to[piece_index]
+            if not self.availability[piece_index]:
+                # Nobody got it, the next peer to be offered a piece gets it
+                self._fresh.appendleft(piece_index)
+
+    def _refill(self, now: float) -> List[Tuple[object, int]]:
+        announcements = []
+        for peer in self.active:
+            announcements.extend((peer, offer) for offer in self._offer(peer, now))
+        return announcements
+
+    def _offer(self, peer, now: float) -> List[int]:
+        offers = self.offers[peer]
+        new = []
+        while not self.complete and peer in self.active and len(offers) < self.OFFERS_PER_PEER:
+            piece_index = self._pick(peer)
+            if piece_index is None:
+                break
+            offers[piece_index] = now
+            self.offered_to[piece_index] = peer
+            self.announced[peer].add(piece_index)
+            new.append(piece_index)
+        return new
+
+    def _pick(self, peer) -> Optional[int]:
+        holders = self.holders[peer]
+        announced = self.announced[peer]
+
+        skipped = []
+        piece_index = None
+        while self._fresh:
+            candidate = self._fresh.popleft()
+            if candidate in self.offered_to or self.availability[candidate]:
+                # Offered meanwhile or already in the swarm, not fresh anymore
+                continue
+            if holders[candidate] or candidate in announced:
+                skipped.append(candidate)
+                continue
+            piece_index = candidate
+            break
+        self._fresh.extendleft(reversed(skipped))
+        if piece_index is not None:
+            return piece_index
+
+        # Every piece was offered once, take the rarest the peer lacks
+        candidates = [i for i in range(self.number_of_pieces)
+                      if i not in self.offered_to and not holders[i] and i not in announced]
+        return min(candidates, key=lambda i: self.availability[i], default=None)
+
+    def _change_availability(self, piece_index: int, delta: int):
+        old = self.availability[piece_index]
+        self.availability[piece_index] = old + delta
+        if old == 0 and delta > 0:
+            self.in_swarm += 1
+            if self.in_swarm == self.number_of_pieces and not self.complete:
+                self.complete = True
+                self.uploaded_at_complete = self.uploaded
+        elif old + delta == 0:
+            self.in_swarm -= 1
+
+    def stats(self) -> dict:
+        return {
+            "pieces": self.number_of_pieces,
+            "in_swarm": self.in_swarm,
+            "offered": len(self.offered_to),
+            "complete": self.complete,
+            "uploaded_mib": round(self.uploaded / 2**20, 1),
+            "copies": round(self.uploaded / self.length, 2) if self.length else 0.0,
+            "copies_at_complete": (round(self.uploaded_at_complete / self.length, 2)
+                                   if self.uploaded_at_complete is not None and self.length else None),
+        }
@@ -0,0 +1,178 @@
+import socket
+from struct import Struct
+from typing import Optional
+
+# Every message of the peer and tracker protocols starts with its length
+HEADER = Struct(">I")
+
+# Longest JSON message of the tracker protocol. A torrent entry with the
+# hex block hashes of a file of MAX_MERKLE_FILE_SIZE (torrents/merkle.py)
+# still fits
+MAX_JSON_FRAME_SIZE = 32 * 1024 * 1024
+
+
+class FrameReader:
+    """
+    Reads length-prefixed frames (<length><payload>, the length as a 4-byte
+    big-endian integer) from a blocking socket.
+
+    Bytes are received with recv_into into one buffer reused for the whole
+    connection, as many as the socket has ready, so a burst of small
+    messages costs one system call instead of two per message and no
+    allocation. Frames come back as memoryviews of that buffer, valid until
+    the next read: whoever keeps one must copy it. Large payloads can skip
+    the buffer with `read_into`.
+
+    Reads never come back short: they wait for every byte, or raise
+    ConnectionError if the other end closes first.
+
+    Attributes:
+    - sock: socket.socket, the connection.
+    - max_frame_size: int, longest payload accepted, None for no limit.
+    """
+
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, sock: socket.socket, buffer_size: int = BUFFER_SIZE, max_frame_size: int = None):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        # Unread bytes are _buffer[_start:_end]
+        self._start = 0
+        self._end = 0
+
+    def buffered(self) -> int:
+        return self._end - self._start
+
+    def peek(self, n: int) -> memoryview:
+        """
+        The next n bytes, left unread.
+        """
+        self._fill(n)
+        return self._view[self._start:self._start + n]
+
+    def read_exact(self, n: int) -> memoryview:
+        self._fill(n)
+        start = self._start
+        self._start += n
+        return self._view[start:self._start]
+
+    def read_into(self, view: memoryview):
+        """
+        Fill `view` with the next len(view) bytes: what is buffered is
+        copied, the rest is received straight into it.
+        """
+        buffered = min(self._end - self._start, len(view))
+        view[:buffered] = self._view[self._start:self._start + buffered]
+        self._start += buffered
+
+        view = view[buffered:]
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                raise ConnectionError("connection closed in the middle of a message")
+            view = view[received:]
+
+    def read_frame(self) -> Optional[memoryview]:
+        """
+        The next frame, length prefix included (as messages are decoded),
+        None if the connection was closed between frames.
+        """
+        # Fast path: the whole frame is already buffered
+        start = self._start
+        if self._end - start >= HEADER.size:
+            length = HEADER.unpack_from(self._buffer, start)[0]
+            stop = start + HEADER.size + length
+            if stop <= self._end and (self.max_frame_size is None or length <= self.max_frame_size):
+                self._start = stop
+                return self._view[start:stop]
+
+        if self._end == self._start:
+            self._start = self._end = 0
+            if not self._receive(eof_ok=True):
+                return None
+        length = self._frame_length()
+        return self.read_exact(HEADER.size + length)
+
+    def read_payload(self) -> Optional[memoryview]:
+        """
+        The payload of the next frame, None if the connection was closed
+        between frames.
+        """
+        frame = self.read_frame()
+        return None if frame is None else frame[HEADER.size:]
+
+    def _frame_length(self) -> int:
+        length = HEADER.unpack(self.peek(HEADER.size))[0]
+        if self.max_frame_size is not None and length > self.max_frame_size:
+            raise ValueError(f"Frame of {length} bytes, at most {self.max_frame_size} are accepted")
+        return length
+
+    def _fill(self, n: int):
+        """
+        Buffer at least n unread bytes.
+        """
+        if self._end - self._start >= n:
+            return
+
+        if self._start + n > len(self._buffer):
+            pending = self._end - self._start
+            if n > len(self._buffer):
+                # Frames that don't fit get a larger buffer from now on
+                buffer = bytearray(max(n, 2 * len(self._buffer)))
+                buffer[:pending] = self._view[self._start:self._end]
+                self._buffer = buffer
+                self._view = memoryview(buffer)
+            else:
+                self._view[:pending] = self._view[self._start:self._end]
+            self._start = 0
+            self._end = pending
+
+        while self._end - self._start < n:
+            self._receive()
+
+    def _receive(self, eof_ok: bool = False) -> bool:
+        received = self.sock.recv_into(self._view[self._end:])
+        if not received:
+            if eof_ok:
+                return False
+            raise ConnectionError("connection closed by the other end")
+        self._end += received
+        return True
+
+
+def recv_exact(sock: socket.socket, n: int) -> bytearray:
+    """
+    Exactly n bytes from the socket, for one-off exchanges that don't keep
+    a FrameReader.
+
+    Raises:
+        ConnectionError: The other end closed before n bytes arrived.
+    """
+    data = bytearray(n)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError(f"connection closed after {n - len(view)} of {n} bytes")
+        view = view[received:]
+    return data
+
+
+def recv_payload(sock: socket.socket, max_frame_size: int = None) -> bytearray:
+    """
+    The payload of one frame, read without buffering past it.
+
+    Raises:
+        ValueError: The payload is longer than max_frame_size.
+    """
+    length = HEADER.unpack(recv_exact(sock, HEADER.size))[0]
+    if max_frame_size is not None and length > max_frame_size:
+        raise ValueError(f"Frame of {length} bytes, at most {max_frame_size} are accepted")
+    return recv_exact(sock, length)
+
+
+def pack_frame(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The code imports its packages from src/ (client, common, tracker, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
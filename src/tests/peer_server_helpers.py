@@ -0,0 +1,83 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+
+from client.file_sender import DescriptorCache
+from client.messages import Handshake
+from client.peer_server import PeerServer
+from client.piece_cache import PieceCache
+from client.seeding_catalog import SeededTorrent
+from common.framing import FrameReader
+
+PIECE_LENGTH = 64 * 1024
+
+
+def seeded_file(tmp_path, pieces=4):
+    path = str(tmp_path / "seeded.bin")
+    data = os.urandom(pieces * PIECE_LENGTH)
+    with open(path, "wb") as f:
+        f.write(data)
+    info_hash = hashlib.sha1(data).hexdigest()
+    torrent = SeededTorrent(name="seeded.bin", info_hash=info_hash, piece_length=PIECE_LENGTH, length=len(data),
+                            torrent_file_path="", torrent_size=0, torrent_mtime_ns=0, data_file_path=path)
+    return torrent, data
+
+
+def start_server(torrent, **kwargs):
+    server = PeerServer("127.0.0.1", 0, lambda info_hash: torrent if info_hash == torrent.info_hash else None,
+                        DescriptorCache(), PieceCache(16 * 1024 * 1024), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Leecher:
+    """
+    Raw peer connection to a PeerServer.
+    """
+
+    def __init__(self, server, torrent, handshake=True):
+        self.torrent = torrent
+        self.sock = socket.create_connection(server.listener.getsockname(), timeout=5)
+        self.reader = FrameReader(self.sock)
+        self.bitfield = None
+        if handshake:
+            self.handshake()
+
+    def handshake(self):
+        self.sock.sendall(Handshake(bytes.fromhex(self.torrent.info_hash)).to_bytes())
+        self.reader.read_exact(Handshake.LENGTH)
+        # The BitField always follows the handshake
+        self.bitfield = bytes(self.reader.read_frame())
+
+    def send(self, message):
+        self.sock.sendall(message.to_bytes())
+
+    def next_message(self, timeout=5.0):
+        """
+        (message id, frame) of the next message that isn't a keep-alive,
+        None if nothing arrives in time.
+        """
+        self.sock.settimeout(timeout)
+        try:
+            while True:
+                frame = self.reader.read_frame()
+                if frame is None:
+                    return None
+                if len(frame) > 4:
+                    return frame[4], bytes(frame)
+        except socket.timeout:
+            return None
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
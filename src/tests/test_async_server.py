@@ -0,0 +1,72 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+from common.framing import pack_frame, recv_payload
+from tracker.async_server import AsyncTrackerServer
+
+
+class EchoTracker:
+    def process_message(self, message):
+        return pack_frame(message["type"].encode())
+
+    def shutdown(self):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def connect(port):
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port), timeout=5)
+        except ConnectionRefusedError:
+            # The server thread may not be listening yet
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def request(sock, message_type):
+    sock.sendall(pack_frame(json.dumps({"type": message_type}).encode()))
+    return bytes(recv_payload(sock))
+
+
+def test_connections_over_the_limit_wait_to_be_accepted():
+    server = AsyncTrackerServer(EchoTracker(), max_connections=1, workers=1)
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve("127.0.0.1", port),), daemon=True)
+    thread.start()
+
+    first = connect(port)
+    try:
+        assert request(first, "get_torrent") == b"get_torrent"
+
+        # The kernel completes the handshake, the tracker doesn't accept it yet
+        second = socket.create_connection(("127.0.0.1", port), timeout=5)
+        second.sendall(pack_frame(json.dumps({"type": "get_predecessor"}).encode()))
+        second.settimeout(0.5)
+        try:
+            second.recv(1)
+            assert False, "a connection over the limit was served"
+        except socket.timeout:
+            pass
+        assert server.active_connections == 1
+        assert len(server._clients) == 1
+
+        first.close()
+        second.settimeout(5)
+        assert bytes(recv_payload(second)) == b"get_predecessor"
+        second.close()
+    finally:
+        first.close()
+        loop.call_soon_threadsafe(server.stop)
+        thread.join(5)
@@ -0,0 +1,43 @@
+import pytest
+
+from client.peer.bitfield import Bitfield
+
+
+def test_set_ones_and_bytes_round_trip_with_spare_bits():
+    bitfield = Bitfield(13)
+    for i in (0, 7, 8, 12):
+        bitfield[i] = True
+    bitfield[7] = True  # Setting twice counts once
+
+    assert bitfield.to_bytes() == bytes([0b10000001, 0b10001000])
+    assert list(bitfield.ones()) == [0, 7, 8, 12]
+    assert bitfield.count() == 4
+    assert [i for i, has in enumerate(bitfield) if has] == [0, 7, 8, 12]
+
+    copy = Bitfield.from_bytes(bitfield.to_bytes(), 13)
+    assert list(copy.ones()) == [0, 7, 8, 12]
+    assert copy.count() == 4
+
+    bitfield[8] = False
+    bitfield[8] = False
+    assert list(bitfield.ones()) == [0, 7, 12]
+    assert bitfield.count() == 3
+
+
+def test_spare_bits_of_a_payload_are_ignored():
+    # The last 3 bits of the second byte are past piece 12
+    bitfield = Bitfield.from_bytes(b"\xff\xff", 13)
+    assert bitfield.count() == 13
+    assert bitfield.all()
+    assert bitfield.to_bytes() == b"\xff\xf8"
+    assert bitfield.to_bytes() == Bitfield.full(13).to_bytes()
+
+
+def test_out_of_range_and_short_payloads_are_rejected():
+    bitfield = Bitfield(13)
+    with pytest.raises(IndexError):
+        bitfield[13] = True
+    with pytest.raises(IndexError):
+        bitfield[-1]
+    with pytest.raises(ValueError):
+        Bitfield.from_bytes(b"\xff", 13)
@@ -0,0 +1,117 @@
+from client.choker import Choker
+from client.messages import Choke, Interested, NotInterested, Request, Unchoke
+from tests.peer_server_helpers import Leecher, seeded_file, start_server, wait_for
+
+
+class FakePeer:
+    def __init__(self, name, upload_rate, interested, connected_at):
+        self.name = name
+        self.addr = (name, 6881)
+        self.upload_rate = upload_rate
+        self.interested = interested
+        self.connected_at = connected_at
+
+
+def peer(name, upload_rate=0.0, interested=True, connected_at=0.0):
+    return FakePeer(name, upload_rate, interested, connected_at)
+
+
+def test_slots_are_never_exceeded():
+    choker = Choker(slots=4)
+    peers = [peer(f"10.0.0.{i}", upload_rate=i) for i in range(10)]
+    for round_ in range(10):
+        unchoked = choker.rechoke(peers, now=100.0 + 10 * round_)
+        assert len(unchoked) == 4
+        # The three fastest keep their regular slots, the fourth is optimistic
+        assert {p.name for p in peers[-3:]} <= {p.name for p in unchoked}
+        assert choker.optimistic in unchoked
+        assert choker.optimistic not in peers[-3:]
+
+
+def test_uninterested_peers_get_no_slot():
+    choker = Choker(slots=3)
+    peers = [peer("a", 5.0), peer("b", 9.0, interested=False), peer("c", 1.0)]
+    assert choker.rechoke(peers, now=0.0) == {peers[0], peers[2]}
+
+
+def test_reciprocation_ranks_first():
+    rates = {"uploader": 1000.0}
+    choker = Choker(slots=2, download_rate=lambda ip: rates.get(ip, 0.0))
+    uploader, fast = peer("uploader", upload_rate=1.0), peer("fast", upload_rate=10_000.0)
+    others = [peer(f"other{i}", upload_rate=i) for i in range(3)]
+    unchoked = choker.rechoke([fast, uploader] + others, now=0.0)
+    # One regular slot: it goes to the peer we download from
+    assert uploader in unchoked and len(unchoked) == 2
+    assert choker.best([fast, uploader]) is uploader
+
+
+def test_optimistic_slot_rotates_and_is_forgotten():
+    choker = Choker(slots=2)
+    peers = [peer(f"p{i}") for i in range(5)]
+    choker.rechoke(peers, now=0.0)
+    first = choker.optimistic
+    # Kept for OPTIMISTIC_ROUNDS rotations
+    for _ in range(Choker.OPTIMISTIC_ROUNDS - 1):
+        choker.rechoke(peers, now=0.0)
+        assert choker.optimistic is first
+
+    choker.forget(first)
+    assert choker.optimistic is None
+    remaining = [p for p in peers if p is not first]
+    unchoked = choker.rechoke(remaining, now=0.0)
+    assert len(unchoked) == 2 and choker.optimistic in remaining
+
+
+def test_single_slot_has_no_optimistic_unchoke():
+    choker = Choker(slots=1)
+    peers = [peer("slow", 1.0), peer("fast", 2.0)]
+    assert choker.rechoke(peers, now=0.0) == {peers[1]}
+    assert choker.optimistic is None
+
+
+def unchoked_leechers(leechers, timeout):
+    return [leecher for leecher in leechers
+            if (message := leecher.next_message(timeout)) is not None and message[0] == Unchoke.message_id]
+
+
+def test_seeder_fills_freed_slots(tmp_path):
+    torrent, _ = seeded_file(tmp_path)
+    server = start_server(torrent, upload_slots=2)
+    leechers = [Leecher(server, torrent) for _ in range(3)]
+    try:
+        for leecher in leechers:
+            leecher.send(Interested())
+        unchoked = unchoked_leechers(leechers, timeout=0.5)
+        assert len(unchoked) == 2
+        assert server.stats()["unchoked"] == 2
+        [waiting] = [leecher for leecher in leechers if leecher not in unchoked]
+
+        # A disconnect frees a slot for the waiting peer
+        unchoked[0].close()
+        assert waiting.next_message()[0] == Unchoke.message_id
+
+        # So does losing interest, but nobody is left waiting
+        unchoked[1].send(NotInterested())
+        assert unchoked[1].next_message()[0] == Choke.message_id
+        assert wait_for(lambda: server.stats()["unchoked"] == 1)
+    finally:
+        for leecher in leechers:
+            leecher.close()
+        server.close()
+
+
+def test_choked_peers_requests_are_ignored(tmp_path):
+    torrent, _ = seeded_file(tmp_path)
+    server = start_server(torrent, upload_slots=1)
+    first, second = Leecher(server, torrent), Leecher(server, torrent)
+    try:
+        first.send(Interested())
+        assert first.next_message()[0] == Unchoke.message_id
+        second.send(Interested())
+        second.send(Request(0, 0, 16384))
+        assert second.next_message(timeout=0.5) is None
+        assert server.uploaded == 0
+    finally:
+        first.close()
+        second.close()
+        server.close()
@@ -0,0 +1,95 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from common.framing import pack_frame, recv_payload
+from tracker.connection_pool import ConnectionPool
+
+
+class Node:
+    """
+    Answers every request with its own payload, `handle(conn, payload)` can
+    do something else instead. Keeps every request received.
+    """
+
+    def __init__(self, handle=None):
+        self.handle = handle
+        self.requests = []
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(8)
+        self.address = self.server.getsockname()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    payload = bytes(recv_payload(conn))
+                except (ConnectionError, OSError):
+                    return
+                self.requests.append(payload)
+                if self.handle is None or not self.handle(conn, payload):
+                    conn.sendall(pack_frame(payload))
+
+    def close(self):
+        self.server.close()
+
+
+def exchange(payload):
+    def fn(sock):
+        sock.sendall(pack_frame(payload))
+        return bytes(recv_payload(sock))
+    return fn
+
+
+def test_stale_connection_is_retried_on_a_new_one():
+    def close_after_first(conn, payload):
+        if payload == b"first":
+            conn.sendall(pack_frame(payload))
+            # The node drops the connection while it sits idle in the pool
+            conn.shutdown(socket.SHUT_RDWR)
+            return True
+        return False
+
+    node = Node(close_after_first)
+    pool = ConnectionPool(io_timeout=2.0)
+    try:
+        assert pool.call(node.address, exchange(b"first")) == b"first"
+        time.sleep(0.1)
+        assert pool.call(node.address, exchange(b"second")) == b"second"
+        assert node.requests == [b"first", b"second"]
+    finally:
+        pool.close()
+        node.close()
+
+
+def test_timeout_after_sending_is_not_retried():
+    def stall(conn, payload):
+        if payload == b"slow":
+            time.sleep(1.0)
+            return True
+        return False
+
+    node = Node(stall)
+    pool = ConnectionPool(io_timeout=0.3)
+    try:
+        assert pool.call(node.address, exchange(b"first")) == b"first"
+        with pytest.raises(socket.timeout):
+            pool.call(node.address, exchange(b"slow"))
+        time.sleep(1.0)
+        # The request reached the node once, it wasn't sent again
+        assert node.requests == [b"first", b"slow"]
+    finally:
+        pool.close()
+        node.close()
@@ -0,0 +1,280 @@
+import hashlib
+import os
+import socket
+import struct
+import threading
+import time
+
+from client.messages import BitField, Handshake, Piece, Unchoke
+from client.peer.bitfield import Bitfield
+from client.peer.block import BLOCK_SIZE
+from client.peer.download_engine import DownloadEngine
+from client.peer.peer import Peer
+from client.peer.piecesController import PieceController
+from torrents.merkle import hash_blocks, merkle_root
+from torrents.torrent_info import TorrentInfo
+
+PIECE_LENGTH = 32 * 1024
+
+
+def make_torrent(data, merkle=False):
+    pieces = "".join(hashlib.sha1(data[i:i + PIECE_LENGTH]).hexdigest()
+                     for i in range(0, len(data), PIECE_LENGTH))
+    torrent = TorrentInfo(announce="", info_hash=hashlib.sha1(data).hexdigest(), name="data",
+                          piece_length=PIECE_LENGTH, length=len(data), pieces=pieces)
+    if merkle:
+        leaves = b"".join(hash_blocks(data[i:i + PIECE_LENGTH]) for i in range(0, len(data), PIECE_LENGTH))
+        torrent.block_hashes = leaves.hex()
+        torrent.merkle_root = merkle_root(leaves).hex()
+    return torrent
+
+
+def recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_frame(conn):
+    header = recv_exact(conn, 4)
+    if header is None:
+        return None
+    return header + recv_exact(conn, struct.unpack(">I", header)[0])
+
+
+class StallingSeeder:
+    """
+    Seeder of one connection that ignores every request received during the
+    first `stall` seconds and answers the rest. It announces the pieces in
+    `pieces`, all of them by default, and damages the first `corrupt` blocks
+    it sends.
+    """
+
+    def __init__(self, data, info_hash, stall=0.0, pieces=None, corrupt=0):
+        self.data = data
+        self.info_hash = info_hash
+        self.stall = stall
+        self.corrupt = corrupt
+        number_of_pieces = (len(data) + PIECE_LENGTH - 1) // PIECE_LENGTH
+        self.pieces = set(range(number_of_pieces)) if pieces is None else set(pieces)
+        bitfield = Bitfield(number_of_pieces)
+        for i in self.pieces:
+            bitfield[i] = True
+        self.bitfield = bitfield.to_bytes()
+        self.answered = 0
+        self.requests = []
+        self.cancels = []
+        self.corrupted = []
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.server.accept()
+        with conn:
+            recv_exact(conn, Handshake.LENGTH)
+            conn.sendall(Handshake(self.info_hash).to_bytes() + BitField(self.bitfield).to_bytes()
+                         + Unchoke().to_bytes())
+
+            stall_until = time.monotonic() + self.stall
+            try:
+                while (frame := recv_frame(conn)) is not None:
+                    if len(frame) < 17 or frame[4] not in (6, 8):
+                        continue
+                    _, message_id, index, begin, length = struct.unpack(">IBIII", frame[:17])
+                    if message_id == 8:
+                        self.cancels.append((index, begin, length))
+                        continue
+                    self.requests.append((index, begin))
+                    if time.monotonic() < stall_until or index not in self.pieces:
+                        continue
+                    start = index * PIECE_LENGTH + begin
+                    block = self.data[start:start + length]
+                    if len(self.corrupted) < self.corrupt:
+                        block = bytes([block[0] ^ 0xFF]) + block[1:]
+                        self.corrupted.append((index, begin))
+                    conn.sendall(Piece(index, begin, block).to_bytes())
+                    self.answered += 1
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+
+def connect(engine, seeder, torrent, peer_id=1):
+    peer = Peer(peer_id, "127.0.0.1", seeder.port)
+    peer.connect()
+    peer.handshake(bytes.fromhex(torrent.info_hash), engine.controller.number_of_pieces)
+    engine.add_peer(peer)
+    peer.start()
+    return peer
+
+
+def run_in_thread(engine, timeout):
+    result = {}
+    runner = threading.Thread(target=lambda: result.update(done=engine.run()), daemon=True)
+    runner.start()
+    runner.join(timeout)
+    assert not runner.is_alive(), "run() never returned"
+    return result["done"]
+
+
+def test_download_without_peers_fails(tmp_path):
+    torrent = make_torrent(os.urandom(2 * PIECE_LENGTH))
+    output_path = str(tmp_path / "data.bin")
+    engine = DownloadEngine(PieceController(torrent, output_path), output_path)
+
+    assert run_in_thread(engine, 5) is False
+
+
+def test_download_fails_when_no_peer_has_a_missing_piece(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    seeder = StallingSeeder(data, bytes.fromhex(torrent.info_hash), pieces=[1, 2, 3])
+
+    output_path = str(tmp_path / "data.bin")
+    controller = PieceController(torrent, output_path)
+    engine = DownloadEngine(controller, output_path)
+    engine.MAINTENANCE_INTERVAL = 0.1
+    engine.SUPPLY_TIMEOUT = 0.5
+
+    peer = connect(engine, seeder, torrent)
+    try:
+        assert run_in_thread(engine, 10) is False
+    finally:
+        peer.close()
+        seeder.close()
+
+    # Everything the peer had was still downloaded
+    assert [bool(has) for has in controller.bitfield] == [False, True, True, True]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_endgame_duplicates_stalled_blocks_and_cancels_them(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    info_hash = bytes.fromhex(torrent.info_hash)
+    stalled = StallingSeeder(data, info_hash, stall=60.0)
+    fast = StallingSeeder(data, info_hash)
+
+    output_path = str(tmp_path / "data.bin")
+    engine = DownloadEngine(PieceController(torrent, output_path), output_path)
+
+    peers = [connect(engine, stalled, torrent, 1), connect(engine, fast, torrent, 2)]
+    try:
+        # Without endgame the blocks given to the stalled seeder never arrive
+        assert run_in_thread(engine, 20) is True
+        assert engine.stats.endgame_entered
+        assert engine.stats.cancels_sent > 0
+        assert wait_for(lambda: len(stalled.cancels) == engine.stats.cancels_sent)
+        assert stalled.answered == 0
+    finally:
+        for peer in peers:
+            peer.close()
+        stalled.close()
+        fast.close()
+
+    with open(output_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_peer_gets_requests_again_after_timeout_backoff(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    seeder = StallingSeeder(data, bytes.fromhex(torrent.info_hash), stall=2.0)
+
+    output_path = str(tmp_path / "data.bin")
+    engine = DownloadEngine(PieceController(torrent, output_path), output_path)
+    engine.MIN_REQUEST_TIMEOUT = 1.0
+
+    peer = connect(engine, seeder, torrent)
+    try:
+        assert run_in_thread(engine, 20) is True, "the download never resumed after the backoff"
+    finally:
+        peer.close()
+        seeder.close()
+
+    # Every request sent during the stall timed out and put the peer in backoff
+    assert engine.stats.timeouts > 0
+    with open(output_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_short_last_piece_and_block_are_downloaded(tmp_path):
+    # The last piece has one full block and a 1000-byte one
+    data = os.urandom(3 * PIECE_LENGTH + BLOCK_SIZE + 1000)
+    torrent = make_torrent(data)
+    seeder = StallingSeeder(data, bytes.fromhex(torrent.info_hash))
+
+    output_path = str(tmp_path / "data.bin")
+    engine = DownloadEngine(PieceController(torrent, output_path), output_path)
+
+    peer = connect(engine, seeder, torrent)
+    try:
+        assert run_in_thread(engine, 10) is True
+    finally:
+        peer.close()
+        seeder.close()
+
+    with open(output_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_corrupt_block_is_blamed_on_its_peer_and_downloaded_again(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data, merkle=True)
+    info_hash = bytes.fromhex(torrent.info_hash)
+    bad = StallingSeeder(data, info_hash, corrupt=1)
+    good = StallingSeeder(data, info_hash)
+
+    output_path = str(tmp_path / "data.bin")
+    controller = PieceController(torrent, output_path)
+    assert controller.block_digests is not None
+    # No endgame: every block is requested once unless it has to be again
+    engine = DownloadEngine(controller, output_path, endgame_threshold=0)
+
+    bad_peer, good_peer = connect(engine, bad, torrent, 1), connect(engine, good, torrent, 2)
+    try:
+        assert run_in_thread(engine, 20) is True
+    finally:
+        bad_peer.close()
+        good_peer.close()
+        bad.close()
+        good.close()
+
+    assert len(bad.corrupted) == 1
+    assert engine.stats.corrupt_blocks == 1
+    assert bad_peer.stats.corrupt_blocks == 1
+    assert good_peer.stats.corrupt_blocks == 0
+
+    # Only the corrupt block was requested twice, not the rest of its piece
+    requests = bad.requests + good.requests
+    blocks = {(index, begin) for index in range(4) for begin in range(0, PIECE_LENGTH, BLOCK_SIZE)}
+    assert sorted(requests) == sorted(list(blocks) + bad.corrupted)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_block_hashes_that_dont_match_the_root_are_ignored(tmp_path):
+    data = os.urandom(2 * PIECE_LENGTH)
+    torrent = make_torrent(data, merkle=True)
+    torrent.merkle_root = "00" * 20
+
+    controller = PieceController(torrent, str(tmp_path / "data.bin"))
+    assert controller.block_digests is None
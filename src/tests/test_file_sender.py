@@ -0,0 +1,75 @@
+import os
+import socket
+
+import pytest
+
+from client.file_sender import DescriptorCache, send_block
+
+
+def is_open(fd):
+    try:
+        os.fstat(fd)
+        return True
+    except OSError:
+        return False
+
+
+def make_files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"file{i}.bin"
+        path.write_bytes(bytes([i]) * 100)
+        paths.append(str(path))
+    return paths
+
+
+def test_descriptors_are_reused_and_evicted_lru(tmp_path):
+    a, b, c = make_files(tmp_path, 3)
+    cache = DescriptorCache(capacity=2)
+
+    with cache.open(a) as fd_a:
+        pass
+    with cache.open(a) as again:
+        assert again == fd_a
+    with cache.open(b):
+        pass
+    with cache.open(c):
+        pass
+
+    assert cache.stats() == {"open": 2, "hits": 1, "misses": 3}
+    assert not is_open(fd_a)
+
+
+def test_evicted_descriptor_in_use_is_closed_on_release(tmp_path):
+    a, b = make_files(tmp_path, 2)
+    cache = DescriptorCache(capacity=1)
+
+    fd_a = cache.acquire(a)
+    with cache.open(b):
+        pass
+    # Evicted by b but still being read from
+    assert os.pread(fd_a, 1, 0) == b"\x00"
+    cache.release(fd_a)
+    assert not is_open(fd_a)
+    cache.close()
+
+
+def test_send_block_sends_header_and_file_range(tmp_path):
+    path = tmp_path / "data.bin"
+    data = os.urandom(10000)
+    path.write_bytes(data)
+    sender, receiver = socket.socketpair()
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        send_block(sender, b"HDR", fd, 1000, 5000)
+        received = b""
+        while len(received) < 5003:
+            received += receiver.recv(65536)
+        assert received == b"HDR" + data[1000:6000]
+
+        with pytest.raises(EOFError):
+            send_block(sender, b"HDR", fd, 9000, 5000)
+    finally:
+        os.close(fd)
+        sender.close()
+        receiver.close()
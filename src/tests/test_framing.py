@@ -0,0 +1,108 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from client.messages import Choke, Have, KeepAlive, Request
+from common.framing import HEADER, FrameReader, pack_frame, recv_exact, recv_payload
+
+
+def test_oversized_frames_are_rejected_before_reading_them():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(HEADER.pack(0xFFFFFFFF) + b"x")
+        reader = FrameReader(receiver, buffer_size=16, max_frame_size=1024)
+        with pytest.raises(ValueError):
+            reader.read_frame()
+        # The buffer didn't grow to the announced length
+        assert len(reader._buffer) == 16
+
+
+def test_recv_payload_rejects_oversized_frames():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(HEADER.pack(2048))
+        with pytest.raises(ValueError):
+            recv_payload(receiver, max_frame_size=1024)
+
+
+def send_in_fragments(sock, data, size=1):
+    def run():
+        for offset in range(0, len(data), size):
+            sock.sendall(data[offset:offset + size])
+            time.sleep(0)
+        sock.shutdown(socket.SHUT_WR)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_frames_survive_short_reads():
+    payloads = [b"", b"a", bytes(range(256)) * 3, os.urandom(70000), b"end"]
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        writer = send_in_fragments(sender, b"".join(pack_frame(payload) for payload in payloads), size=7)
+        # Smaller than some frames, so the buffer compacts and grows
+        reader = FrameReader(receiver, buffer_size=64)
+        received = []
+        while (payload := reader.read_payload()) is not None:
+            received.append(bytes(payload))
+        writer.join()
+    assert received == payloads
+
+
+def test_read_into_takes_buffered_bytes_first():
+    block = os.urandom(5000)
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        writer = send_in_fragments(sender, HEADER.pack(len(block)) + block, size=100)
+        reader = FrameReader(receiver, buffer_size=256)
+        length = HEADER.unpack(reader.read_exact(HEADER.size))[0]
+        target = bytearray(length)
+        reader.read_into(memoryview(target))
+        writer.join()
+    assert target == block
+
+
+def test_connection_closed_inside_a_frame():
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(pack_frame(b"whole") + HEADER.pack(10) + b"half")
+        sender.shutdown(socket.SHUT_WR)
+        reader = FrameReader(receiver)
+        assert bytes(reader.read_payload()) == b"whole"
+        with pytest.raises(ConnectionError):
+            reader.read_frame()
+
+
+def test_recv_exact_waits_for_every_byte():
+    data = os.urandom(3000)
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        writer = send_in_fragments(sender, pack_frame(data), size=1)
+        assert recv_payload(receiver) == data
+        writer.join()
+        with pytest.raises(ConnectionError):
+            recv_exact(receiver, 1)
+
+
+def test_messages_decode_from_views_of_the_buffer():
+    stream = bytearray(Have(7).to_bytes() + KeepAlive().to_bytes() + Request(1, 16384, 16384).to_bytes()
+                       + Choke().to_bytes())
+    frames = []
+    with memoryview(stream) as view:
+        pos = 0
+        while pos < len(stream):
+            end = pos + HEADER.size + HEADER.unpack_from(stream, pos)[0]
+            frames.append(view[pos:end])
+            pos = end
+
+        assert Have.from_bytes(frames[0]).piece_index == 7
+        assert len(frames[1]) == HEADER.size
+        request = Request.from_bytes(frames[2])
+        assert (request.piece_index, request.block_offset, request.block_length) == (1, 16384, 16384)
+        assert isinstance(Choke.from_bytes(frames[3]), Choke)
+        for frame in frames:
+            frame.release()
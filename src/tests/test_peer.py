@@ -0,0 +1,51 @@
+import time
+
+from client.peer.block import BLOCK_SIZE
+from client.peer.peer import Peer
+
+
+def receive_blocks(peer, rtt, blocks_per_second, seconds):
+    """
+    Feeds the measurements of full blocks answered after `rtt`, arriving at a
+    steady rate, on a simulated clock.
+    """
+    start = time.monotonic()
+    count = int(blocks_per_second * seconds)
+    for i in range(1, count + 1):
+        peer._update_measurements(rtt, BLOCK_SIZE, start + i / blocks_per_second)
+
+
+def test_depth_grows_by_one_per_answer_until_throughput_is_known():
+    peer = Peer("p", "127.0.0.1", 6881, min_pipeline=2, max_pipeline=64)
+    assert peer.pipeline_depth == 2
+
+    start = time.monotonic()
+    for i in range(3):
+        # All within the first throughput sample interval
+        peer._update_measurements(0.05, BLOCK_SIZE, start + 0.01 * i)
+    assert peer.pipeline_depth == 5
+
+
+def test_low_rtt_keeps_a_shallow_pipeline():
+    peer = Peer("p", "127.0.0.1", 6881, min_pipeline=2, max_pipeline=64)
+    # 200 blocks/s (3.2 MiB/s) at 1 ms: less than one block in flight
+    receive_blocks(peer, 0.001, 200, 2)
+    assert peer.pipeline_depth == 3
+
+
+def test_high_rtt_follows_the_bandwidth_delay_product():
+    peer = Peer("p", "127.0.0.1", 6881, min_pipeline=2, max_pipeline=64)
+    # 200 blocks/s at 100 ms: about 20 blocks in flight, plus the slack of 2
+    receive_blocks(peer, 0.1, 200, 2)
+    assert 20 <= peer.pipeline_depth <= 24
+
+
+def test_depth_stays_within_its_bounds():
+    deep = Peer("p", "127.0.0.1", 6881, min_pipeline=2, max_pipeline=16)
+    # 1 s RTT would want about 200 requests in flight
+    receive_blocks(deep, 1.0, 200, 2)
+    assert deep.pipeline_depth == 16
+
+    shallow = Peer("p", "127.0.0.1", 6881, min_pipeline=8, max_pipeline=64)
+    receive_blocks(shallow, 0.001, 200, 2)
+    assert shallow.pipeline_depth == 8
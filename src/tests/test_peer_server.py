@@ -0,0 +1,112 @@
+import os
+from functools import partial
+
+from client.messages import Have, Interested, Piece, Request, Unchoke
+from client.peer.download_engine import DownloadEngine
+from client.peer.piecesController import PieceController
+from client.seeding_catalog import SeededTorrent
+from tests.peer_server_helpers import PIECE_LENGTH, Leecher, seeded_file, start_server, wait_for
+from tests.test_download_engine import PIECE_LENGTH as DOWNLOAD_PIECE_LENGTH
+from tests.test_download_engine import StallingSeeder, connect, make_torrent, run_in_thread
+
+
+def test_blocks_are_served_from_the_file(tmp_path):
+    torrent, data = seeded_file(tmp_path)
+    server = start_server(torrent)
+    leecher = Leecher(server, torrent)
+    try:
+        leecher.send(Interested())
+        assert leecher.next_message()[0] == Unchoke.message_id
+
+        for piece_index, block_offset in ((0, 0), (2, 16384), (3, 49152)):
+            leecher.send(Request(piece_index, block_offset, 16384))
+            message_id, frame = leecher.next_message()
+            assert message_id == Piece.message_id
+            index, offset, block = Piece.from_bytes(frame)
+            start = piece_index * PIECE_LENGTH + block_offset
+            assert (index, offset, block) == (piece_index, block_offset, data[start:start + 16384])
+    finally:
+        leecher.close()
+        server.close()
+
+
+def test_peers_over_the_limit_wait_in_the_backlog(tmp_path):
+    torrent, _ = seeded_file(tmp_path)
+    server = start_server(torrent, max_peers=2)
+    leechers = [Leecher(server, torrent) for _ in range(2)]
+    try:
+        assert wait_for(lambda: not server.stats()["accepting"])
+
+        waiting = Leecher(server, torrent, handshake=False)
+        leechers.append(waiting)
+        assert server.stats()["peers"] == 2
+
+        # A slot frees up and the waiting peer is accepted and answered
+        leechers[0].close()
+        waiting.handshake()
+        assert server.stats()["peers"] == 2
+    finally:
+        for leecher in leechers:
+            leecher.close()
+        server.close()
+
+
+def test_connections_per_address_are_capped(tmp_path):
+    torrent, _ = seeded_file(tmp_path)
+    server = start_server(torrent, max_peers_per_ip=1)
+    first = Leecher(server, torrent)
+    second = Leecher(server, torrent, handshake=False)
+    try:
+        # Closed right away instead of taking another connection of the address
+        assert second.next_message() is None
+        assert wait_for(lambda: server.stats()["rejected"] == 1)
+        assert server.stats()["peers"] == 1
+    finally:
+        first.close()
+        second.close()
+        server.close()
+
+
+def test_download_in_progress_serves_the_pieces_it_has(tmp_path):
+    data = os.urandom(4 * DOWNLOAD_PIECE_LENGTH)
+    torrent = make_torrent(data)
+    output_path = str(tmp_path / "data.bin")
+    controller = PieceController(torrent, output_path)
+    seed = SeededTorrent(name="data.bin", info_hash=torrent.info_hash, piece_length=torrent.piece_length,
+                         length=torrent.length, torrent_file_path="", torrent_size=0, torrent_mtime_ns=0,
+                         data_file_path=output_path, bitfield=controller.bitfield)
+    server = start_server(seed)
+    leecher = Leecher(server, seed)
+    seeder = StallingSeeder(data, bytes.fromhex(torrent.info_hash))
+    peer = None
+    try:
+        # Nothing downloaded yet: nothing announced and nothing served
+        assert not any(leecher.bitfield[5:])
+        leecher.send(Interested())
+        assert leecher.next_message()[0] == Unchoke.message_id
+        leecher.send(Request(0, 0, 16384))
+        assert leecher.next_message(timeout=0.5) is None
+
+        engine = DownloadEngine(controller, output_path, on_piece=partial(server.broadcast_have, torrent.info_hash))
+        peer = connect(engine, seeder, torrent)
+        assert run_in_thread(engine, 10) is True
+
+        # Every piece on disk is announced, then served
+        announced = set()
+        while len(announced) < 4:
+            message_id, frame = leecher.next_message()
+            assert message_id == Have.message_id
+            announced.add(Have.from_bytes(frame).piece_index)
+        assert announced == {0, 1, 2, 3}
+
+        leecher.send(Request(3, 16384, 16384))
+        message_id, frame = leecher.next_message()
+        assert message_id == Piece.message_id
+        start = 3 * DOWNLOAD_PIECE_LENGTH + 16384
+        assert Piece.from_bytes(frame) == (3, 16384, data[start:start + 16384])
+    finally:
+        if peer is not None:
+            peer.close()
+        seeder.close()
+        leecher.close()
+        server.close()
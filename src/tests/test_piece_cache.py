@@ -0,0 +1,78 @@
+import os
+import threading
+
+from client.piece_cache import PieceCache
+
+PIECE = 1024
+
+
+def data_file(tmp_path, pieces=4):
+    path = tmp_path / "data.bin"
+    data = os.urandom(pieces * PIECE)
+    path.write_bytes(data)
+    return str(path), data
+
+
+def test_whole_piece_is_read_on_the_first_block(tmp_path):
+    path, data = data_file(tmp_path)
+    cache = PieceCache(4 * PIECE)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        assert bytes(cache.get_block(fd, path, 1, PIECE, PIECE, 0, 256)) == data[PIECE:PIECE + 256]
+        # The other blocks of the piece come from memory
+        assert bytes(cache.lookup(path, 1, 256, 256)) == data[PIECE + 256:PIECE + 512]
+        assert cache.lookup(path, 2, 0, 256) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+    finally:
+        os.close(fd)
+
+
+def test_least_recently_used_pieces_are_evicted(tmp_path):
+    path, _ = data_file(tmp_path)
+    cache = PieceCache(2 * PIECE)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for piece_index in (0, 1):
+            cache.read_ahead(fd, path, piece_index, piece_index * PIECE, PIECE)
+        cache.lookup(path, 0, 0, 1)
+        cache.read_ahead(fd, path, 2, 2 * PIECE, PIECE)
+
+        assert cache.lookup(path, 1, 0, 1) is None
+        assert cache.lookup(path, 0, 0, 1) is not None
+        assert cache.size == 2 * PIECE and cache.evictions == 1
+
+        cache.invalidate(path)
+        assert cache.size == 0
+    finally:
+        os.close(fd)
+
+
+def test_pieces_larger_than_the_cache_are_not_cached(tmp_path):
+    path, _ = data_file(tmp_path)
+    cache = PieceCache(PIECE // 2)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        assert cache.get_block(fd, path, 0, 0, PIECE, 0, 16) is None
+        cache.read_ahead(fd, path, 0, 0, PIECE)
+        assert cache.size == 0
+    finally:
+        os.close(fd)
+
+
+def test_concurrent_misses_read_the_piece_once(tmp_path):
+    path, data = data_file(tmp_path)
+    cache = PieceCache(4 * PIECE)
+    fd = os.open(path, os.O_RDONLY)
+    blocks = []
+    try:
+        threads = [threading.Thread(target=lambda: blocks.append(bytes(cache.get_block(fd, path, 3, 3 * PIECE,
+                                                                                       PIECE, 0, PIECE))))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert blocks == [data[3 * PIECE:]] * 8
+        assert cache.misses == 1
+    finally:
+        os.close(fd)
@@ -0,0 +1,88 @@
+from client.peer.bitfield import Bitfield
+from client.peer.block import BLOCK_SIZE
+from client.peer.piecesController import PieceController
+from torrents.torrent_info import TorrentInfo
+
+
+def make_bitfield(bits):
+    bitfield = Bitfield(len(bits))
+    for i, has in enumerate(bits):
+        bitfield[i] = has
+    return bitfield
+
+
+def make_controller(tmp_path, number_of_pieces, piece_length=BLOCK_SIZE, length=None):
+    torrent = TorrentInfo(announce="", info_hash="00" * 20, name="data", piece_length=piece_length,
+                          length=length or number_of_pieces * piece_length, pieces="00" * 20 * number_of_pieces)
+    return PieceController(torrent, str(tmp_path / "data.bin"))
+
+
+class FakePeer:
+    def __init__(self, bitfield=None):
+        self.bitfield = bitfield
+
+
+def started_pieces(controller, peer=None):
+    """
+    Order in which next_block starts pieces (one block per piece).
+    """
+    order = []
+    while (work := controller.next_block(peer or FakePeer())) is not None:
+        order.append(work[0])
+    return order
+
+
+def test_rarest_pieces_are_started_first(tmp_path):
+    controller = make_controller(tmp_path, 5)
+    # BitFields of three peers, then Have messages from two of them
+    controller.add_peer_bitfield(make_bitfield([True, True, True, True, True]))
+    controller.add_peer_bitfield(make_bitfield([True, True, True, False, False]))
+    controller.add_peer_bitfield(make_bitfield([True, False, False, False, False]))
+    controller.add_have(4)
+    controller.add_have(1)
+
+    assert list(controller.availability) == [3, 3, 2, 1, 2]
+    order = started_pieces(controller)
+    assert order[0] == 3
+    assert set(order[1:3]) == {2, 4}
+    assert set(order[3:]) == {0, 1}
+
+
+def test_peer_only_gets_pieces_it_has(tmp_path):
+    controller = make_controller(tmp_path, 5)
+    controller.add_peer_bitfield(make_bitfield([True, True, True, True, True]))
+    peer_bitfield = make_bitfield([True, True, True, False, False])
+    controller.add_peer_bitfield(peer_bitfield)
+    controller.add_have(0)
+    controller.add_have(1)
+
+    # Pieces 3 and 4 are rarer but the peer doesn't have them
+    assert started_pieces(controller, FakePeer(peer_bitfield))[0] == 2
+
+
+def test_pieces_nobody_announced_are_unavailable(tmp_path):
+    controller = make_controller(tmp_path, 4)
+    seeder = make_bitfield([True, True, True, False])
+    leecher = make_bitfield([False, False, True, False])
+    controller.add_peer_bitfield(seeder)
+    controller.add_peer_bitfield(leecher)
+    assert controller.unavailable_pieces() == [3]
+
+    controller.remove_peer_bitfield(seeder)
+    assert controller.unavailable_pieces() == [0, 1, 3]
+    assert list(controller.availability) == [0, 0, 1, 0]
+
+
+def test_short_last_piece_and_block_sizes(tmp_path):
+    piece_length = 4 * BLOCK_SIZE
+    # Last piece: one full block and a 100-byte one
+    controller = make_controller(tmp_path, 3, piece_length=piece_length,
+                                 length=2 * piece_length + BLOCK_SIZE + 100)
+
+    assert controller.piece_size(0) == piece_length
+    assert controller.piece_size(2) == BLOCK_SIZE + 100
+    assert controller.num_blocks(1) == 4
+    assert controller.num_blocks(2) == 2
+    assert controller.block_size(1, 3) == BLOCK_SIZE
+    assert controller.block_size(2, 0) == BLOCK_SIZE
+    assert controller.block_size(2, 1) == 100
@@ -0,0 +1,122 @@
+import hashlib
+import os
+
+from client.peer.bitfield import Bitfield
+from client.peer.download_engine import DownloadEngine
+from client.peer.piecesController import PieceController
+from client.peer.resume import FastResume
+from torrents.torrent_info import TorrentInfo
+
+
+def make_bitfield(bits):
+    bitfield = Bitfield(len(bits))
+    for i, has in enumerate(bits):
+        bitfield[i] = has
+    return bitfield
+
+PIECE_LENGTH = 32 * 1024
+
+
+def make_torrent(data):
+    pieces = "".join(hashlib.sha1(data[i:i + PIECE_LENGTH]).hexdigest()
+                     for i in range(0, len(data), PIECE_LENGTH))
+    return TorrentInfo(announce="", info_hash=hashlib.sha1(data).hexdigest(), name="data",
+                       piece_length=PIECE_LENGTH, length=len(data), pieces=pieces)
+
+
+def write_pieces(path, data, pieces):
+    """
+    Output file with only `pieces` downloaded, zeros elsewhere.
+    """
+    content = bytearray(len(data))
+    for i in pieces:
+        content[i * PIECE_LENGTH:(i + 1) * PIECE_LENGTH] = data[i * PIECE_LENGTH:(i + 1) * PIECE_LENGTH]
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def new_engine(torrent, path):
+    return DownloadEngine(PieceController(torrent, path), path)
+
+
+def rechecks(engine):
+    """
+    Counts the rechecks done by the engine.
+    """
+    calls = []
+    recheck = engine.resume.recheck
+
+    def counting(*args, **kwargs):
+        calls.append(1)
+        return recheck(*args, **kwargs)
+
+    engine.resume.recheck = counting
+    return calls
+
+
+def test_resume_file_restores_only_the_verified_pieces(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    path = str(tmp_path / "data.bin")
+    write_pieces(path, data, [0, 2])
+    FastResume(path, torrent).save(make_bitfield([True, False, True, False]))
+
+    engine = new_engine(torrent, path)
+    calls = rechecks(engine)
+    assert engine.restore() == 2
+    assert not calls
+    assert list(engine.controller.bitfield) == [True, False, True, False]
+    assert not engine.controller.is_complete()
+
+
+def test_stale_resume_file_falls_back_to_a_recheck(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    path = str(tmp_path / "data.bin")
+    write_pieces(path, data, [0, 1, 2, 3])
+    FastResume(path, torrent).save(make_bitfield([True] * 4))
+
+    # Piece 1 changes after the state was saved
+    with open(path, "r+b") as f:
+        f.seek(PIECE_LENGTH)
+        f.write(b"\0" * 10)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    engine = new_engine(torrent, path)
+    calls = rechecks(engine)
+    assert engine.restore() == 3
+    assert calls
+    assert list(engine.controller.bitfield) == [True, False, True, True]
+
+
+def test_corrupt_resume_file_falls_back_to_a_recheck(tmp_path):
+    data = os.urandom(4 * PIECE_LENGTH)
+    torrent = make_torrent(data)
+    path = str(tmp_path / "data.bin")
+    write_pieces(path, data, [1, 3])
+    with open(path + ".resume", "w") as f:
+        f.write('{"version": 1, "bitfield": "f')
+
+    engine = new_engine(torrent, path)
+    calls = rechecks(engine)
+    assert engine.restore() == 2
+    assert calls
+    assert list(engine.controller.bitfield) == [False, True, False, True]
+
+
+def test_complete_file_finishes_without_any_peer(tmp_path):
+    data = os.urandom(3 * PIECE_LENGTH + 1000)
+    torrent = make_torrent(data)
+    path = str(tmp_path / "data.bin")
+    with open(path, "wb") as f:
+        f.write(data)
+    mtime = os.stat(path).st_mtime_ns
+
+    engine = new_engine(torrent, path)
+    assert engine.restore() == 4
+    # No peer was added: a download that needed one would fail
+    assert engine.run() is True
+    assert os.stat(path).st_mtime_ns == mtime
+    # The checked state was saved, the next start doesn't recheck
+    assert list(FastResume(path, torrent).load(4)) == [True] * 4
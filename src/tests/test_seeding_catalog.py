@@ -0,0 +1,71 @@
+import os
+
+from client.seeding_catalog import SeedingCatalog
+from torrents.torrent_creator import TorrentCreator
+
+
+def seed(tmp_path, name, size):
+    data_path = tmp_path / "data" / f"{name}.bin"
+    data_path.write_bytes(os.urandom(size))
+    creator = TorrentCreator(tracker_url="127.0.0.1:8080")
+    return creator.create_torrent(str(data_path), str(tmp_path / "torrents" / f"{name}.torrent"))
+
+
+def new_catalog(tmp_path):
+    catalog = SeedingCatalog(str(tmp_path / "torrents"), str(tmp_path / "data"))
+    parsed = []
+    parse = catalog._parse
+
+    def counting_parse(path, stat):
+        parsed.append(os.path.basename(path))
+        return parse(path, stat)
+
+    catalog._parse = counting_parse
+    return catalog, parsed
+
+
+def test_unchanged_torrents_are_reused_and_the_rest_dropped(tmp_path):
+    (tmp_path / "torrents").mkdir()
+    (tmp_path / "data").mkdir()
+    for name in ("a", "b", "c"):
+        seed(tmp_path, name, 1000)
+
+    catalog, parsed = new_catalog(tmp_path)
+    catalog.load()
+    assert sorted(parsed) == ["a.torrent", "b.torrent", "c.torrent"]
+    old_b = catalog.get_by_name("b")
+    old_c = catalog.get_by_name("c")
+
+    # b changes (new content, so a new info hash), c goes away
+    seed(tmp_path, "b", 2000)
+    stat = os.stat(old_b.torrent_file_path)
+    os.utime(old_b.torrent_file_path, ns=(stat.st_atime_ns, old_b.torrent_mtime_ns + 10 ** 9))
+    os.remove(old_c.torrent_file_path)
+
+    catalog, parsed = new_catalog(tmp_path)
+    catalog.load()
+    assert parsed == ["b.torrent"]
+    assert catalog.names() == ["a", "b"]
+
+    b = catalog.get_by_name("b")
+    assert b.length == 2000
+    assert b.data_file_path == str(tmp_path / "data" / "b.bin")
+    assert catalog.get(old_b.info_hash) is None
+    assert catalog.get(old_c.info_hash) is None
+    assert len(catalog) == 2
+
+
+def test_a_corrupt_cache_parses_everything_again(tmp_path):
+    (tmp_path / "torrents").mkdir()
+    (tmp_path / "data").mkdir()
+    seed(tmp_path, "a", 1000)
+
+    catalog, _ = new_catalog(tmp_path)
+    catalog.load()
+    with open(catalog.cache_path, "w") as f:
+        f.write("{not json")
+
+    catalog, parsed = new_catalog(tmp_path)
+    catalog.load()
+    assert parsed == ["a.torrent"]
+    assert catalog.names() == ["a"]
@@ -0,0 +1,44 @@
+import os
+
+from client.peer.storage import DiskWriter
+
+PIECE = 16 * 1024
+
+
+def test_pieces_are_written_at_their_offsets_in_the_preallocated_file(tmp_path):
+    path = str(tmp_path / "out" / "data.bin")
+    writer = DiskWriter(path, 4 * PIECE + 100).open()
+    # The whole file exists before anything is written
+    assert os.path.getsize(path) == 4 * PIECE + 100
+
+    written = []
+    pieces = {i: os.urandom(PIECE) for i in (3, 0, 2)}
+    pieces[4] = os.urandom(100)  # short last piece
+    for i, data in pieces.items():
+        writer.write(i * PIECE, data, lambda offset, error: written.append((offset, error)))
+    writer.flush()
+    writer.close()
+
+    assert sorted(written) == [(i * PIECE, None) for i in (0, 2, 3, 4)]
+    assert writer.writes == 4
+    with open(path, "rb") as f:
+        content = f.read()
+    assert len(content) == 4 * PIECE + 100
+    for i, data in pieces.items():
+        assert content[i * PIECE:i * PIECE + len(data)] == data
+    # Piece 1 was never written
+    assert content[PIECE:2 * PIECE] == bytes(PIECE)
+
+
+def test_existing_data_is_kept_and_the_file_cut_to_size(tmp_path):
+    path = str(tmp_path / "data.bin")
+    with open(path, "wb") as f:
+        f.write(b"a" * PIECE + b"b" * PIECE + b"extra")
+
+    writer = DiskWriter(path, 2 * PIECE, fsync_policy="pieces", fsync_every=1).open()
+    writer.write(PIECE, b"c" * PIECE)
+    writer.close()
+
+    assert writer.fsyncs == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"a" * PIECE + b"c" * PIECE
@@ -0,0 +1,70 @@
+from client.super_seeder import SuperSeeder
+
+
+def seeder_with_peers(pieces, *peers):
+    seeder = SuperSeeder("file.bin", pieces, pieces * 1024)
+    for peer in peers:
+        seeder.add_peer(peer)
+    return seeder
+
+
+def offered(announcements, peer):
+    return [piece_index for owner, piece_index in announcements if owner == peer]
+
+
+def test_each_piece_is_offered_to_one_active_peer():
+    seeder = seeder_with_peers(8, "a", "b", "c")
+    offers_a = offered(seeder.activate("a", 0.0), "a")
+    offers_b = offered(seeder.activate("b", 0.0), "b")
+
+    assert len(offers_a) == len(offers_b) == SuperSeeder.OFFERS_PER_PEER
+    assert not set(offers_a) & set(offers_b)
+    # Choked peers get nothing and may request nothing
+    assert seeder.offers["c"] == {}
+    assert not seeder.allowed("c", offers_a[0])
+    assert seeder.allowed("a", offers_a[0])
+
+
+def test_new_offer_once_a_piece_spreads():
+    seeder = seeder_with_peers(8, "a", "b")
+    first = offered(seeder.activate("a", 0.0), "a")[0]
+    seeder.activate("b", 0.0)
+
+    # Holding its own offer isn't enough, another peer must get it
+    assert seeder.on_have("a", first, 1.0) == []
+    new = seeder.on_have("b", first, 2.0)
+    assert len(new) == 1 and new[0][0] == "a" and new[0][1] != first
+
+
+def test_choked_peer_gives_its_offers_back():
+    seeder = seeder_with_peers(8, "a", "b")
+    offers_a = offered(seeder.activate("a", 0.0), "a")
+
+    assert seeder.deactivate("a", 1.0) == []
+    assert seeder.offers["a"] == {}
+    # The pieces a never downloaded are the next ones offered
+    assert set(offered(seeder.activate("b", 1.0), "b")) == set(offers_a)
+
+
+def test_stale_offers_are_replaced():
+    seeder = seeder_with_peers(8, "a")
+    before = set(offered(seeder.activate("a", 0.0), "a"))
+    after = set(offered(seeder.expire(SuperSeeder.SPREAD_TIMEOUT + 1), "a"))
+    assert len(after) == SuperSeeder.OFFERS_PER_PEER and not before & after
+
+
+def test_complete_once_the_swarm_holds_every_piece():
+    seeder = seeder_with_peers(4, "a", "b")
+    seeder.uploaded = 4096
+    for piece_index in range(3):
+        seeder.on_have("a", piece_index, 0.0)
+    assert not seeder.complete
+    seeder.on_have("b", 3, 0.0)
+
+    assert seeder.complete and seeder.uploaded_at_complete == 4096
+    # Every peer may request anything from now on
+    assert seeder.allowed("b", 0)
+    assert seeder.stats()["copies_at_complete"] == 1.0
+
+    seeder.remove_peer("b", 1.0)
+    assert seeder.in_swarm == 3
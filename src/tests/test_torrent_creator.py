@@ -0,0 +1,52 @@
+import hashlib
+import os
+
+import pytest
+
+from torrents.torrent_creator import TorrentCreator
+
+PIECE_LENGTH = 16 * 1024
+
+
+def sequential_digests(data, piece_length):
+    return b"".join(hashlib.sha1(data[i:i + piece_length]).digest()
+                    for i in range(0, len(data), piece_length))
+
+
+@pytest.mark.parametrize("size", [0, 1, PIECE_LENGTH, 10 * PIECE_LENGTH + 123])
+def test_parallel_hashing_matches_a_sequential_loop(tmp_path, size):
+    data = os.urandom(size)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+
+    creator = TorrentCreator(piece_length=PIECE_LENGTH)
+    # Several pieces per task and several tasks, the last one short
+    creator.TASK_SIZE = 3 * PIECE_LENGTH
+    progress = []
+    digests = creator.encode_pieces(str(path), workers=4, progress=lambda done, total: progress.append(done))
+
+    assert digests == sequential_digests(data, PIECE_LENGTH)
+    if size:
+        assert max(progress) == size
+
+
+def test_piece_length_is_clamped_between_one_block_and_4_mib():
+    choose = TorrentCreator.choose_piece_length
+    KiB, MiB, GiB = 1024, 1024 * 1024, 1024 * 1024 * 1024
+
+    assert choose(0) == 16 * KiB
+    assert choose(1) == 16 * KiB
+    assert choose(1500 * 16 * KiB) == 16 * KiB
+    assert choose(1500 * 16 * KiB + 1) == 32 * KiB
+    assert choose(1500 * 4 * MiB) == 4 * MiB
+    # Past 1500 pieces of 4 MiB the count grows instead of the length
+    assert choose(100 * GiB) == 4 * MiB
+
+
+def test_automatic_piece_length_is_a_power_of_two_within_the_target():
+    for size in (10 ** 8, 10 ** 9, 3 * 10 ** 9):
+        piece_length = TorrentCreator.choose_piece_length(size)
+        assert piece_length & (piece_length - 1) == 0
+        assert (size + piece_length - 1) // piece_length <= TorrentCreator.TARGET_PIECES
+        # Half of it would go over the target
+        assert (size + piece_length // 2 - 1) // (piece_length // 2) > TorrentCreator.TARGET_PIECES
@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+import bencodepy
+import pytest
+
+from torrents.torrent_creator import TorrentCreator
+from torrents.torrent_file import TorrentFile
+from torrents.torrent_reader import TorrentReader
+
+PIECE_LENGTH = 32 * 1024
+
+
+def create(tmp_path, size, merkle):
+    path = tmp_path / "data.bin"
+    path.write_bytes(os.urandom(size))
+    creator = TorrentCreator(tracker_url="127.0.0.1:8080", piece_length=PIECE_LENGTH, merkle=merkle)
+    return creator.create_torrent(str(path))
+
+
+@pytest.mark.parametrize("merkle", [False, True])
+def test_lazy_parsing_matches_a_full_decode(tmp_path, merkle):
+    # Short last piece, with a short last block
+    torrent_path = create(tmp_path, 5 * PIECE_LENGTH + 20000, merkle)
+
+    decoded = TorrentReader.extract_info(TorrentReader.read_torrent(torrent_path))
+    assert TorrentReader.read_info(torrent_path) == decoded
+    assert bool(decoded.block_hashes) == merkle
+
+    with TorrentFile(torrent_path) as torrent:
+        assert torrent.number_of_pieces == 6
+        assert torrent.piece_digest(5).hex() == decoded.pieces[-40:]
+
+
+def test_info_hash_of_standard_torrents_is_hashed_from_the_info_dict(tmp_path):
+    info = {"name": "data.bin", "piece length": PIECE_LENGTH, "length": 1, "pieces": bytes(20)}
+    torrent_path = tmp_path / "data.torrent"
+    torrent_path.write_bytes(bencodepy.encode({"announce": "127.0.0.1:8080", "info": info}))
+
+    torrent = TorrentReader.read_info(str(torrent_path))
+    assert torrent.info_hash == hashlib.sha1(bencodepy.encode(info)).hexdigest()
+    assert torrent.block_hashes == ""
+
+
+def test_block_hashes_that_dont_match_the_root_are_refused(tmp_path):
+    torrent_path = create(tmp_path, 2 * PIECE_LENGTH, merkle=True)
+    with open(torrent_path, "rb") as f:
+        data = bencodepy.decode(f.read())
+    data[b"info"][b"merkle root"] = bytes(20)
+    with open(torrent_path, "wb") as f:
+        f.write(bencodepy.encode(data))
+
+    with pytest.raises(ValueError):
+        TorrentReader.read_info(torrent_path)
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+
+from tracker.torrent_store import TorrentStore
+
+
+def metadata(info_hash, name="file.bin"):
+    return {"info_hash": info_hash, "name": name, "size": 100, "piece_size": 10, "pieces": "00" * 20}
+
+
+def peer(peer_id, port=6881):
+    return {"ip": "10.0.0.1", "port": port, "peer_id": peer_id}
+
+
+def open_store(tmp_path, **kwargs):
+    store = TorrentStore(str(tmp_path), "tracker_data.json", fsync=False, **kwargs)
+    store.recover()
+    return store
+
+
+def test_journal_is_replayed_after_a_crash(tmp_path):
+    store = open_store(tmp_path)
+    store.register(metadata("aa"), peer("p1"))
+    store.register(metadata("bb", "other.bin"), peer("p1"))
+    store.register(metadata("aa"), peer("p2", 6882))
+    # No close(): the records are only in the journal
+
+    recovered = open_store(tmp_path)
+    assert len(recovered) == 2
+    assert recovered.get("aa")["peers"] == [peer("p1"), peer("p2", 6882)]
+    assert recovered.get("aa")["seeders"] == 2
+    assert json.loads(recovered.get_encoded("bb"))["name"] == "other.bin"
+
+
+def test_torn_journal_record_is_discarded(tmp_path):
+    store = open_store(tmp_path)
+    store.register(metadata("aa"), peer("p1"))
+    with open(store.journal_path, "ab") as journal:
+        journal.write(b'{"op":"register","torrent_metadata":{"info_ha')
+
+    recovered = open_store(tmp_path)
+    assert len(recovered) == 1
+    assert recovered.get("aa")["seeders"] == 1
+    # Recovery compacted the replayed records into the snapshot
+    assert os.path.getsize(recovered.journal_path) == 0
+
+
+def test_compaction_writes_the_snapshot_format(tmp_path):
+    store = open_store(tmp_path, compact_every=2)
+    store.register(metadata("aa"), peer("p1"))
+    store.register(metadata("bb"), peer("p1"))
+
+    assert os.path.getsize(store.journal_path) == 0
+    with open(store.snapshot_path) as f:
+        snapshot = json.load(f)
+    assert sorted(torrent["info_hash"] for torrent in snapshot["torrents"]) == ["aa", "bb"]
+
+    store.register(metadata("cc"), peer("p1"))
+    assert len(open_store(tmp_path)) == 3
+
+
+def test_encoded_reads_dont_wait_for_the_lock(tmp_path):
+    store = open_store(tmp_path)
+    store.register(metadata("aa"), peer("p1"))
+
+    read = {}
+    with store.lock:
+        # A writer holds the lock (journal fsync, compaction)
+        reader = threading.Thread(target=lambda: read.update(entry=store.get_encoded("aa")))
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+
+    assert json.loads(read["entry"])["peers"] == [peer("p1")]
+    assert store.get_encoded("missing") is None
+
+
+def test_encoded_entry_follows_changes(tmp_path):
+    store = open_store(tmp_path)
+    store.register(metadata("aa"), peer("p1"))
+    before = store.get_encoded("aa")
+
+    store.register(metadata("aa"), peer("p2", 6882))
+    assert json.loads(before)["seeders"] == 1
+    assert json.loads(store.get_encoded("aa"))["seeders"] == 2
+
+
+def test_leechers_become_seeders_or_leave(tmp_path):
+    store = TorrentStore(str(tmp_path), "tracker_data.json", fsync=False)
+    store.recover()
+    store.register(metadata("aa"), peer("seed"))
+    assert store.register_leecher("aa", peer("l1", 6882))
+    assert store.register_leecher("aa", peer("l2", 6883))
+
+    assert store.leecher_done("aa", peer("l1", 6882), completed=True)
+    assert store.leecher_done("aa", peer("l2", 6883), completed=False)
+    # Not a leecher (anymore), nothing changes
+    assert store.leecher_done("aa", peer("seed"), completed=False)
+    assert not store.leecher_done("missing", peer("l1", 6882), completed=True)
+
+    torrent = store.get("aa")
+    assert (torrent["seeders"], torrent["leechers"]) == (2, 0)
+    assert torrent["peers"] == [peer("seed"), peer("l1", 6882)]
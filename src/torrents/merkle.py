@@ -0,0 +1,56 @@
+import hashlib
+
+# Size of the leaves, the block size of the peer protocol
+BLOCK_LENGTH = 16 * 1024
+DIGEST_LENGTH = 20
+
+# The leaves travel hex-encoded in the JSON messages of the tracker, 40 bytes
+# per block. Up to this file size (~786k leaves) the register_torrent and
+# get_torrent messages stay under 32 MiB.
+MAX_MERKLE_FILE_SIZE = 12 * 1024 * 1024 * 1024
+
+
+def blocks_per_piece(piece_length: int, block_length: int = BLOCK_LENGTH) -> int:
+    """
+    Leaves reserved for every piece. Blocks never straddle pieces, the last
+    block of a piece (and the leaves of the short last piece) may be shorter.
+    """
+    return (piece_length + block_length - 1) // block_length
+
+
+def hash_blocks(piece, block_length: int = BLOCK_LENGTH) -> bytes:
+    """
+    SHA-1 of every block of a piece, packed.
+
+    :param piece: The data of the piece (bytes-like)
+    :param block_length: The size of the blocks
+    :return leaves: 20 bytes per block
+    """
+    view = memoryview(piece)
+    leaves = bytearray()
+    for start in range(0, len(view), block_length):
+        with view[start:start + block_length] as block:
+            leaves += hashlib.sha1(block).digest()
+    return bytes(leaves)
+
+
+def merkle_root(leaves: bytes) -> bytes:
+    """
+    Root of the binary SHA-1 tree over the packed leaves. The leaf level is
+    padded with zero digests up to a power of two.
+
+    :param leaves: The packed 20-byte leaf hashes (bytes-like)
+    :return root: The 20-byte root, zeros if there are no leaves
+    """
+    level = [bytes(leaves[i:i + DIGEST_LENGTH]) for i in range(0, len(leaves), DIGEST_LENGTH)]
+    if not level:
+        return bytes(DIGEST_LENGTH)
+
+    width = 1
+    while width < len(level):
+        width *= 2
+    level += [bytes(DIGEST_LENGTH)] * (width - len(level))
+
+    while len(level) > 1:
+        level = [hashlib.sha1(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0]
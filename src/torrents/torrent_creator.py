@@ -1,47 +1,158 @@
 import os
+import mmap
 import hashlib
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Optional, Tuple
 import bencodepy
 
+from torrents.merkle import BLOCK_LENGTH, blocks_per_piece, hash_blocks, merkle_root
+
 
 class TorrentCreator:
+    # Automatic piece length: the smallest power of two that keeps the file
+    # under TARGET_PIECES pieces, between one block and 4 MiB. Whole pieces
+    # are buffered by the downloader (up to 32 of them) and cached by the
+    # seeder, larger ones would cost too much memory for both.
+    MIN_PIECE_LENGTH = 16 * 1024
+    MAX_PIECE_LENGTH = 4 * 1024 * 1024
+    TARGET_PIECES = 1500
+
     def __init__(self, 
                 tracker_url: str = "localhost", 
-                piece_length: int = 256 * 1024):
+                piece_length: int = None,
+                target_pieces: int = TARGET_PIECES,
+                merkle: bool = False):
         """
         Create a new torrent creator object
         
         :param tracker_url: The URL of the tracker
-        :param piece_length: The length of each piece in bytes 
+        :param piece_length: The length of each piece in bytes, chosen from
+            the size of every file if None
+        :param target_pieces: Number of pieces aimed for when the piece
+            length is automatic
+        :param merkle: Also store the SHA-1 of every 16 KiB block ("block
+            hashes") and the Merkle root over them, so downloads can verify
+            each block as it arrives. Adds 20 bytes per block to the metadata.
         """
+        if piece_length is not None and piece_length <= 0:
+            raise ValueError(f"Invalid piece length {piece_length}")
+
         self.tracker_url = tracker_url
         self.piece_length = piece_length
+        self.target_pieces = target_pieces
+        self.merkle = merkle
+
+    @classmethod
+    def choose_piece_length(cls, file_size: int, target_pieces: int = TARGET_PIECES) -> int:
+        """
+        Piece length for a file: the smallest power of two that splits it in
+        at most `target_pieces` pieces, clamped to [MIN_PIECE_LENGTH,
+        MAX_PIECE_LENGTH]. Small files get small pieces that can be fetched
+        from several peers at once, big files don't blow up the size of the
+        piece hashes and the number of pieces to track.
+
+        :param file_size: The size of the file in bytes
+        :param target_pieces: Maximum number of pieces wanted
+        :return piece_length: The piece length in bytes
+        """
+        piece_length = cls.MIN_PIECE_LENGTH
+        while piece_length < cls.MAX_PIECE_LENGTH and piece_length * target_pieces < file_size:
+            piece_length *= 2
+        return piece_length
+
+    def piece_length_for(self, file_size: int) -> int:
+        """
+        The fixed piece length if one was given, the automatic one otherwise
+        """
+        if self.piece_length is not None:
+            return self.piece_length
+        return self.choose_piece_length(file_size, self.target_pieces)
     
-    def encode_pieces(self, file_path) -> bytes:
+    # Pieces hashed by a single task of the pool, ~16 MiB per task
+    TASK_SIZE = 16 * 1024 * 1024
+
+    def encode_pieces(self, file_path, workers: int = None,
+                      progress: Callable[[int, int], None] = None, piece_length: int = None) -> bytes:
         """
-        Encode the pieces into a single string
-        
-        :param pieces: A list of pieces
-        :return encoded_pieces: A single string of encoded pieces
+        Hash every piece of the file and concatenate the digests
+
+        :param file_path: The path to the file
+        :param workers: Number of hashing threads, one per core by default
+        :param progress: Called as progress(hashed_bytes, total_bytes)
+        :param piece_length: The piece length, piece_length_for(file size) if None
+        :return encoded_pieces: The 20-byte SHA-1 of every piece, in order
         """
-        pieces = b''
-        first = True
-        
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(self.piece_length):
-                sha1_hash = hashlib.sha1(chunk).digest()  # Hash de 20 bytes (binario)
-                if first:
-                    print("First hash: ", sha1_hash)
-                    print("First hash length: ", len(sha1_hash))
-                pieces += sha1_hash
-                
+        pieces, _ = self.hash_file(file_path, workers, progress, piece_length)
         return pieces
 
-    def create_torrent(self, file_path: str, output_path:str = None) -> str:
+    def hash_file(self, file_path, workers: int = None, progress: Callable[[int, int], None] = None,
+                  piece_length: int = None, block_hashes: bool = False) -> Tuple[bytes, Optional[bytes]]:
+        """
+        Hash every piece of the file and, if asked, every block of each piece
+
+        The file is memory-mapped and split in ranges of whole pieces that are
+        hashed in parallel by a thread pool (hashlib releases the GIL while
+        hashing). Each digest is written straight to its slot of a
+        preallocated buffer.
+
+        :param file_path: The path to the file
+        :param workers: Number of hashing threads, one per core by default
+        :param progress: Called as progress(hashed_bytes, total_bytes)
+        :param piece_length: The piece length, piece_length_for(file size) if None
+        :param block_hashes: Also compute the per-block leaf hashes
+        :return (pieces, leaves): The 20-byte SHA-1 of every piece and of every
+            block (None unless block_hashes), in order
+        """
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            return b"", (b"" if block_hashes else None)
+
+        piece_length = piece_length or self.piece_length_for(file_size)
+        number_of_pieces = (file_size + piece_length - 1) // piece_length
+        digests = bytearray(20 * number_of_pieces)
+        pieces_per_task = max(1, self.TASK_SIZE // piece_length)
+
+        leaves = None
+        leaves_per_piece = blocks_per_piece(piece_length)
+        if block_hashes:
+            last_piece = file_size - (number_of_pieces - 1) * piece_length
+            leaves = bytearray(20 * ((number_of_pieces - 1) * leaves_per_piece + blocks_per_piece(last_piece)))
+
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = memoryview(mapped)
+
+            def hash_pieces(first: int, last: int) -> int:
+                for i in range(first, last):
+                    with data[i * piece_length:(i + 1) * piece_length] as piece:
+                        digests[20 * i:20 * (i + 1)] = hashlib.sha1(piece).digest()
+                        if leaves is not None:
+                            piece_leaves = hash_blocks(piece, BLOCK_LENGTH)
+                            start = 20 * i * leaves_per_piece
+                            leaves[start:start + len(piece_leaves)] = piece_leaves
+                return min(last * piece_length, file_size) - first * piece_length
+
+            try:
+                with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                        thread_name_prefix="piece-hasher") as executor:
+                    tasks = [executor.submit(hash_pieces, first, min(first + pieces_per_task, number_of_pieces))
+                             for first in range(0, number_of_pieces, pieces_per_task)]
+                    hashed = 0
+                    for task in as_completed(tasks):
+                        hashed += task.result()
+                        if progress:
+                            progress(hashed, file_size)
+            finally:
+                data.release()
+
+        return bytes(digests), bytes(leaves) if leaves is not None else None
+
+    def create_torrent(self, file_path: str, output_path:str = None,
+                       progress: Callable[[int, int], None] = None) -> str:
         """
         Create a torrent file
         
         :param file_path: The path to the file to create the torrent for
+        :param progress: Called as progress(hashed_bytes, total_bytes) while hashing
         :return output_path: The path to the created torrent file
         """
         
@@ -54,18 +165,25 @@ class TorrentCreator:
             output_path = os.path.join(os.path.dirname(file_path), os.path.splitext(file_name)[0] + ".torrent")
         
         # pieces = self.generate_pieces(file_path)
-        encoded_pieces = self.encode_pieces(file_path)
+        piece_length = self.piece_length_for(file_size)
+        encoded_pieces, leaves = self.hash_file(file_path, progress=progress, piece_length=piece_length,
+                                                block_hashes=self.merkle)
         
         torrent_data = {
             "announce": self.tracker_url,
             "info": {
                 "name": file_name,
-                "piece length": self.piece_length,
+                "piece length": piece_length,
                 "length": file_size,
                 "pieces": encoded_pieces
             }
         }
 
+        if leaves is not None:
+            torrent_data["info"]["block length"] = BLOCK_LENGTH
+            torrent_data["info"]["block hashes"] = leaves
+            torrent_data["info"]["merkle root"] = merkle_root(leaves)
+
         info_hash = hashlib.sha1(bencodepy.encode(torrent_data["info"])).digest()
 
         torrent_data["info"]["info_hash"] = info_hash
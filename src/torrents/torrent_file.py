@@ -0,0 +1,193 @@
+import hashlib
+import mmap
+from typing import Dict, Optional, Tuple
+
+from torrents.merkle import BLOCK_LENGTH, merkle_root
+from torrents.torrent_info import TorrentInfo
+
+
+class TorrentFile:
+    """
+    Lazy reader of a .torrent file.
+
+    The file is memory-mapped and only the structure of the top-level and
+    `info` dictionaries is scanned: for every key the position of its value
+    is recorded, nothing is decoded. The small fields (name, lengths, info
+    hash) are decoded on open, `pieces` and `block_hashes` are exposed as
+    memoryviews of 20-byte digests over the mapping, so nothing is copied or
+    converted to hex unless `to_info()` is called.
+
+    The memoryviews are only valid until `close()`, the other fields stay
+    available afterwards. Use it as a context manager:
+
+        with TorrentFile(path) as torrent:
+            digest = torrent.piece_digest(0)
+
+    :param file_path: The path to the torrent file
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._map)
+
+        try:
+            self._top = self._scan_dict(0)
+            info = self._top.get(b"info")
+            if info is None:
+                raise ValueError(f"{file_path} has no info dictionary")
+            self._info_span = info
+            self._info = self._scan_dict(info[0])
+
+            self.announce = self._string(self._top, b"announce", b"").decode("utf-8")
+            self.name = self._string(self._info, b"name", b"").decode("utf-8")
+            self.piece_length = self._int(self._info, b"piece length", 0)
+            self.length = self._int(self._info, b"length", 0)
+            self.block_length = self._int(self._info, b"block length", BLOCK_LENGTH)
+
+            info_hash = self._string(self._info, b"info_hash", None)
+            if info_hash is None:
+                # Standard torrents: SHA-1 of the bencoded info dictionary
+                start, end = self._info_span
+                info_hash = hashlib.sha1(self._data[start:end]).digest()
+            self.info_hash = bytes(info_hash).hex()
+            self.merkle_root = bytes(self._string(self._info, b"merkle root", b"")).hex()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._data is not None:
+            self._data.release()
+            self._data = None
+            try:
+                self._map.close()
+            except BufferError:
+                # A caller still holds a view of the digests, the mapping
+                # goes away with it
+                pass
+
+    # =============================
+    # Digests
+    # =============================
+
+    @property
+    def pieces(self) -> memoryview:
+        """
+        The packed 20-byte SHA-1 of every piece, without copying.
+        """
+        return self._value_view(self._info, b"pieces")
+
+    @property
+    def block_hashes(self) -> Optional[memoryview]:
+        """
+        The packed 20-byte SHA-1 of every block, None without Merkle metadata.
+        """
+        if b"block hashes" not in self._info:
+            return None
+        return self._value_view(self._info, b"block hashes")
+
+    @property
+    def number_of_pieces(self) -> int:
+        return len(self.pieces) // 20
+
+    def piece_digest(self, piece_index: int) -> memoryview:
+        return self.pieces[20 * piece_index:20 * (piece_index + 1)]
+
+    def to_info(self) -> TorrentInfo:
+        """
+        Full TorrentInfo with the digests as hex, as the tracker and the
+        download path expect them.
+        """
+        block_hashes = self.block_hashes
+        if block_hashes is not None:
+            if self.block_length != BLOCK_LENGTH:
+                raise ValueError(f"Unsupported block length {self.block_length}")
+            if merkle_root(block_hashes).hex() != self.merkle_root:
+                raise ValueError("Block hashes don't match the Merkle root")
+        return TorrentInfo(
+            announce=self.announce,
+            info_hash=self.info_hash,
+            name=self.name,
+            piece_length=self.piece_length,
+            length=self.length,
+            pieces=self.pieces.hex(),
+            block_hashes=block_hashes.hex() if block_hashes is not None else "",
+            merkle_root=self.merkle_root,
+        )
+
+    # =============================
+    # Bencode scanning
+    # =============================
+
+    def _scan_dict(self, pos: int) -> Dict[bytes, Tuple[int, int]]:
+        """
+        Keys of the dictionary starting at `pos` and the span of their values.
+        """
+        data = self._data
+        if data[pos] != ord("d"):
+            raise ValueError(f"Expected a dictionary at offset {pos} of {self.file_path}")
+
+        spans = {}
+        pos += 1
+        while data[pos] != ord("e"):
+            key_start, key_end, pos = self._scan_string(pos)
+            value_end = self._skip(pos)
+            spans[bytes(data[key_start:key_end])] = (pos, value_end)
+            pos = value_end
+        return spans
+
+    def _scan_string(self, pos: int) -> Tuple[int, int, int]:
+        colon = self._map.find(b":", pos)
+        if colon < 0:
+            raise ValueError(f"Truncated string at offset {pos} of {self.file_path}")
+        length = int(bytes(self._data[pos:colon]))
+        start = colon + 1
+        return start, start + length, start + length
+
+    def _skip(self, pos: int) -> int:
+        """
+        Offset right after the value starting at `pos`.
+        """
+        data = self._data
+        kind = data[pos]
+        if kind == ord("i"):
+            end = self._map.find(b"e", pos)
+            if end < 0:
+                raise ValueError(f"Truncated integer at offset {pos} of {self.file_path}")
+            return end + 1
+        if kind in (ord("l"), ord("d")):
+            pos += 1
+            while data[pos] != ord("e"):
+                if kind == ord("d"):
+                    pos = self._scan_string(pos)[2]
+                pos = self._skip(pos)
+            return pos + 1
+        if ord("0") <= kind <= ord("9"):
+            return self._scan_string(pos)[2]
+        raise ValueError(f"Invalid bencode at offset {pos} of {self.file_path}")
+
+    def _value_view(self, spans, key: bytes) -> memoryview:
+        start, _ = spans[key]
+        value_start, value_end, _ = self._scan_string(start)
+        return self._data[value_start:value_end]
+
+    def _string(self, spans, key: bytes, default):
+        if key not in spans:
+            return default
+        return bytes(self._value_view(spans, key))
+
+    def _int(self, spans, key: bytes, default: int) -> int:
+        if key not in spans:
+            return default
+        start, end = spans[key]
+        if self._data[start] != ord("i"):
+            raise ValueError(f"Expected an integer for {key!r} in {self.file_path}")
+        return int(bytes(self._data[start + 1:end - 1]))
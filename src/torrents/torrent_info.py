@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 
 @dataclass
 class TorrentInfo:
@@ -8,4 +8,26 @@ class TorrentInfo:
     name: str
     piece_length: int
     length: int
-    pieces: str
\ No newline at end of file
+    pieces: str
+    # Optional Merkle metadata (hex): SHA-1 of every block and root over them
+    block_hashes: str = ""
+    merkle_root: str = ""
+
+    def number_of_pieces(self) -> int:
+        return (self.length + self.piece_length - 1) // self.piece_length
+
+    def piece_digests(self) -> bytes:
+        """
+        The 20-byte SHA-1 of every piece packed together, `pieces` holds them
+        as hex.
+        """
+        return bytes.fromhex(self.pieces)
+
+    def block_digests(self) -> Optional[bytes]:
+        """
+        The 20-byte SHA-1 of every block packed together, None if the torrent
+        has no Merkle metadata.
+        """
+        if not self.block_hashes:
+            return None
+        return bytes.fromhex(self.block_hashes)
@@ -1,6 +1,8 @@
 from typing import Dict, List
 import bencodepy
 from torrents.torrent_info import TorrentInfo
+from torrents.merkle import BLOCK_LENGTH, merkle_root
+from torrents.torrent_file import TorrentFile
 import hashlib
 
 class TorrentReader:
@@ -27,6 +29,14 @@ class TorrentReader:
         """
         
         info = torrent_data.get(b"info", {})
+
+        block_hashes = info.get(b"block hashes", b"")
+        root = info.get(b"merkle root", b"")
+        if block_hashes:
+            if info.get(b"block length") != BLOCK_LENGTH:
+                raise ValueError(f"Unsupported block length {info.get(b'block length')}")
+            if merkle_root(block_hashes) != root:
+                raise ValueError("Block hashes don't match the Merkle root")
         
         return TorrentInfo(
             announce=torrent_data.get(b"announce", b"").decode("utf-8"),
@@ -34,5 +44,20 @@ class TorrentReader:
             name=info.get(b"name", b"").decode("utf-8"),
             piece_length=info.get(b"piece length", 0),
             length=info.get(b"length", 0),
-            pieces=info.get(b"pieces", b"").hex()
-        )
\ No newline at end of file
+            pieces=info.get(b"pieces", b"").hex(),
+            block_hashes=block_hashes.hex(),
+            merkle_root=root.hex()
+        )
+
+    @staticmethod
+    def read_info(file_path: str) -> TorrentInfo:
+        """
+        Read a torrent file straight into a TorrentInfo, without decoding the
+        whole file (see TorrentFile)
+
+        :param file_path: The path to the torrent file
+        :return info: The info of the torrent
+        """
+
+        with TorrentFile(file_path) as torrent:
+            return torrent.to_info()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import socket
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from common.framing import MAX_JSON_FRAME_SIZE
+from common.logs import log_message
+
+# The asyncio debug records don't carry the fields our log formatter expects
+logging.getLogger("asyncio").setLevel(logging.WARNING)
+
+
+class AsyncTrackerServer:
+    """
+    Event-loop server for the tracker.
+
+    Every connection is a coroutine on a single asyncio loop instead of an OS
+    thread. Requests that only touch memory are answered on the loop (torrent
+    lookups read the store without its lock), requests that wait on the disk
+    (journal fsync) or on other nodes of the ring run in a bounded thread
+    pool so they can't stall the loop. The stdin admin commands are read by a
+    reader registered on the same loop.
+
+    At most `max_connections` connections are accepted at once, the next
+    clients wait in the listen backlog until one of them ends.
+
+    Attributes:
+    - tracker: Tracker, the tracker whose `process_message` answers requests.
+    - backlog: int, size of the listen backlog.
+    - max_connections: int, number of connections served at once.
+    - workers: int, threads available for blocking requests.
+    """
+
+    BLOCKING_MESSAGE_TYPES = {
+        "register_torrent",
+        "announce_leecher",
+        "announce_complete",
+        "announce_stopped",
+        "find_successor",
+        "find_predecessor",
+        "update_finger_table",
+    }
+
+    ACCEPT_RETRY_DELAY = 0.1
+
+    def __init__(self, tracker, backlog=128, max_connections=1024, workers=16):
+        self.tracker = tracker
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tracker-worker")
+
+        self.active_connections = 0
+        self._slots = None
+        self._stopped = None
+        # Tasks of the connections being served, the loop only keeps weak references
+        self._clients = set()
+
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self._stopped = asyncio.Event()
+
+        listener = socket.create_server((host, port), backlog=self.backlog)
+        listener.setblocking(False)
+        accepting = loop.create_task(self._accept_loop(listener))
+
+        #print(f"Tracker server started at {host}:{port}")
+        log_message(f"Tracker server started at {host}:{port} (asyncio, backlog={self.backlog}, max_connections={self.max_connections})")
+
+        stdin_attached = self._attach_stdin(loop)
+
+        try:
+            await self._stopped.wait()
+        finally:
+            accepting.cancel()
+            listener.close()
+            if stdin_attached:
+                loop.remove_reader(sys.stdin.fileno())
+            self.executor.shutdown(wait=False)
+            self.tracker.shutdown()
+
+    async def _accept_loop(self, listener):
+        """
+        Accepts a connection whenever a slot is free. With every slot taken
+        nothing is accepted, so the kernel keeps the new clients in the
+        backlog instead of the tracker holding open sockets it can't serve.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                sock, addr = await loop.sock_accept(listener)
+            except OSError as e:
+                self._slots.release()
+                log_message(f"Error accepting connection: {e}")
+                # Out of descriptors or similar, give the open connections time to finish
+                await asyncio.sleep(self.ACCEPT_RETRY_DELAY)
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+
+            task = loop.create_task(self._serve_client(sock, addr))
+            self._clients.add(task)
+            task.add_done_callback(self._clients.discard)
+
+    def stop(self):
+        self._stopped.set()
+
+    def _attach_stdin(self, loop):
+        try:
+            loop.add_reader(sys.stdin.fileno(), self._on_stdin)
+            return True
+        except (ValueError, OSError, NotImplementedError):
+            # No usable stdin (daemonized or not a selectable file)
+            return False
+
+    def _on_stdin(self):
+        user_input = sys.stdin.readline()
+        if not user_input:
+            asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+            return
+
+        # Commands like `join` talk to other nodes, keep them off the loop
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.tracker.handle_command, user_input)
+        future.add_done_callback(self._on_command_done)
+
+    def _on_command_done(self, future):
+        try:
+            keep_running = future.result()
+        except Exception as e:
+            log_message(f"Error executing command: {e}")
+            return
+        if not keep_running:
+            self.stop()
+
+    async def _serve_client(self, sock, addr):
+        try:
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except OSError as e:
+            sock.close()
+            self._slots.release()
+            log_message(f"Error handling client {addr}: {e}")
+            return
+
+        self.active_connections += 1
+        #print(f"Connection from {addr}")
+        log_message(f"Connection from {addr}")
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(4)
+                except asyncio.IncompleteReadError:
+                    break
+                data_len = struct.unpack("!I", header)[0]
+                if data_len > MAX_JSON_FRAME_SIZE:
+                    raise ValueError(f"Request of {data_len} bytes, at most {MAX_JSON_FRAME_SIZE} are accepted")
+                data = await reader.readexactly(data_len)
+
+                message = json.loads(data.decode())
+                response = await self._process(message)
+
+                writer.write(response)
+                await writer.drain()
+        except Exception as e:
+            #print(f"Error handling client {addr}: {e}")
+            log_message(f"Error handling client {addr}: {e}")
+        finally:
+            self.active_connections -= 1
+            writer.close()
+            self._slots.release()
+
+    async def _process(self, message):
+        if message.get("type") in self.BLOCKING_MESSAGE_TYPES:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.tracker.process_message, message)
+        return self.tracker.process_message(message)
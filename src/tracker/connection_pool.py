@@ -0,0 +1,229 @@
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Tuple
+
+from common.logs import log_message
+
+
+class PoolExhaustedError(ConnectionError):
+    pass
+
+
+class _PooledSocket(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.last_used = time.monotonic()
+        self.reused = False
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class _TrackedSocket(object):
+    """
+    Socket lent to `ConnectionPool.call`, remembers whether any byte of the
+    response arrived.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.received = False
+
+    def recv(self, *args):
+        data = self._sock.recv(*args)
+        self.received = self.received or bool(data)
+        return data
+
+    def recv_into(self, *args):
+        received = self._sock.recv_into(*args)
+        self.received = self.received or received > 0
+        return received
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class ConnectionPool(object):
+    """
+    Pool of persistent TCP connections to other nodes of the ring.
+
+    Idle sockets are kept per destination and reused by the next call to the
+    same node. A reaper thread closes sockets that have been idle for longer
+    than `idle_timeout`. At most `max_per_destination` sockets (idle or in use)
+    exist for a destination, callers beyond that wait up to `acquire_timeout`.
+
+    Attributes:
+    - connect_timeout: float, timeout used to open new sockets.
+    - io_timeout: float, timeout of every send/recv on a pooled socket.
+    - idle_timeout: float, seconds an idle socket is kept before being reaped.
+    - max_per_destination: int, cap of sockets per (ip, port).
+    """
+
+    def __init__(self, connect_timeout=5.0, io_timeout=10.0, idle_timeout=60.0,
+                 max_per_destination=4, acquire_timeout=10.0):
+        self.connect_timeout = connect_timeout
+        self.io_timeout = io_timeout
+        self.idle_timeout = idle_timeout
+        self.max_per_destination = max_per_destination
+        self.acquire_timeout = acquire_timeout
+
+        self._idle: Dict[Tuple[str, int], Deque[_PooledSocket]] = {}
+        self._open: Dict[Tuple[str, int], int] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        threading.Thread(target=self._reap_idle, daemon=True).start()
+
+    def _new_socket(self, address):
+        s = socket.create_connection(address, timeout=self.connect_timeout)
+        s.settimeout(self.io_timeout)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return _PooledSocket(s)
+
+    def _acquire(self, address):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise ConnectionError("The connection pool is closed")
+
+                idle = self._idle.get(address)
+                if idle:
+                    conn = idle.pop()
+                    conn.reused = True
+                    return conn
+
+                if self._open.get(address, 0) < self.max_per_destination:
+                    self._open[address] = self._open.get(address, 0) + 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(f"No connection available to {address[0]}:{address[1]}")
+                self._cond.wait(remaining)
+
+        try:
+            return self._new_socket(address)
+        except Exception:
+            self._forget(address)
+            raise
+
+    def _release(self, address, conn):
+        conn.last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                conn.close()
+                return
+            self._idle.setdefault(address, deque()).append(conn)
+            self._cond.notify()
+
+    def _discard(self, address, conn):
+        conn.close()
+        self._forget(address)
+
+    def _forget(self, address):
+        with self._cond:
+            self._decrement(address)
+            self._cond.notify()
+
+    def _decrement(self, address):
+        count = self._open.get(address, 0) - 1
+        if count > 0:
+            self._open[address] = count
+        else:
+            self._open.pop(address, None)
+
+    @contextmanager
+    def connection(self, address):
+        """
+        Lends a socket connected to `address`. The socket goes back to the pool
+        when the block ends normally and is closed if the block raises.
+        """
+        conn = self._acquire(address)
+        try:
+            yield conn.sock
+        except BaseException:
+            self._discard(address, conn)
+            raise
+        else:
+            self._release(address, conn)
+
+    def call(self, address, fn):
+        """
+        Runs `fn(sock)` over a pooled connection to `address`.
+
+        A socket taken from the idle list may have been closed by the remote
+        node since it was last used. If the exchange fails on such a socket
+        because the connection was closed or reset before any byte of the
+        response arrived, the node didn't answer the request and the call is
+        retried once on a fresh connection. Any other failure (a timeout, a
+        response cut short) is raised: the node may have acted on the request
+        and requests like `notify` or `register_torrent` must not run twice.
+
+        Args:
+            address (tuple): (ip, port) of the destination node.
+            fn (callable): Function that performs one exchange over the socket.
+        Returns:
+            The value returned by `fn`.
+        """
+        conn = self._acquire(address)
+        sock = _TrackedSocket(conn.sock)
+        try:
+            result = fn(sock)
+        except (OSError, ConnectionError, ValueError) as e:
+            self._discard(address, conn)
+            if not (conn.reused and isinstance(e, ConnectionError) and not sock.received):
+                raise
+            log_message(f"Stale connection to {address[0]}:{address[1]}, reconnecting: {e}")
+            with self.connection(address) as s:
+                return fn(s)
+        except BaseException:
+            self._discard(address, conn)
+            raise
+        self._release(address, conn)
+        return result
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1.0))
+            now = time.monotonic()
+            with self._cond:
+                if self._closed:
+                    return
+                for address in list(self._idle):
+                    keep = deque()
+                    for conn in self._idle[address]:
+                        if now - conn.last_used < self.idle_timeout:
+                            keep.append(conn)
+                        else:
+                            conn.close()
+                            self._decrement(address)
+                    if keep:
+                        self._idle[address] = keep
+                    else:
+                        del self._idle[address]
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                f"{ip}:{port}": {"open": count, "idle": len(self._idle.get((ip, port), ()))}
+                for (ip, port), count in self._open.items()
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+            self._open.clear()
+            self._cond.notify_all()
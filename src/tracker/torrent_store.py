@@ -0,0 +1,352 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from common.logs import log_message
+
+
+class TorrentStore:
+    """
+    Indexed in-memory store of the torrents registered in the tracker.
+
+    Torrents are kept in a dict keyed by info_hash. Every mutation is appended
+    to a journal (one JSON record per line) before being applied in memory, and
+    the journal is periodically compacted into a snapshot that keeps the
+    historical `tracker_data.json` format:
+
+        {
+            "torrents": [ {...}, {...} ]
+        }
+
+    On `recover` the snapshot is loaded and the journal is replayed on top of
+    it, so a crash at any point loses at most the record that was being written.
+    Operations are idempotent, replaying a record twice is harmless.
+
+    Readers don't take the lock: every committed change publishes the JSON
+    encoding of the entry it touched, immutable bytes that `get_encoded`
+    returns as is. A request answered on the event loop never waits behind a
+    journal fsync or a compaction.
+
+    Attributes:
+    - snapshot_path: str, path of the compacted snapshot.
+    - journal_path: str, path of the append-only journal.
+    - compact_every: int, number of journal records that triggers a compaction.
+    - fsync: bool, whether every journal append is fsync'ed.
+    """
+
+    JOURNAL_SUFFIX = ".journal"
+
+    def __init__(self, directory, file_name, compact_every=1000, fsync=True):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, file_name)
+        self.journal_path = self.snapshot_path + self.JOURNAL_SUFFIX
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        self.torrents: Dict[str, dict] = {}
+        # info_hash -> JSON of the entry, replaced (never mutated) on every change
+        self._encoded: Dict[str, bytes] = {}
+        self.lock = threading.RLock()
+        self._journal = None
+        self._journal_records = 0
+        self._loaded = False
+
+    # =============================
+    # Recovery
+    # =============================
+
+    def recover(self):
+        """
+        Loads the snapshot, replays the journal and compacts the result.
+
+        Returns:
+            int: The number of torrents in the store.
+        """
+        with self.lock:
+            self._close_journal()
+            self.torrents = {}
+
+            os.makedirs(self.directory, exist_ok=True)
+
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'r') as file:
+                    tracker_data = json.load(file)
+                for torrent in tracker_data.get("torrents", []):
+                    self.torrents[torrent["info_hash"]] = torrent
+
+            replayed = self._replay_journal()
+            self._encoded = {info_hash: self._encode(torrent) for info_hash, torrent in self.torrents.items()}
+            self._loaded = True
+
+            log_message(f"Torrent store recovered: {len(self.torrents)} torrents, {replayed} journal records replayed")
+
+            # Fold the replayed records into a fresh snapshot
+            self.compact()
+            return len(self.torrents)
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        replayed = 0
+        valid_size = 0
+        with open(self.journal_path, 'rb') as journal:
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    # Torn write from a crash, everything before it is valid
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(record)
+                replayed += 1
+                valid_size += len(line)
+
+        if valid_size != os.path.getsize(self.journal_path):
+            log_message(f"Discarding corrupted tail of the journal {self.journal_path}", level="WARNING")
+            with open(self.journal_path, 'r+b') as journal:
+                journal.truncate(valid_size)
+
+        return replayed
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.recover()
+
+    # =============================
+    # Journal
+    # =============================
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        return self._journal
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _append(self, record):
+        journal = self._open_journal()
+        journal.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+
+        self._journal_records += 1
+
+    def _commit(self, record):
+        """
+        Writes the record to the journal and then applies it in memory.
+        """
+        self._append(record)
+        self._apply(record)
+        self._publish(record)
+
+        if self._journal_records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """
+        Writes a snapshot of the current state and truncates the journal.
+        The snapshot is written to a temporary file and atomically renamed, so
+        a crash during compaction leaves the previous snapshot and the journal.
+        """
+        with self.lock:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump({"torrents": list(self.torrents.values())}, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            self._close_journal()
+            with open(self.journal_path, 'wb') as journal:
+                os.fsync(journal.fileno())
+            self._journal_records = 0
+
+    def close(self):
+        with self.lock:
+            if self._loaded:
+                self.compact()
+            self._close_journal()
+
+    # =============================
+    # Operations
+    # =============================
+
+    def _apply(self, record):
+        if record["op"] == "register":
+            self._apply_register(record["torrent_metadata"], record["peer_info"])
+        elif record["op"] == "leecher":
+            self._apply_leecher(record["info_hash"], record["peer_info"])
+        elif record["op"] == "complete":
+            self._apply_leecher_done(record["info_hash"], record["peer_info"], completed=True)
+        elif record["op"] == "stopped":
+            self._apply_leecher_done(record["info_hash"], record["peer_info"], completed=False)
+
+    @staticmethod
+    def _encode(torrent) -> bytes:
+        return json.dumps(torrent).encode()
+
+    def _publish(self, record):
+        """
+        Replaces the encoding readers see of the entry the record changed.
+        """
+        if record["op"] == "register":
+            info_hash = record["torrent_metadata"]["info_hash"]
+        else:
+            info_hash = record["info_hash"]
+        torrent = self.torrents.get(info_hash)
+        if torrent is not None:
+            self._encoded[info_hash] = self._encode(torrent)
+
+    @staticmethod
+    def _peer_entry(peer_info):
+        return {
+            "ip": peer_info["ip"],
+            "port": peer_info["port"],
+            "peer_id": peer_info["peer_id"]
+        }
+
+    def _apply_register(self, torrent_metadata, peer_info):
+        peer_entry = self._peer_entry(peer_info)
+
+        existing_torrent = self.torrents.get(torrent_metadata["info_hash"])
+
+        if existing_torrent:
+            if peer_entry not in existing_torrent["peers"]:
+                existing_torrent["peers"].append(peer_entry)
+                existing_torrent["seeders"] += 1
+        else:
+            self.torrents[torrent_metadata["info_hash"]] = {
+                "info_hash": torrent_metadata["info_hash"],
+                "name": torrent_metadata["name"],
+                "size": torrent_metadata["size"],
+                "piece_size": torrent_metadata["piece_size"],
+                "pieces": torrent_metadata["pieces"],
+                "seeders": 1,
+                "leechers": 0,
+                "peers": [peer_entry]
+            }
+            # Optional Merkle metadata, per-block hashes for the downloaders
+            for key in ("block_hashes", "merkle_root"):
+                if torrent_metadata.get(key):
+                    self.torrents[torrent_metadata["info_hash"]][key] = torrent_metadata[key]
+
+    def _apply_leecher(self, info_hash, peer_info):
+        torrent = self.torrents.get(info_hash)
+        if torrent is None:
+            return
+
+        peer_entry = self._peer_entry(peer_info)
+        if peer_entry not in torrent["peers"]:
+            torrent["peers"].append(peer_entry)
+            torrent.setdefault("leecher_peers", []).append(peer_entry)
+            torrent["leechers"] += 1
+
+    def _apply_leecher_done(self, info_hash, peer_info, completed):
+        torrent = self.torrents.get(info_hash)
+        if torrent is None:
+            return
+
+        peer_entry = self._peer_entry(peer_info)
+        leecher_peers = torrent.get("leecher_peers", [])
+        if peer_entry not in leecher_peers:
+            return
+
+        leecher_peers.remove(peer_entry)
+        torrent["leechers"] -= 1
+        if completed:
+            # Keeps serving the whole file
+            torrent["seeders"] += 1
+        else:
+            torrent["peers"].remove(peer_entry)
+
+    def register(self, torrent_metadata, peer_info):
+        """
+        Registers a torrent and the peer that seeds it.
+
+        Args:
+            torrent_metadata (dict): Metadata of the torrent to be registered.
+            peer_info (dict): Information about the client registering the torrent.
+        Returns:
+            None
+        """
+        with self.lock:
+            self._ensure_loaded()
+            self._commit({
+                "op": "register",
+                "torrent_metadata": torrent_metadata,
+                "peer_info": peer_info
+            })
+
+    def register_leecher(self, info_hash, peer_info) -> bool:
+        """
+        Adds a peer that is downloading a torrent to its peer list, so other
+        downloaders fetch the pieces it already has.
+
+        Args:
+            info_hash (str): ID of the torrent.
+            peer_info (dict): Information about the downloading client.
+        Returns:
+            bool: False if the torrent is not registered.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            if info_hash not in self.torrents:
+                return False
+            self._commit({
+                "op": "leecher",
+                "info_hash": info_hash,
+                "peer_info": peer_info
+            })
+            return True
+
+    def leecher_done(self, info_hash, peer_info, completed) -> bool:
+        """
+        Ends the download of a leecher: a completed download makes it a
+        seeder, a stopped one takes it out of the peer list.
+
+        Args:
+            info_hash (str): ID of the torrent.
+            peer_info (dict): Information about the downloading client.
+            completed (bool): Whether the client has the whole file.
+        Returns:
+            bool: False if the torrent is not registered.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            if info_hash not in self.torrents:
+                return False
+            self._commit({
+                "op": "complete" if completed else "stopped",
+                "info_hash": info_hash,
+                "peer_info": peer_info
+            })
+            return True
+
+    def get(self, info_hash) -> Optional[dict]:
+        """
+        Returns the entry of a torrent or None if it is not registered.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            return self.torrents.get(info_hash)
+
+    def get_encoded(self, info_hash) -> Optional[bytes]:
+        """
+        Returns the JSON encoding of a torrent entry, None if it is not
+        registered. Doesn't take the lock once the store is loaded.
+        """
+        if not self._loaded:
+            with self.lock:
+                self._ensure_loaded()
+        return self._encoded.get(info_hash)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.torrents)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import socket as socket
@@ -8,7 +9,11 @@ import select
 import hashlib
 import math
 from threading import Timer
+from common.framing import MAX_JSON_FRAME_SIZE, FrameReader, recv_payload
 from common.logs import log_message
+from tracker.async_server import AsyncTrackerServer
+from tracker.connection_pool import ConnectionPool
+from tracker.torrent_store import TorrentStore
 import time
 import random
 
@@ -37,6 +42,7 @@ class Node(object):
         self.predecessor = self.ip_address
         self.successors = [self.ip_address,self.ip_address]  # Sucesores, k=2
         self.stabilizer = None  # Para el proceso periódico de estabilización
+        self.pool = ConnectionPool()  # Conexiones persistentes con los otros nodos
         
         threading.Thread(target=self.fix_fingers, daemon=True).start()  # Start fix fingers thread
         
@@ -57,29 +63,22 @@ class Node(object):
             #print(f"Entro en join con {existing_node_ip}")
             log_message(f"Entro en join con {existing_node_ip}")
             
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((existing_node_ip, self.port))
+            r = self.rpc(existing_node_ip, {"type": "find_successor", "data": self.id})
             #print(f"Conectado a {existing_node_ip}")
             log_message(f"Conectado a {existing_node_ip}")
             
-            r = self.send_message(s, {"type": "find_successor", "data": self.id})
-            
             self.successors[0] = r["successor"]
             self.finger_table[0] = r["successor"]
             # self.predecessor = None
             
-            s2 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s2.connect((self.successors[0], self.port))
-            r = self.send_message(s2, {"type": "get_predecessor"})
+            r = self.rpc(self.successors[0], {"type": "get_predecessor"})
             self.predecessor = r["predecessor"]
             
-            self.send_message(s2, {"type": "notify_p", "data": self.ip_address})
+            self.rpc(self.successors[0], {"type": "notify_p", "data": self.ip_address})
             #print(f"Enviado notify a {self.successors[0]}")
             log_message(f"Enviado notify a {self.successors[0]}")
             
-            s3 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s3.connect((self.predecessor, self.port))
-            self.send_message(s3, {"type": "notify_s", "data": self.ip_address})
+            self.rpc(self.predecessor, {"type": "notify_s", "data": self.ip_address})
             #print(f"Enviado notify a {self.predecessor}")
             log_message(f"Enviado notify a {self.predecessor}")
             
@@ -126,9 +125,7 @@ class Node(object):
         if node_p == self.ip_address:
             return self.successors[0]
         
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((node_p, self.port))
-        r = self.send_message(s, {"type": "get_successors"})
+        r = self.rpc(node_p, {"type": "get_successors"})
         return r["successors"][0]
     
         # if self.ip_address == self.successors[0]:  # Caso de 1 solo nodo
@@ -173,10 +170,7 @@ class Node(object):
             if closest == self.ip_address:
                 return self.ip_address
             
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((closest, self.port))
-            
-            r = self.send_message(s, {"type": "find_predecessor", "data": key_id})
+            r = self.rpc(closest, {"type": "find_predecessor", "data": key_id})
             
             return r["predecessor"]
 
@@ -240,10 +234,8 @@ class Node(object):
 
         # Obtener predecesor del sucesor
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((successor_ip, self.port))
-                response = self.send_message(s, {"type": "get_predecessor"})
-                predecessor_of_successor = response.get("predecessor", None)
+            response = self.rpc(successor_ip, {"type": "get_predecessor"})
+            predecessor_of_successor = response.get("predecessor", None)
         except Exception as e:
             #print(f"Error al contactar al sucesor {successor_ip}: {e}")
             log_message(f"Error al contactar al sucesor {successor_ip}: {e}")
@@ -258,23 +250,19 @@ class Node(object):
 
         # Notificar al sucesor sobre nuestra existencia
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((self.successors[0], self.port))
-                self.send_message(s, {"type": "notify_p", "data": self.ip_address})
+            self.rpc(self.successors[0], {"type": "notify_p", "data": self.ip_address})
         except Exception as e:
             #print(f"Error al notificar al sucesor {self.successors[0]}: {e}")
             log_message(f"Error al notificar al sucesor {self.successors[0]}: {e}")
 
         # Actualizar lista de sucesores con los del sucesor (k=2)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((self.successors[0], self.port))
-                response = self.send_message(s, {"type": "get_successors"})
-                new_successors = response.get("successors", [])
-                if new_successors:
-                    self.successors = [self.successors[0]] + new_successors[:1]
-                else:
-                    self.successors = [self.successors[0]]
+            response = self.rpc(self.successors[0], {"type": "get_successors"})
+            new_successors = response.get("successors", [])
+            if new_successors:
+                self.successors = [self.successors[0]] + new_successors[:1]
+            else:
+                self.successors = [self.successors[0]]
         except Exception as e:
             #print(f"Error al obtener sucesores de {self.successors[0]}: {e}")
             log_message(f"Error al obtener sucesores de {self.successors[0]}: {e}")
@@ -284,14 +272,12 @@ class Node(object):
         for i in range(1, self.m + 1):
             predecessor_ip = self.find_predecessor((self.id - 2**(i-1)) % 2**self.m)
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((predecessor_ip, self.port))
-                    self.send_message(s, {
-                        "type": "update_finger_table",
-                        "node_ip": self.ip_address,
-                        "index": i,
-                        "origin": self.ip_address
-                    })
+                self.rpc(predecessor_ip, {
+                    "type": "update_finger_table",
+                    "node_ip": self.ip_address,
+                    "index": i,
+                    "origin": self.ip_address
+                })
             except Exception as e:
                 #print(f"Error al actualizar finger table de {predecessor_ip}: {e}")
                 log_message(f"Error al actualizar finger table de {predecessor_ip}: {e}")
@@ -316,14 +302,12 @@ class Node(object):
                 try:
                     #print(f"Updating finger table of {self.predecessor}")
                     log_message(f"Updating finger table of {self.predecessor}")
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.connect((self.predecessor, self.port))
-                        self.send_message(s, {
-                            "type": "update_finger_table",
-                            "node_ip": node_ip,
-                            "index": i,
-                            "origin": self.ip_address
-                        })
+                    self.rpc(self.predecessor, {
+                        "type": "update_finger_table",
+                        "node_ip": node_ip,
+                        "index": i,
+                        "origin": self.ip_address
+                    })
                 except Exception as e:
                     #print(f"Error al actualizar finger table del predecesor: {e}")
                     log_message(f"Error al actualizar finger table del predecesor: {e}")
@@ -366,15 +350,28 @@ class Node(object):
             log_message(f"\nMessage sent: {message}")
         s.sendall(header + message)
         
-        header = s.recv(4)
-        data_len = struct.unpack("!I", header)[0]
-        
-        data = s.recv(data_len)
+        try:
+            data = recv_payload(s, MAX_JSON_FRAME_SIZE)
+        except ConnectionError:
+            raise ConnectionError("Connection closed by the remote node")
         
         with self.print_lock:
             #print(f"\nMessage received: {data}")
-            log_message(f"\nMessage received: {data}")
+            log_message(f"\nMessage received: {bytes(data)}")
         return json.loads(data.decode())
+
+    def rpc(self, node_ip, message):
+        """
+        Sends a message to another node of the ring over a pooled connection.
+
+        Args:
+            node_ip (str): The IP address of the destination node.
+            message (dict): The message to send.
+        Returns:
+            dict: The response received from the node.
+        """
+        return self.pool.call((node_ip, self.port), lambda s: self.send_message(s, message))
+
     def hash_function(self, key, m):
         # Hash SHA-1 truncado a m bits (ej: m=6 → 0-63)
         hash_bytes = hashlib.sha1(key.encode()).digest()
@@ -386,6 +383,7 @@ class Tracker(Node):
     def __init__(self, ip_address= None, m=6):
         ip_address = self.get_ip()
         super().__init__(ip_address, m)
+        self.store = TorrentStore(self.TRACKER_DIRECTORY, self.TRACKER_FILE_NAME)
     
     # TRACKER_DIRECTORY = "src/tracker/database"  make dinamic
     TRACKER_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database")
@@ -424,8 +422,8 @@ class Tracker(Node):
 
     def update_tracker(self, torrent_metadata, peer_info):
         """
-        Updates the tracker's JSON file with the metadata of a new torrent
-        and the information of the client (peer).
+        Registers the metadata of a new torrent and the information of the
+        client (peer) in the torrent store.
 
         Args:
             torrent_metadata (dict): Metadata of the torrent to be registered.
@@ -436,212 +434,211 @@ class Tracker(Node):
         #print("Executing update_tracker...")
         log_message("Executing update_tracker...")
 
-        file_path = os.path.join(self.TRACKER_DIRECTORY, self.TRACKER_FILE_NAME)
-
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"The tracker file '{file_path}' does not exist.")
-
-        # Load existing tracker data
-        with open(file_path, 'r') as file:
-            tracker_data = json.load(file)
-
-        # Check if the torrent already exists in the tracker
-        existing_torrent = next((torrent for torrent in tracker_data["torrents"]
-                                if torrent["info_hash"] == torrent_metadata["info_hash"]), None)
-
-        if existing_torrent:
-            peer_entry = {
-                "ip": peer_info["ip"],
-                "port": peer_info["port"],
-                "peer_id": peer_info["peer_id"]
-            }
-            if peer_entry not in existing_torrent["peers"]:
-                existing_torrent["peers"].append(peer_entry)
-                existing_torrent["seeders"] += 1
-        else:
-            # Create a new torrent entry if it does not exist
-            new_torrent = {
-                "info_hash": torrent_metadata["info_hash"],
-                "name": torrent_metadata["name"],
-                "size": torrent_metadata["size"],
-                "piece_size": torrent_metadata["piece_size"],
-                "pieces": torrent_metadata["pieces"],
-                "seeders": 1,
-                "leechers": 0,
-                "peers": [
-                    {
-                        "ip": peer_info["ip"],
-                        "port": peer_info["port"],
-                        "peer_id": peer_info["peer_id"]
-                    }
-                ]
-            }
-            tracker_data["torrents"].append(new_torrent)
+        self.store.register(torrent_metadata, peer_info)
 
-        with open(file_path, 'w') as file:
-            json.dump(tracker_data, file, indent=4)
         #print("Tracker successfully updated.")
         log_message("Tracker successfully updated.")
 
     def get_torrent_info(self, info_hash):
         """
-        Retrieves the information of a torrent from the tracker's JSON file.
+        Retrieves the information of a torrent from the torrent store.
 
         Args:
             info_hash (str): ID of the torrent to retrieve.
         Returns:
-            dict: Information of the torrent.
+            bytes: Information of the torrent, framed with its length header.
         """
-        file_path = os.path.join(self.TRACKER_DIRECTORY, self.TRACKER_FILE_NAME)
-
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"The tracker file '{file_path}' does not exist.")
-
-        with open(file_path, 'r') as file:
-            tracker_data = json.load(file)
-
-        torrent_info = next((torrent for torrent in tracker_data["torrents"]
-                            if torrent["info_hash"] == info_hash), None)
+        message = self.store.get_encoded(info_hash)
 
-        if not torrent_info:
+        if message is None:
             raise ValueError(f"The torrent was not found in the tracker.")
         
-        message = json.dumps(torrent_info).encode()
-        
         header = struct.pack("!I", len(message))
         
         message = header + message
         
         return message
         
+    def process_message(self, message):
+        """
+        Executes a request received from a client or another node and builds
+        the response.
+
+        Args:
+            message (dict): The decoded request.
+        Returns:
+            bytes: The response, framed with its length header.
+        """
+        #print("Received message:")
+        log_message("Received message:")
+        #print(f"{message}")
+        log_message(f"{message}")
+
+        if message["type"] == "register_torrent":
+            torrent_metadata = message["torrent_metadata"]
+            peer_info = message["peer_info"]
+            self.update_tracker(torrent_metadata, peer_info)
+            response_j = "Torrent successfully registered.".encode()
+            
+            return struct.pack("!I", len(response_j)) + response_j
+
+        elif message["type"] == "announce_leecher":
+            if self.store.register_leecher(message["info_hash"], message["peer_info"]):
+                response_j = "Leecher successfully registered.".encode()
+            else:
+                response_j = "ERROR: Torrent not found in the tracker.".encode()
+            return struct.pack("!I", len(response_j)) + response_j
+
+        elif message["type"] in ("announce_complete", "announce_stopped"):
+            completed = message["type"] == "announce_complete"
+            if self.store.leecher_done(message["info_hash"], message["peer_info"], completed):
+                response_j = "Leecher successfully updated.".encode()
+            else:
+                response_j = "ERROR: Torrent not found in the tracker.".encode()
+            return struct.pack("!I", len(response_j)) + response_j
+
+        elif message["type"] == "get_torrent":
+            info_hash = message["info_hash"]
+            try:
+                return self.get_torrent_info(info_hash)
+            except Exception as e:
+                #print(f"Error getting torrent info: {e}")
+                log_message(f"Error getting torrent info: {e}")
+                response_j = f"ERROR: Torrent not found in the tracker.".encode()
+                return struct.pack("!I", len(response_j)) + response_j
+
+        elif message["type"] == "find_successor":
+            key_id = message["data"]
+            successor = self.find_successor(key_id)
+            response = {"successor": successor}
+        
+        elif message["type"] == "find_predecessor":
+            key_id = message["data"]
+            predecessor = self.find_predecessor(key_id)
+            response = {"predecessor": predecessor}
+            
+        elif message["type"] == "notify_p":
+            node_ip = message["data"]
+            self.notify_p(node_ip)
+            response = {"status": "ok"}
+        
+        elif message["type"] == "notify_s":
+            node_ip = message["data"]
+            self.notify_s(node_ip)
+            response = {"status": "ok"}
+            
+        elif message["type"] == "get_predecessor":
+            response = {"predecessor": self.predecessor}
+
+        elif message["type"] == "get_successors":
+            response = {"successors": self.successors}
+
+        elif message["type"] == "update_finger_table":
+            node_ip = message["node_ip"]
+            i = message["index"]
+            origin = message.get("origin", None)
+            self.update_finger_table(node_ip, i, origin=str(origin))
+            response = {"status": "ok"}
+            
+        else:
+            #print("Invalid message type.")
+            log_message("Invalid message type.")
+            return b"Invalid message type."
+
+        #print(f"Sending response: {response}")
+        log_message(f"Sending response: {response}")
+        response_j = json.dumps(response).encode()
+        return struct.pack("!I", len(response_j)) + response_j
+
     def handle_client(self, client_socket):
         # !Volver a poner el try
         # try:
+            reader = FrameReader(client_socket, max_frame_size=MAX_JSON_FRAME_SIZE)
             while True:
-                # Recibir el encabezado
-                header = client_socket.recv(4)
-                if not header:
+                # Recibir el mensaje completo, aunque llegue en varios segmentos
+                try:
+                    data = reader.read_payload()
+                except ValueError as e:
+                    log_message(f"Closing connection with a client: {e}")
+                    client_socket.close()
+                    break
+                if data is None:
                     break
-                data_len = struct.unpack("!I", header)[0]
-                data = client_socket.recv(data_len)
 
                 # Procesar el mensaje
-                message = json.loads(data.decode())
-                #print("Received message:")
-                log_message("Received message:")
-                #print(f"{message}")
-                log_message(f"{message}")
-
-                if message["type"] == "register_torrent":
-                    torrent_metadata = message["torrent_metadata"]
-                    peer_info = message["peer_info"]
-                    self.update_tracker(torrent_metadata, peer_info)
-                    message = "Torrent successfully registered.".encode()
-                    header = struct.pack("!I", len(message))
-                    
-                    client_socket.sendall(header + message)
-
-                elif message["type"] == "get_torrent":
-                    info_hash = message["info_hash"]
-                    try:
-                        torrent_info = self.get_torrent_info(info_hash)
-                        client_socket.sendall(torrent_info)
-                    except Exception as e:
-                        #print(f"Error getting torrent info: {e}")
-                        log_message(f"Error getting torrent info: {e}")
-                        message = f"ERROR: Torrent not found in the tracker.".encode()
-                        header = struct.pack("!I", len(message))
-                        client_socket.sendall(header + message)
-                elif message["type"] == "find_successor":
-                    key_id = message["data"]
-                    successor = self.find_successor(key_id)
-                    response = {"successor": successor}
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    message = header + response_j
-                    client_socket.sendall(message)
-                
-                elif message["type"] == "find_predecessor":
-                    key_id = message["data"]
-                    predecessor = self.find_predecessor(key_id)
-                    response = {"predecessor": predecessor}
-                    response_j = json.dumps(response).encode()
-                    
-                    header = struct.pack("!I", len(response_j))
-
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    message = header + response_j
-                    client_socket.sendall(message)
-                    
-                elif message["type"] == "notify_p":
-                    node_ip = message["data"]
-                    self.notify_p(node_ip)
-                    response = {"status": "ok"}
-                    
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-                    
-                    client_socket.sendall(header + response_j)
-                
-                elif message["type"] == "notify_s":
-                    node_ip = message["data"]
-                    self.notify_s(node_ip)
-                    response = {"status": "ok"}
-                    
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-                    client_socket.sendall(header + response_j)
-                    
-                elif message["type"] == "get_predecessor":
-                    response = {"predecessor": self.predecessor}
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-                    client_socket.sendall(header + response_j)
-
-                elif message["type"] == "get_successors":
-                    response = {"successors": self.successors}
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-                    client_socket.sendall(header + response_j)
-
-                elif message["type"] == "update_finger_table":
-                    node_ip = message["node_ip"]
-                    i = message["index"]
-                    origin = message.get("origin", None)
-                    self.update_finger_table(node_ip, i, origin=str(origin))
-                    response = {"status": "ok"}
-                    
-                    response_j = json.dumps(response).encode()
-                    header = struct.pack("!I", len(response_j))
-                    client_socket.sendall(header + response_j)
-                    #print(f"Sending response: {response}")
-                    log_message(f"Sending response: {response}")
-                    
-                else:
-                    #print("Invalid message type.")
-                    log_message("Invalid message type.")
-                    client_socket.sendall(b"Invalid message type.")
+                message = json.loads(str(data, "utf-8"))
+                client_socket.sendall(self.process_message(message))
         # except Exception as e:
         #     #print(f"Error processing client request: {e}")
         # finally:
         #     #print("Closing connection with: ", client_socket.getpeername())
         #     client_socket.close()
 
-    def start_tracker(self, host=None, port=None):
+    def handle_command(self, user_input):
+        """
+        Executes an admin command typed in the tracker console.
+
+        Args:
+            user_input (str): The line read from stdin.
+        Returns:
+            bool: False if the tracker must stop, True otherwise.
+        """
+        inputs = user_input.split()
+        if not inputs:
+            return True
+        
+        if user_input.strip().lower() == "q":  # Exit on 'q'
+            #print("Exiting tracker server...")
+            log_message("Exiting tracker server...")
+            return False
+        
+        if user_input.strip().lower() == "#print_table":
+            #print(f"Finger table of the node with id {self.id}:")
+            log_message(f"Finger table of the node with id {self.id}:")
+            for i, node in enumerate(self.finger_table):
+                # print(f"{i+1}: {node}")
+                log_message(f"{i+1}: {node}")
+
+        
+        if user_input.strip().lower() == "#print_predecessor":
+            #print(f"Predecessor: {self.predecessor}")
+            log_message(f"Predecessor: {self.predecessor}")
+            
+        if user_input.strip().lower() == "#print_successors":
+            #print(f"Successors: {self.successors}")
+            log_message(f"Successors: {self.successors}")
+            
+        if inputs[0].strip().lower() == "join":
+            if len(inputs) > 1:
+                existing_node_ip = inputs[1]
+                self.join(existing_node_ip)
+            else:
+                self.join()
+            
+        if user_input.strip().lower() == "help":
+            #print("Commands:")
+            log_message("Commands:")
+            #print("q: Exit the tracker server.")
+            log_message("q: Exit the tracker server.")
+            #print("#print_table: #print the finger table of the node.")
+            log_message("#print_table: #print the finger table of the node.")
+            #print("#print_predecessor: #print the predecessor of the node.")
+            log_message("#print_predecessor: #print the predecessor of the node.")
+            #print("#print_successors: #print the successors of the node.")
+            log_message("#print_successors: #print the successors of the node.")
+
+        return True
+
+    def shutdown(self):
+        """
+        Releases the resources held by the tracker.
+        """
+        if self.server_socket:
+            self.server_socket.close()
+        self.store.close()
+        self.pool.close()
+
+    def start_tracker(self, host=None, port=None, server_mode="asyncio", backlog=128, max_connections=1024):
         """
         Starts the tracker server. Receives messages from clients and sends
         The message format (JSON) possibles are:
@@ -651,6 +648,12 @@ class Tracker(Node):
         Args:
             host (str): IP address to bind the server to (default is 0.0.0.0.)
             port (int): Port to bind the server to (default is 8000)
+            server_mode (str): "asyncio" serves every connection on one event
+                loop, "threaded" starts a thread per connection.
+            backlog (int): Size of the listen backlog.
+            max_connections (int): Maximum number of connections served at
+                once in asyncio mode, the rest wait in the listen backlog
+                (they aren't accepted until a connection ends).
         Returns:
             None
         """
@@ -661,10 +664,20 @@ class Tracker(Node):
             port = self.port
         
         self.create_initial_tracker()
-        
+        self.store.recover()
+
+        if server_mode == "asyncio":
+            server = AsyncTrackerServer(self, backlog=backlog, max_connections=max_connections)
+            asyncio.run(server.serve(host, port))
+        elif server_mode == "threaded":
+            self._serve_threaded(host, port, backlog)
+        else:
+            raise ValueError(f"Unknown server mode: {server_mode}")
+
+    def _serve_threaded(self, host, port, backlog):
         self.server_socket =  socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.bind((host, port))
-        self.server_socket.listen(5)
+        self.server_socket.listen(backlog)
         
         #print(f"Tracker server started at {host}:{port}")
         log_message(f"Tracker server started at {host}:{port}")
@@ -674,49 +687,9 @@ class Tracker(Node):
             readable, _, _ = select.select([self.server_socket, sys.stdin], [], [], 0.1)
             for r in readable:
                 if r is sys.stdin:
-                    user_input = input()
-                    inputs = user_input.split()
-                    
-                    if user_input.strip().lower() == "q":  # Exit on 'q'
-                        #print("Exiting tracker server...")
-                        log_message("Exiting tracker server...")
-                        self.server_socket.close()
+                    if not self.handle_command(input()):
+                        self.shutdown()
                         return
-                    
-                    if user_input.strip().lower() == "#print_table":
-                        #print(f"Finger table of the node with id {self.id}:")
-                        log_message(f"Finger table of the node with id {self.id}:")
-                        for i, node in enumerate(self.finger_table):
-                            # print(f"{i+1}: {node}")
-                            log_message(f"{i+1}: {node}")
-
-                    
-                    if user_input.strip().lower() == "#print_predecessor":
-                        #print(f"Predecessor: {self.predecessor}")
-                        log_message(f"Predecessor: {self.predecessor}")
-                        
-                    if user_input.strip().lower() == "#print_successors":
-                        #print(f"Successors: {self.successors}")
-                        log_message(f"Successors: {self.successors}")
-                        
-                    if inputs[0].strip().lower() == "join":
-                        if len(inputs) > 1:
-                            existing_node_ip = inputs[1]
-                            self.join(existing_node_ip)
-                        else:
-                            self.join()
-                        
-                    if user_input.strip().lower() == "help":
-                        #print("Commands:")
-                        log_message("Commands:")
-                        #print("q: Exit the tracker server.")
-                        log_message("q: Exit the tracker server.")
-                        #print("#print_table: #print the finger table of the node.")
-                        log_message("#print_table: #print the finger table of the node.")
-                        #print("#print_predecessor: #print the predecessor of the node.")
-                        log_message("#print_predecessor: #print the predecessor of the node.")
-                        #print("#print_successors: #print the successors of the node.")
-                        log_message("#print_successors: #print the successors of the node.")
 
                 if r is self.server_socket:
                     client_socket, addr = self.server_socket.accept()
@@ -728,4 +701,4 @@ class Tracker(Node):
                         client_thread.start()
                     except Exception as e:
                         #print(f"Error handling client {addr}: {e}")
-                        log_message(f"Error handling client {addr}: {e}")
\ No newline at end of file
+                        log_message(f"Error handling client {addr}: {e}")